@@ -4,27 +4,152 @@ from PIL import Image
 import io
 import os
 import sys
+import time
+import numpy as np
+
+from detect import draw_detections
+from vehicle_detection import models
+from vehicle_detection.backends import backend_path
+from vehicle_detection.batch_jobs import (BatchJob, aggregate_counts, annotated_zip, decode_upload,
+                                          detection_rows, expand_uploads, rows_to_csv, rows_to_json)
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.detections import Detections
+from vehicle_detection.metrics import METRICS, enable as enable_metrics, span
+from vehicle_detection.result_cache import ResultCache, content_key
+from vehicle_detection.server import ModelClient
 
 # Add YOLOv5 to path
 sys.path.append('yolov5')
 
+# Display names from the class registry (data/dataset.yaml or $VEHICLE_CLASSES)
+CLASS_NAMES = {i: name[:1].upper() + name[1:] for i, name in enumerate(load_class_map().names)}
+MODEL_PATH = 'yolov5/runs/train/exp33/weights/best.pt'
+# pytorch, torchscript, onnx or int8 (see vehicle_detection/backends.py)
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'pytorch')
+# Detections are cached at this floor so any slider value is a filter over the cache
+RAW_CONF_THRES = 0.001
+BATCH_SIZE = 8
+
 # Load the model
 @st.cache_resource
 def load_model():
-    model_path = 'yolov5/runs/train/exp33/weights/best.pt'
-    if not os.path.exists(model_path):
-        st.error("Model file not found. Please complete the training process first.")
-        st.info("The model file should be located at: " + model_path)
-        return None
-    
+    # Use a running serve.py instead of loading weights into this process
+    server_url = os.environ.get('MODEL_SERVER_URL')
+    if server_url:
+        try:
+            return ModelClient(server_url)
+        except Exception as e:
+            st.error(f"Error connecting to model server at {server_url}: {str(e)}")
+            return None
+
     try:
-        model = torch.hub.load('yolov5', 'custom', path=model_path, source='local')
+        model_path = str(backend_path(MODEL_PATH, MODEL_BACKEND))
+        if not os.path.exists(model_path):
+            st.error("Model file not found. Please complete the training process first.")
+            st.info("The model file should be located at: " + model_path)
+            return None
+        model = models.load_model(MODEL_PATH, repo='yolov5', source='local', backend=MODEL_BACKEND)
         return model
     except Exception as e:
         st.error(f"Error loading model: {str(e)}")
         return None
 
+# Raw detections per uploaded image, shared across reruns and sessions
+@st.cache_resource
+def get_result_cache():
+    return ResultCache(int(os.environ.get('RESULT_CACHE_MB', 256)) * 1024 ** 2)
+
+def detect(image_bytes, cache_key):
+    """Run the model once and cache the decoded RGB image with its pre-threshold detections"""
+    model = load_model()
+    if model is None:
+        return None
+    with span('decode'):
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    model.conf = RAW_CONF_THRES
+    with span('inference'):
+        results = model(image)
+    with span('postprocess'):
+        entry = (np.asarray(image), Detections.from_pred(results.xyxy[0]))
+    get_result_cache().put(cache_key, entry)
+    return entry
+
+def batch_mode(conf_threshold):
+    """Many images or a zip, detected on a background worker and shown as results arrive"""
+    files = st.file_uploader("Choose images or a zip archive...", type=["jpg", "jpeg", "png", "zip"],
+                             accept_multiple_files=True)
+
+    if st.button("Detect Vehicles") and files:
+        model = load_model()
+        if model is not None:
+            uploads = expand_uploads(files)
+            model.conf = RAW_CONF_THRES
+            infer = lambda imgs: [Detections.from_pred(pred) for pred in model(imgs).xyxy]
+            st.session_state['batch_job'] = BatchJob(uploads, infer, batch_size=BATCH_SIZE).start()
+            st.session_state.pop('batch_zip', None)
+
+    job = st.session_state.get('batch_job')
+    if job is None:
+        return
+
+    # Poll the job; an interaction reruns the script but the job keeps going
+    classes = list(CLASS_NAMES)
+    progress = st.progress(0.0)
+    summary = st.empty()
+    preview = st.empty()
+    while True:
+        finished = job.done
+        results = job.results()
+        progress.progress(job.progress, text=f"Processed {len(results)} of {len(job.uploads)} images")
+        counts = aggregate_counts(results, conf_threshold, classes)
+        summary.write("  \n".join([f"Total {CLASS_NAMES[c]}s: {counts[c]}" for c in classes] +
+                                  [f"Total Vehicles: {counts.sum()}"]))
+        if results:
+            upload, detections = results[-1]
+            img = decode_upload(upload)
+            if img is not None:
+                preview.image(draw_detections(img, detections.filter(conf_threshold, classes), CLASS_NAMES),
+                              caption=upload.name, use_column_width=True)
+        if finished:
+            break
+        time.sleep(0.5)
+
+    if job.error is not None:
+        st.error(f"Error during detection: {str(job.error)}")
+    if not results:
+        return
+
+    st.write("Detections per image:")
+    st.dataframe([{'image': upload.name,
+                   **{CLASS_NAMES[c]: int(n) for c, n in
+                      zip(classes, detections.filter(conf_threshold, classes).class_counts(len(classes)))}}
+                  for upload, detections in results])
+
+    rows = detection_rows(results, conf_threshold, CLASS_NAMES)
+    st.download_button("Download detections (CSV)", rows_to_csv(rows), "detections.csv", "text/csv")
+    st.download_button("Download detections (JSON)", rows_to_json(rows), "detections.json", "application/json")
+    # Annotating every image is the slow part, so it is redone only when the threshold changes
+    cached = st.session_state.get('batch_zip')
+    if cached is None or cached[0] != conf_threshold:
+        cached = (conf_threshold, annotated_zip(results, conf_threshold, CLASS_NAMES, draw_detections))
+        st.session_state['batch_zip'] = cached
+    st.download_button("Download annotated images (zip)", cached[1], "annotated.zip", "application/zip")
+
+def show_timings():
+    """Latency percentiles of the spans recorded by this server process"""
+    with st.sidebar.expander("Timings"):
+        summary = METRICS.summary()
+        if not summary:
+            st.write("Nothing measured yet.")
+            return
+        st.dataframe([{'span': name, 'count': s['count'], 'p50 ms': round(s['p50_ms'], 1),
+                       'p95 ms': round(s['p95_ms'], 1), 'p99 ms': round(s['p99_ms'], 1)}
+                      for name, s in summary.items()])
+        st.download_button("Prometheus metrics", METRICS.to_prometheus(), "metrics.prom", "text/plain")
+
 def main():
+    # Span timings are process-wide and cheap, so they are always collected
+    enable_metrics()
     st.title("Vehicle Detection System")
     st.write("Upload an image to detect vehicles")
 
@@ -32,68 +157,55 @@ def main():
     conf_threshold = st.slider("Confidence Threshold", 0.0, 1.0, 0.25, 0.05,
                              help="Adjust the minimum confidence threshold for detections")
 
+    show_timings()
+    if st.radio("Mode", ["Single image", "Batch"], horizontal=True) == "Batch":
+        batch_mode(conf_threshold)
+        return
+
     # File uploader
     uploaded_file = st.file_uploader("Choose an image...", type=["jpg", "jpeg", "png"])
 
     if uploaded_file is not None:
+        image_bytes = uploaded_file.getvalue()
+        cache_key = content_key(image_bytes, os.environ.get('MODEL_SERVER_URL') or MODEL_PATH, MODEL_BACKEND)
+        entry = get_result_cache().get(cache_key)
+
         # Display the uploaded image
-        image = Image.open(uploaded_file)
+        image = entry[0] if entry is not None else Image.open(uploaded_file)
         st.image(image, caption="Uploaded Image", use_column_width=True)
 
-        # Add a button to trigger detection
-        if st.button("Detect Vehicles"):
-            # Load model
-            model = load_model()
-            
-            if model is not None:
-                try:
-                    # Set confidence threshold
-                    model.conf = conf_threshold
-                    
-                    # Perform detection
-                    results = model(image)
-                    
-                    # Display results
-                    st.image(results.render()[0], caption="Detection Results", use_column_width=True)
-                    
-                    # Display detection information
-                    st.write("Detection Results:")
-                    
-                    # Count detections by class
-                    car_count = 0
-                    truck_count = 0
-                    # Remove other_vehicle_count as we only have car and truck classes now
-                    # other_vehicle_count = 0
-
-                    for det in results.xyxy[0]:  # xyxy format
-                        x1, y1, x2, y2, conf, cls = det.tolist()
-                        class_id = int(cls)
-                        # Ensure class_id is 0 or 1 based on our 2 classes
-                        if class_id == 0:
-                            class_name = "Car"
-                            car_count += 1
-                            st.write(f"Detected {class_name} with confidence: {conf:.2f}")
-                        elif class_id == 1:
-                            class_name = "Truck"
-                            truck_count += 1
-                            st.write(f"Detected {class_name} with confidence: {conf:.2f}")
-                        # Removed the else block for 'Other Vehicle'
-                        # else:
-                        #     class_name = "Other Vehicle"
-                        #     other_vehicle_count += 1
-                        #     st.write(f"Detected {class_name} with confidence: {conf:.2f}")
-
-                    # Display summary
-                    st.write("Summary:")
-                    st.write(f"Total Cars: {car_count}")
-                    st.write(f"Total Trucks: {truck_count}")
-                    # Removed the display of other_vehicle_count
-                    # st.write(f"Total Other Vehicles: {other_vehicle_count}")
-                    # Adjusted the total count to only include car and truck
-                    st.write(f"Total Vehicles: {car_count + truck_count}")
-                    
-                except Exception as e:
-                    st.error(f"Error during detection: {str(e)}")
+        # Add a button to trigger detection; once an image has been detected,
+        # slider changes re-filter the cached detections without running the model
+        if st.button("Detect Vehicles") or entry is not None:
+            try:
+                if entry is None:
+                    entry = detect(image_bytes, cache_key)
+                if entry is None:
+                    return
+                image, raw_detections = entry
+                
+                # Count detections by class in one pass over the whole frame
+                detections = raw_detections.filter(conf_threshold, classes=list(CLASS_NAMES))
+                
+                # Display results
+                st.image(draw_detections(image.copy(), detections, CLASS_NAMES),
+                         caption="Detection Results", use_column_width=True)
+                
+                # Display detection information
+                st.write("Detection Results:")
+                
+                for conf, class_id in zip(detections.confidences.tolist(), detections.class_ids.tolist()):
+                    st.write(f"Detected {CLASS_NAMES[class_id]} with confidence: {conf:.2f}")
+                counts = detections.class_counts(minlength=len(CLASS_NAMES))[:len(CLASS_NAMES)].tolist()
+
+                # Display summary
+                st.write("Summary:")
+                for class_id, count in enumerate(counts):
+                    st.write(f"Total {CLASS_NAMES[class_id]}s: {count}")
+                st.write(f"Total Vehicles: {sum(counts)}")
+                
+            except Exception as e:
+                st.error(f"Error during detection: {str(e)}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
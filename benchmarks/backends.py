@@ -0,0 +1,112 @@
+"""Accuracy vs. speed of the exported inference backends on the validation split.
+
+Every backend runs the same images one at a time (the TorchScript export has a
+fixed batch size of 1) and is scored against the YOLO labels. mAP deltas and
+speedups are relative to the first backend listed, eager PyTorch by default.
+
+    python -m vehicle_detection.backends yolov5/runs/train/exp33/weights/best.pt
+    python -m benchmarks.backends --weights yolov5/runs/train/exp33/weights/best.pt --output backends.json
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from detect import IMG_FORMATS
+from vehicle_detection.backends import BACKENDS
+from vehicle_detection.detections import Detections
+from vehicle_detection.evaluation import evaluate, labels_to_xyxy, read_labels
+from vehicle_detection.models import load_model
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='yolov5/runs/train/exp33/weights/best.pt',
+                        help='Original PyTorch weights; exported files are looked up next to them')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS, help='Backends to compare')
+    parser.add_argument('--images', type=str, default='data/images/val', help='Validation images')
+    parser.add_argument('--labels', type=str, default='data/labels/val', help='Validation labels (YOLO format)')
+    parser.add_argument('--conf-thres', type=float, default=0.001, help='Confidence threshold used for mAP')
+    parser.add_argument('--iou-thres', type=float, default=0.6, help='NMS IoU threshold')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N images')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed images before each backend')
+    parser.add_argument('--repo', type=str, default='ultralytics/yolov5', help='torch.hub repo (or local YOLOv5 dir)')
+    parser.add_argument('--hub-source', type=str, default='github', choices=['github', 'local'],
+                        help='torch.hub source for --repo')
+    parser.add_argument('--output', type=str, default=None, help='Write results JSON here')
+    return parser.parse_args()
+
+
+def run_backend(model, imgs, warmup=3):
+    """Detections per image and per-image inference latencies in seconds"""
+    for img in imgs[:warmup]:
+        model(img)
+    detections, latencies = [], []
+    for img in imgs:
+        start = time.perf_counter()
+        results = model(img)
+        latencies.append(time.perf_counter() - start)
+        detections.append(Detections.from_pred(results.pred[0]))
+    return detections, latencies
+
+
+def main():
+    args = parse_args()
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMG_FORMATS)[:args.limit]
+    if not paths:
+        print(f"Error: no images found in {args.images}")
+        return 1
+
+    # Decode once up front so only the model call is timed; hub models expect RGB arrays
+    imgs = [cv2.cvtColor(cv2.imread(str(p)), cv2.COLOR_BGR2RGB) for p in paths]
+    get_labels = read_labels(args.labels)
+    ground_truth = []
+    for path, img in zip(paths, imgs):
+        classes, boxes = get_labels(path.stem)
+        ground_truth.append((classes, labels_to_xyxy(boxes, img.shape)))
+
+    results = []
+    for backend in args.backends:
+        try:
+            model = load_model(args.weights, args.conf_thres, args.iou_thres, args.repo, args.hub_source, backend)
+        except (FileNotFoundError, ImportError, RuntimeError) as e:
+            print(f"Skipping {backend}: {str(e)}")
+            continue
+        detections, latencies = run_backend(model, imgs, args.warmup)
+        metrics = evaluate((dets, classes, boxes) for dets, (classes, boxes) in zip(detections, ground_truth))
+        ms = np.asarray(latencies) * 1000.0
+        results.append({
+            'backend': backend,
+            'map50': round(metrics['map50'], 4),
+            'map50_95': round(metrics['map'], 4),
+            'ms_per_image': round(float(ms.mean()), 3),
+            'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        })
+
+    if not results:
+        print("No backend could be loaded")
+        return 1
+    reference = results[0]
+    for r in results:
+        r['map50_delta'] = round(r['map50'] - reference['map50'], 4)
+        r['speedup'] = round(reference['ms_per_image'] / r['ms_per_image'], 3)
+
+    print(f"{'backend':<12} {'mAP50':>7} {'delta':>7} {'mAP50-95':>9} {'ms/img':>8} {'p95':>8} {'speedup':>8}")
+    for r in results:
+        print(f"{r['backend']:<12} {r['map50']:>7.4f} {r['map50_delta']:>+7.4f} {r['map50_95']:>9.4f} "
+              f"{r['ms_per_image']:>8.2f} {r['p95_ms']:>8.2f} {r['speedup']:>7.2f}x")
+    print(f"({len(paths)} images from {args.images}; delta and speedup relative to {reference['backend']})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'weights': args.weights, 'images': len(paths), 'results': results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
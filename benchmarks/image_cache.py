@@ -0,0 +1,125 @@
+"""Check that ``detect.py --image-cache`` saves the same detections as an uncached run.
+
+Runs a directory through detect.py's image path twice: once decoding the
+original files, once reading the letterboxed image cache. Each run writes its
+detections to a JSONL sink, and the two files are compared. Sources and
+recorded image sizes must match exactly. Every box must have a box of the same
+class in the other run with all edges within ``--tolerance`` pixels: the
+cached image is resampled, so edges can move by about one letterboxed pixel.
+
+Without ``--source``, frames of the synthetic static camera from
+``benchmarks.motion_gate`` are written in landscape and portrait (so padding
+is added on both axes) and detected by its blob model. Letterboxing does not
+change what that model finds. Models that see the padded image, such as the
+stand-in or YOLOv5 at a different input size, can legitimately differ, so for
+them the mAP50 of the cached run against the uncached one is reported.
+
+    python -m benchmarks.image_cache
+    python -m benchmarks.image_cache --source trafic_data/valid/images --weights best.pt
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from benchmarks.motion_gate import BlobModel, synthetic_frames
+from detect import IMG_FORMATS, from_image_cache, make_save, process_paths
+from vehicle_detection.evaluation import evaluate
+from vehicle_detection.models import load_model
+from vehicle_detection.sinks import JsonlSink, read_detections
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', type=str, default=None, help='Directory of images (default: synthetic)')
+    parser.add_argument('--weights', type=str, default='stand-in', help='Model for --source')
+    parser.add_argument('--img-size', type=int, default=480, help='Letterboxed size of the image cache')
+    parser.add_argument('--images', type=int, default=40, help='Synthetic images to generate')
+    parser.add_argument('--conf-thres', type=float, default=0.25)
+    parser.add_argument('--tolerance', type=float, default=2.0, help='Allowed box edge difference in original pixels')
+    return parser.parse_args()
+
+
+def write_synthetic(image_dir, n):
+    """Half landscape, half portrait frames of the synthetic camera"""
+    for i, frame in enumerate(synthetic_frames(n, 640, 360, seed=0)):
+        if i % 2:
+            frame = np.ascontiguousarray(np.rot90(frame))
+        cv2.imwrite(str(image_dir / f'{i:04d}.png'), frame)
+
+
+def detect_to(path, image_dir, model, args, cached):
+    """detect.py's directory path with ``--no-render --save-detections path``; returns seconds"""
+    run_args = SimpleNamespace(no_render=True, output=str(path.parent), batch_size=1, conf_thres=args.conf_thres,
+                               iou_thres=0.45)
+    img_paths = sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMG_FORMATS)
+    start = time.perf_counter()
+    with JsonlSink(path, model.names) as sink:
+        save, load = make_save(run_args, sink, model.names), None
+        if cached:
+            load, save = from_image_cache(image_dir, args.img_size, save)
+        process_paths(img_paths, model, None, run_args, save, load)
+    return time.perf_counter() - start
+
+
+def box_mismatches(cached, uncached, tolerance):
+    """Images where some box has no same-class box in the other run with edges within ``tolerance``"""
+    bad = []
+    for source, (reference, _) in uncached.items():
+        detections, _ = cached[source]
+        if len(detections) != len(reference):
+            bad.append(source)
+            continue
+        if not len(reference):
+            continue
+        close = np.abs(detections.boxes[:, None, :] - reference.boxes[None, :, :]).max(axis=2) <= tolerance
+        close &= detections.class_ids[:, None] == reference.class_ids[None, :]
+        if not (close.any(axis=1).all() and close.any(axis=0).all()):
+            bad.append(source)
+    return bad
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        if args.source:
+            image_dir, model = Path(args.source), load_model(args.weights, args.conf_thres)
+        else:
+            image_dir, model = tmp / 'images', BlobModel()
+            image_dir.mkdir()
+            write_synthetic(image_dir, args.images)
+        uncached_time = detect_to(tmp / 'uncached.jsonl', image_dir, model, args, cached=False)
+        cached_time = detect_to(tmp / 'cached.jsonl', image_dir, model, args, cached=True)
+        uncached = read_detections(tmp / 'uncached.jsonl')
+        cached = read_detections(tmp / 'cached.jsonl')
+
+    problems = []
+    if set(cached) != set(uncached):
+        problems.append(f"{len(set(cached) ^ set(uncached))} sources appear in only one run")
+    common = sorted(set(cached) & set(uncached))
+    shapes = [s for s in common if cached[s][1] != uncached[s][1]]
+    if shapes:
+        problems.append(f"{len(shapes)} images recorded with a different size, e.g. {shapes[0]}: "
+                        f"{cached[shapes[0]][1]} vs {uncached[shapes[0]][1]}")
+    metrics = evaluate((cached[s][0], uncached[s][0].class_ids, uncached[s][0].boxes) for s in common)
+    print(f"{len(common)} images: uncached {uncached_time:.2f}s, cached {cached_time:.2f}s; "
+          f"mAP50 of cached against uncached {metrics['map50']:.3f}")
+    if not args.source:
+        bad = box_mismatches({s: cached[s] for s in common}, {s: uncached[s] for s in common}, args.tolerance)
+        if bad:
+            problems.append(f"{len(bad)} images with boxes that differ, e.g. {bad[0]}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print("Cached and uncached detections match")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""End-to-end inference benchmark over a directory of images.
+
+Times each stage separately (decode, preprocess, inference, post-processing,
+drawing, encoding) for every combination of batch size and thread count, then
+writes the results as JSON and optionally compares them with a stored
+baseline, exiting non-zero on a regression.
+
+    python -m benchmarks.inference --weights stand-in --batch-sizes 1 8 --threads 1 4 \\
+        --output bench.json --baseline benchmarks/baseline_cpu.json
+
+With YOLOv5 hub models NMS runs inside the model call, so it is reported as
+part of ``inference``; ``postprocess`` is the conversion and thresholding of
+the predictions. Thread counts apply to OpenCV and, when installed, torch.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from detect import IMG_FORMATS, draw_detections, postprocess
+from vehicle_detection.backends import BACKENDS
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.image_cache import letterbox
+from vehicle_detection.models import STAND_IN, load_model
+
+STAGES = ['decode', 'preprocess', 'inference', 'postprocess', 'draw', 'encode']
+PER_IMAGE_STAGES = ['decode', 'preprocess', 'draw', 'encode']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', type=str, default='trafic_data/valid/images', help='Directory of images')
+    parser.add_argument('--weights', type=str, default=STAND_IN,
+                        help=f"Model weights, or '{STAND_IN}' for the deterministic CPU-only model")
+    parser.add_argument('--backend', type=str, default='pytorch', choices=BACKENDS, help='Inference runtime')
+    parser.add_argument('--img-size', type=int, default=480, help='Letterbox size used for preprocessing')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='Confidence threshold')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8], help='Batch sizes to run')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1], help='Thread counts to run')
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N images')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed batches before each configuration')
+    parser.add_argument('--output', type=str, default=None, help='Write results JSON here')
+    parser.add_argument('--baseline', type=str, default=None, help='Compare against this results JSON')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Allowed fractional throughput drop / p95 latency rise before failing')
+    return parser.parse_args()
+
+
+def set_threads(n):
+    cv2.setNumThreads(n)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(n)
+
+
+def environment():
+    env = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+    if 'torch' in sys.modules:
+        env['torch'] = sys.modules['torch'].__version__
+    return env
+
+
+def run_config(paths, model, batch_size, img_size, conf_thres, class_names, warmup=1):
+    """Run every image once; returns per-image latencies and per-stage totals in seconds"""
+    stage_totals = dict.fromkeys(STAGES, 0.0)
+    latencies = []
+
+    def run_batch(batch_paths, record):
+        per_image = [dict.fromkeys(PER_IMAGE_STAGES, 0.0) for _ in batch_paths]
+        imgs = []
+        for times, path in zip(per_image, batch_paths):
+            start = time.perf_counter()
+            img = cv2.imread(str(path))
+            times['decode'] = time.perf_counter() - start
+            start = time.perf_counter()
+            img, _, _ = letterbox(img, img_size)
+            times['preprocess'] = time.perf_counter() - start
+            imgs.append(img)
+
+        start = time.perf_counter()
+        results = model(imgs)
+        inference = time.perf_counter() - start
+        start = time.perf_counter()
+        detections = [postprocess(pred, conf_thres) for pred in results.pred]
+        post = time.perf_counter() - start
+
+        for times, img, dets in zip(per_image, imgs, detections):
+            start = time.perf_counter()
+            img = draw_detections(img, dets, class_names)
+            times['draw'] = time.perf_counter() - start
+            start = time.perf_counter()
+            cv2.imencode('.jpg', img)
+            times['encode'] = time.perf_counter() - start
+
+        if record:
+            stage_totals['inference'] += inference
+            stage_totals['postprocess'] += post
+            for times in per_image:
+                for stage, seconds in times.items():
+                    stage_totals[stage] += seconds
+                # An image is done only once its whole batch has been inferred
+                latencies.append(sum(times.values()) + inference + post)
+
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    for batch_paths in batches[:warmup]:
+        run_batch(batch_paths, record=False)
+    start = time.perf_counter()
+    for batch_paths in batches:
+        run_batch(batch_paths, record=True)
+    wall = time.perf_counter() - start
+    return wall, latencies, stage_totals
+
+
+def summarize(batch_size, threads, n_images, wall, latencies, stage_totals):
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        'batch_size': batch_size,
+        'threads': threads,
+        'images': n_images,
+        'wall_seconds': round(wall, 4),
+        'throughput': round(n_images / wall, 3),
+        'latency_ms': {f'p{p}': round(float(np.percentile(ms, p)), 3) for p in (50, 95, 99)},
+        'stage_ms_per_image': {stage: round(1000.0 * seconds / n_images, 3) for stage, seconds in stage_totals.items()},
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return human-readable regressions of ``results`` against ``baseline``"""
+    reference = {(r['batch_size'], r['threads']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        key = (result['batch_size'], result['threads'])
+        base = reference.get(key)
+        if base is None:
+            continue
+        label = f"batch {key[0]}, threads {key[1]}"
+        if result['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append(f"{label}: throughput {result['throughput']:.1f} img/s "
+                               f"vs baseline {base['throughput']:.1f}")
+        if result['latency_ms']['p95'] > base['latency_ms']['p95'] * (1 + threshold):
+            regressions.append(f"{label}: p95 latency {result['latency_ms']['p95']:.1f} ms "
+                               f"vs baseline {base['latency_ms']['p95']:.1f}")
+    return regressions
+
+
+def print_table(results):
+    header = f"{'batch':>5} {'threads':>7} {'img/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  " + \
+        ' '.join(f'{s:>11}' for s in STAGES)
+    print(header)
+    for r in results:
+        lat = r['latency_ms']
+        print(f"{r['batch_size']:>5} {r['threads']:>7} {r['throughput']:>8.1f} {lat['p50']:>8.2f} "
+              f"{lat['p95']:>8.2f} {lat['p99']:>8.2f}  " +
+              ' '.join(f"{r['stage_ms_per_image'][s]:>11.2f}" for s in STAGES))
+    print("(latencies in ms; stage columns in ms per image)")
+
+
+def main():
+    args = parse_args()
+    paths = sorted(p for p in Path(args.source).iterdir() if p.suffix.lower() in IMG_FORMATS)[:args.limit]
+    if not paths:
+        print(f"Error: no images found in {args.source}")
+        return 1
+
+    model = load_model(args.weights, args.conf_thres, backend=args.backend)
+    names = getattr(model, 'names', None) or load_class_map().names
+    class_names = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+
+    results = []
+    for threads in args.threads:
+        set_threads(threads)
+        for batch_size in args.batch_sizes:
+            wall, latencies, stage_totals = run_config(paths, model, batch_size, args.img_size,
+                                                       args.conf_thres, class_names, args.warmup)
+            results.append(summarize(batch_size, threads, len(paths), wall, latencies, stage_totals))
+
+    report = {
+        'model': args.weights,
+        'backend': args.backend,
+        'source': str(args.source),
+        'img_size': args.img_size,
+        'environment': environment(),
+        'results': results,
+    }
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get('model') != report['model']:
+            print(f"Warning: baseline model '{baseline.get('model')}' differs from '{report['model']}'")
+        if baseline.get('backend', 'pytorch') != report['backend']:
+            print(f"Warning: baseline backend '{baseline.get('backend', 'pytorch')}' differs from '{report['backend']}'")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold:.0%} against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Micro-benchmark of annotation rendering.
+
+Draws the same random detections on a frame for each box count and times:
+
+- ``per-box``: the previous detect.py loop, formatting every label and copying the frame
+- ``renderer``: ``vehicle_detection.render.Renderer`` writing into a reused output buffer
+- ``slices``: boxes drawn with NumPy slice assignments and labels blitted from
+  cached pre-rasterized sprites (``SliceRenderer``), the candidate measured
+  against the renderer's OpenCV calls
+
+    python -m benchmarks.render --boxes 10 100 500 --size 1920 1080
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.detections import Detections
+from vehicle_detection.render import FONT, Renderer
+
+CLASS_NAMES = load_class_map().names
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boxes', type=int, nargs='+', default=[10, 100, 500], help='Boxes per frame')
+    parser.add_argument('--size', type=int, nargs=2, default=[1920, 1080], metavar=('W', 'H'), help='Frame size')
+    parser.add_argument('--repeats', type=int, default=50, help='Frames drawn per measurement')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def draw_per_box(img, detections, class_names):
+    """The previous detect.py implementation: one rectangle and one putText per box"""
+    boxes = detections.boxes.astype(np.int64).tolist()
+    for (x1, y1, x2, y2), conf, cls in zip(boxes, detections.confidences.tolist(), detections.class_ids.tolist()):
+        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{class_names[cls]} {conf:.2f}"
+        cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    return img
+
+
+class SliceRenderer(Renderer):
+    """Boxes as four NumPy slice assignments each, labels as cached pre-rasterized sprites.
+
+    A sprite is the label drawn once by ``cv2.putText`` into an alpha mask,
+    cropped to its ink. Later frames blend the sprite's crop into the image
+    instead of rasterizing the glyphs again. Pixels match the ``Renderer`` to
+    within one level of the antialiased blend, except the four outer corner
+    pixels of each box, which OpenCV leaves undrawn.
+    """
+
+    def __init__(self, class_names, **kwargs):
+        super().__init__(class_names, **kwargs)
+        self._color_arrays = [np.asarray(c, dtype=np.float32) for c in self.colors]
+        self._sprites = {}
+
+    def sprite(self, text):
+        """``(alpha, dx, dy)``: float alpha mask and its offset from the text origin"""
+        sprite = self._sprites.get(text)
+        if sprite is None:
+            (w, h), base = cv2.getTextSize(text, FONT, self.font_scale, self.font_thickness)
+            pad = self.font_thickness + 1
+            canvas = np.zeros((h + base + 2 * pad, w + 2 * pad), dtype=np.uint8)
+            cv2.putText(canvas, text, (pad, h + pad), FONT, self.font_scale, 255, self.font_thickness)
+            ys, xs = np.nonzero(canvas)
+            y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+            alpha = (canvas[y0:y1, x0:x1, None] / 255.0).astype(np.float32)
+            sprite = self._sprites[text] = (alpha, int(x0) - pad, int(y0) - h - pad)
+        return sprite
+
+    def draw(self, img, detections, out=None):
+        if out is not None:
+            np.copyto(out, img)
+            img = out
+        height, width = img.shape[:2]
+        t = self.thickness
+        # OpenCV's outline of thickness t covers these many pixels before and after the edge
+        before, after = ((t + 1) // 2, t // 2 + 1) if t > 1 else (0, 1)
+        track_ids = detections.track_ids.tolist() if detections.track_ids is not None else [None] * len(detections)
+        for (x1, y1, x2, y2), conf, cls, track_id in zip(detections.boxes.astype(np.int64).tolist(),
+                                                          detections.confidences.tolist(),
+                                                          detections.class_ids.tolist(), track_ids):
+            color = self._color_arrays[cls % len(self._color_arrays)]
+            left, right, top, bottom = max(x1 - before, 0), max(x2 + after, 0), max(y1 - before, 0), max(y2 + after, 0)
+            img[top:y1 + after, left:right] = color
+            img[max(y2 - before, 0):bottom, left:right] = color
+            img[top:bottom, left:x1 + after] = color
+            img[top:bottom, max(x2 - before, 0):right] = color
+
+            alpha, dx, dy = self.sprite(self.label_text(cls, conf, track_id))
+            sx, sy = x1 + dx, y1 - self.label_offset + dy
+            h, w = alpha.shape[:2]
+            cx0, cy0, cx1, cy1 = max(0, -sx), max(0, -sy), min(w, width - sx), min(h, height - sy)
+            if cx1 > cx0 and cy1 > cy0:
+                region = img[sy + cy0:sy + cy1, sx + cx0:sx + cx1]
+                a = alpha[cy0:cy1, cx0:cx1]
+                region[:] = region * (1.0 - a) + color * a
+        return img
+
+
+def random_detections(n, width, height, rng):
+    xy = rng.uniform([0, 20], [width - 40, height - 40], size=(n, 2))
+    wh = rng.uniform(15, 200, size=(n, 2))
+    boxes = np.concatenate([xy, np.minimum(xy + wh, [width - 1, height - 1])], axis=1)
+    return Detections(boxes, rng.uniform(0.25, 1.0, n), rng.integers(0, len(CLASS_NAMES), n))
+
+
+def time_ms(fn, repeats):
+    fn()  # warm up caches (label sprites, allocator)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return 1000.0 * (time.perf_counter() - start) / repeats
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    width, height = args.size
+    frame = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    out = np.empty_like(frame)
+    renderer = Renderer(CLASS_NAMES)
+    slices = SliceRenderer(CLASS_NAMES)
+    slice_out = np.empty_like(frame)
+
+    print(f"{'boxes':>6} {'per-box ms':>11} {'renderer ms':>12} {'slices ms':>10} {'speedup':>8} {'px off by >1':>13}")
+    for n in args.boxes:
+        detections = random_detections(n, width, height, rng)
+        per_box = time_ms(lambda: draw_per_box(frame.copy(), detections, CLASS_NAMES), args.repeats)
+        rendered = time_ms(lambda: renderer.draw(frame, detections, out=out), args.repeats)
+        sliced = time_ms(lambda: slices.draw(frame, detections, out=slice_out), args.repeats)
+        differing = int((np.abs(out.astype(np.int16) - slice_out) > 1).any(axis=2).sum())
+        print(f"{n:>6} {per_box:>11.3f} {rendered:>12.3f} {sliced:>10.3f} {per_box / rendered:>7.2f}x {differing:>13}")
+    print(f"({width}x{height} frame, times per frame including the copy of the input frame; "
+          f"speedup is per-box / renderer)")
+
+
+if __name__ == '__main__':
+    main()
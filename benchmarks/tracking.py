@@ -0,0 +1,121 @@
+"""Synthetic-trajectory benchmark for ``vehicle_detection.tracking``.
+
+Simulates a fixed camera with a steady population of vehicles driving across
+the frame, feeds noisy detections (with misses and false positives) to the
+tracker, and reports per-frame update latency and counting accuracy against
+the ground-truth line crossings.
+
+    python -m benchmarks.tracking --vehicles 300 --frames 900
+"""
+import argparse
+import time
+
+import numpy as np
+
+from vehicle_detection.detections import Detections
+from vehicle_detection.tracking import Tracker
+
+WIDTH, HEIGHT = 1920, 1080
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vehicles', type=int, default=300, help='Vehicles simultaneously in view')
+    parser.add_argument('--frames', type=int, default=900, help='Frames to simulate')
+    parser.add_argument('--fps', type=float, default=30.0, help='Target frame rate to check against')
+    parser.add_argument('--miss-rate', type=float, default=0.05, help='Probability a vehicle is not detected in a frame')
+    parser.add_argument('--false-positives', type=int, default=5, help='Spurious detections per frame')
+    parser.add_argument('--noise', type=float, default=1.5, help='Box corner noise in pixels')
+    parser.add_argument('--method', choices=['greedy', 'hungarian'], default='greedy')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+class Traffic:
+    """Vehicles on horizontal lanes moving left or right at constant speed"""
+
+    def __init__(self, n, rng):
+        self.rng = rng
+        self.n = n
+        lanes = HEIGHT // 40
+        self.lane_y = (np.arange(lanes) + 0.5) * (HEIGHT / lanes)
+        self.pos = np.zeros((n, 2))
+        self.vel = np.zeros(n)
+        self.size = np.zeros((n, 2))
+        self.cls = np.zeros(n, dtype=np.int64)
+        self._respawn(np.ones(n, dtype=bool), spread=True)
+
+    def _respawn(self, mask, spread=False):
+        k = int(mask.sum())
+        if not k:
+            return
+        lane = self.rng.integers(0, len(self.lane_y), k)
+        direction = np.where(lane % 2 == 0, 1.0, -1.0)
+        speed = self.rng.uniform(4, 12, k) * direction
+        x = self.rng.uniform(0, WIDTH, k) if spread else np.where(direction > 0, -30.0, WIDTH + 30.0)
+        self.pos[mask] = np.stack([x, self.lane_y[lane]], axis=1)
+        self.vel[mask] = speed
+        self.cls[mask] = self.rng.integers(0, 2, k)
+        w = np.where(self.cls[mask] == 0, self.rng.uniform(40, 60, k), self.rng.uniform(70, 110, k))
+        self.size[mask] = np.stack([w, w * 0.45], axis=1)
+
+    def step(self, line_x):
+        prev_x = self.pos[:, 0].copy()
+        self.pos[:, 0] += self.vel
+        crossed = (prev_x < line_x) != (self.pos[:, 0] < line_x)
+        gone = (self.pos[:, 0] < -60) | (self.pos[:, 0] > WIDTH + 60)
+        cls_crossed = self.cls[crossed]
+        self._respawn(gone)
+        return cls_crossed
+
+    def boxes(self):
+        half = self.size / 2
+        return np.concatenate([self.pos - half, self.pos + half], axis=1)
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    traffic = Traffic(args.vehicles, rng)
+    line_x = WIDTH / 2
+    tracker = Tracker(method=args.method, line=((line_x, 0), (line_x, HEIGHT)), num_classes=2)
+    truth = np.zeros(2, dtype=np.int64)
+    timings = np.zeros(args.frames)
+    peak_tracks = 0
+
+    for frame in range(args.frames):
+        crossed_cls = traffic.step(line_x)
+        # Vehicles that cross in their first frames cannot be counted by any tracker
+        if frame >= tracker.min_hits:
+            truth += np.bincount(crossed_cls, minlength=2)
+
+        boxes = traffic.boxes()
+        visible = rng.random(args.vehicles) >= args.miss_rate
+        boxes = boxes[visible] + rng.normal(0, args.noise, (int(visible.sum()), 4))
+        cls = traffic.cls[visible]
+        fp = rng.uniform([0, 0], [WIDTH - 60, HEIGHT - 30], (args.false_positives, 2))
+        boxes = np.concatenate([boxes, np.concatenate([fp, fp + [50, 25]], axis=1)])
+        cls = np.concatenate([cls, rng.integers(0, 2, args.false_positives)])
+        conf = rng.uniform(0.3, 0.95, len(boxes))
+        detections = Detections(boxes, conf, cls)
+
+        start = time.perf_counter()
+        tracker.update(detections)
+        timings[frame] = time.perf_counter() - start
+        peak_tracks = max(peak_tracks, len(tracker))
+
+    ms = timings * 1000.0
+    budget_ms = 1000.0 / args.fps
+    counted = tracker.counter.total()
+    print(f"Tracker benchmark ({args.method}): {args.vehicles} vehicles, {args.frames} frames, "
+          f"peak {peak_tracks} live tracks")
+    print(f"  update latency ms: mean {ms.mean():.2f}  p50 {np.percentile(ms, 50):.2f}  "
+          f"p95 {np.percentile(ms, 95):.2f}  p99 {np.percentile(ms, 99):.2f}  max {ms.max():.2f}")
+    print(f"  throughput: {1000.0 / ms.mean():.0f} frames/sec "
+          f"({'within' if np.percentile(ms, 99) <= budget_ms else 'OVER'} the {budget_ms:.1f} ms budget at p99)")
+    for name, cls_id in (('car', 0), ('truck', 1)):
+        print(f"  {name:<6} crossings counted {counted[cls_id]:5d}  ground truth {truth[cls_id]:5d}")
+
+
+if __name__ == '__main__':
+    main()
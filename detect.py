@@ -1,93 +1,367 @@
 import os
 import argparse
+import multiprocessing
+import sys
 import cv2
-import torch
 import numpy as np
 from pathlib import Path
 
+from vehicle_detection.classes import ENV_VAR as CLASSES_ENV_VAR, load_class_map
+from vehicle_detection.detections import Detections
+from vehicle_detection.image_cache import build_image_cache, to_original_xyxy
+from vehicle_detection.metrics import instrument, span
+from vehicle_detection.backends import BACKENDS
+from vehicle_detection.models import STAND_IN, load_model
+from vehicle_detection.motion_gate import MotionGate
+from vehicle_detection.pipeline import run_pipeline
+from vehicle_detection.render import get_renderer
+from vehicle_detection.server import ModelClient
+from vehicle_detection.sharding import (SHARD_DIR, all_complete, completed_sources, list_inputs, mark_complete,
+                                         merge_shards, parse_shard, pin_threads, select_shard, shard_path)
+from vehicle_detection.sinks import FORMATS, JsonlSink, open_sink
+from vehicle_detection.tiling import TiledDetector
+from vehicle_detection.stream import VID_FORMATS, is_live_source, run_stream
+from vehicle_detection.tracking import Tracker
+
+IMG_FORMATS = ['.jpg', '.jpeg', '.png']
+
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument('--source', type=str, required=True, help='Path to input image or directory')
-    parser.add_argument('--weights', type=str, default='runs/train/exp/weights/best.pt', help='Path to model weights')
+    parser.add_argument('--source', type=str, required=True, help='Path to input image, directory, video file, camera index or stream URL')
+    parser.add_argument('--weights', type=str, default='runs/train/exp/weights/best.pt',
+                        help=f"Path to model weights, or '{STAND_IN}' for the CPU-only test model")
+    parser.add_argument('--server', type=str, default=None, help='Send images to a running serve.py at this URL instead of loading the model')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=BACKENDS,
+                        help='Inference runtime; non-pytorch backends need a one-time export of the weights')
+    parser.add_argument('--classes', type=str, default=None,
+                        help='Class registry YAML (default: data/dataset.yaml, see vehicle_detection/classes.py)')
     parser.add_argument('--conf-thres', type=float, default=0.25, help='Confidence threshold')
     parser.add_argument('--iou-thres', type=float, default=0.45, help='NMS IoU threshold')
     parser.add_argument('--output', type=str, default='output', help='Output directory')
+    parser.add_argument('--batch-size', type=int, default=1, help='Images per model call when the source is a directory')
+    parser.add_argument('--tile-size', type=int, default=0,
+                        help='Also run overlapping tiles of this size (sliced inference for small vehicles); 0 disables')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='Fractional overlap between tiles')
+    parser.add_argument('--tile-min-std', type=float, default=6.0, help='Skip tiles whose grayscale std dev is below this')
+    parser.add_argument('--tile-motion-thres', type=float, default=None,
+                        help='For video, skip tiles whose mean frame difference is below this')
+    parser.add_argument('--max-tiles', type=int, default=None, help='Run at most this many tiles per image')
+    parser.add_argument('--motion-gate', type=float, default=None,
+                        help='Reuse the previous detections for video frames (or a directory of frames) whose mean '
+                             'gray-level change since the last detected frame stays below this in every region')
+    parser.add_argument('--motion-regions', action='store_true',
+                        help='With --motion-gate, detect only the changed regions when they cover a small part of the frame')
+    parser.add_argument('--motion-max-skip', type=int, default=30,
+                        help='With --motion-gate, run a full-frame detection at least every N frames')
+    parser.add_argument('--image-cache', action='store_true',
+                        help='Read a directory source from its pre-decoded, letterboxed image cache (built if missing); '
+                             'needs --no-render')
+    parser.add_argument('--img-size', type=int, default=480, help='Letterboxed size of the image cache')
+    parser.add_argument('--buffer-size', type=int, default=8, help='Decoded frames buffered ahead of inference for video sources')
+    parser.add_argument('--max-latency-ms', type=float, default=250.0, help='Drop buffered video frames older than this (0 keeps every frame)')
+    parser.add_argument('--no-adaptive', action='store_true', help='Process every frame of a video file instead of striding to keep real time')
+    parser.add_argument('--track', action='store_true', help='Track vehicles across video frames and label them with track ids')
+    parser.add_argument('--count-line', type=float, nargs=4, metavar=('X1', 'Y1', 'X2', 'Y2'), default=None,
+                        help='Count tracked vehicles per class crossing this line (implies --track)')
+    parser.add_argument('--workers', type=int, default=4, help='Decode/encode threads used with --batch-size > 1')
+    parser.add_argument('--save-detections', type=str, default=None,
+                        help=f"Stream detections to this file ({', '.join(FORMATS)}; Parquet needs pyarrow)")
+    parser.add_argument('--flush-interval', type=float, default=5.0, help='Seconds between flushes of --save-detections')
+    parser.add_argument('--no-render', action='store_true',
+                        help='Do not draw or write annotated images/video (only save detections)')
+    parser.add_argument('--shard', type=str, default=None,
+                        help='Process only shard i/N (e.g. 0/4) of a directory or .txt manifest; resumable')
+    parser.add_argument('--procs', type=int, default=1,
+                        help='Local worker processes, each with its own model, splitting the (shard of the) source')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Compute threads per worker process (default: CPUs / --procs)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Time imread, inference, postprocess, draw and imwrite and print latency percentiles')
+    parser.add_argument('--metrics-interval', type=float, default=0,
+                        help='Also print the latency summary every N seconds (implies --metrics)')
+    parser.add_argument('--metrics-file', type=str, default=None,
+                        help='Write span histograms in Prometheus text format here (implies --metrics)')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Sample Python stacks and write a folded flame-graph profile here')
     return parser.parse_args()
 
-def process_image(img_path, model, conf_thres, iou_thres):
+def process_image(img_path, model, conf_thres, iou_thres, load=None, tiler=None, gate=None):
     """Process a single image and return detections"""
     # Read image
-    img = cv2.imread(str(img_path))
+    with span('imread'):
+        img = load(img_path) if load is not None else cv2.imread(str(img_path))
     if img is None:
         print(f"Error reading image: {img_path}")
-        return None
+        return None, None
     
-    # Run inference
-    results = model(img)
+    # Reuse the previous detections if the frame has not changed
+    if gate is not None:
+        return img, gate(img, conf_thres)
     
-    # Process results
-    detections = []
-    for pred in results.pred[0]:
-        x1, y1, x2, y2, conf, cls = pred.cpu().numpy()
-        if conf >= conf_thres:
-            detections.append({
-                'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                'confidence': float(conf),
-                'class': int(cls)
-            })
+    # Run inference (full frame plus selected tiles in one batch when tiling)
+    if tiler is not None:
+        with span('inference'):
+            return img, tiler(img, conf_thres)
+    with span('inference'):
+        results = model(img)
     
-    return img, detections
-
-def draw_detections(img, detections, class_names):
-    """Draw bounding boxes and labels on image"""
-    for det in detections:
-        x1, y1, x2, y2 = det['bbox']
-        conf = det['confidence']
-        cls = det['class']
-        
-        # Draw bounding box
-        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        
-        # Draw label
-        label = f"{class_names[cls]} {conf:.2f}"
-        cv2.putText(img, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    return img, postprocess(results.pred[0], conf_thres)
+
+def process_batch(imgs, model, conf_thres, tiler=None, video=False):
+    """Run a single model call over a list of images and return detections per image"""
+    if tiler is not None:
+        with span('inference'):
+            return [tiler(img, conf_thres, video) for img in imgs]
+    with span('inference'):
+        results = model(imgs)
+    return [postprocess(pred, conf_thres) for pred in results.pred]
+
+def postprocess(pred, conf_thres):
+    """Convert one image's prediction tensor into columnar detections"""
+    with span('postprocess'):
+        return Detections.from_pred(pred).filter(conf_thres)
+
+def draw_detections(img, detections, class_names, out=None):
+    """Draw bounding boxes and labels on image (in place, or into ``out`` if given)"""
+    with span('draw'):
+        return get_renderer(class_names).draw(img, detections, out)
+
+def build_model(args):
+    """Model (or server client) and optional tiler for the parsed arguments"""
+    if args.server:
+        model = ModelClient(args.server)
+        model.conf = args.conf_thres
+    else:
+        model = load_model(args.weights, args.conf_thres, args.iou_thres, backend=args.backend)
     
-    return img
+    # Sliced inference
+    tiler = None
+    if args.tile_size:
+        tiler = TiledDetector(model, args.tile_size, args.tile_overlap, args.tile_min_std,
+                              args.tile_motion_thres, args.max_tiles, args.iou_thres)
+    return model, tiler
 
-def main():
-    args = parse_args()
+def make_save(args, sink, class_names):
+    """Per-image output: detections to ``sink`` and, unless ``--no-render``, the annotated image"""
+    def save(img_path, img, detections, shape=None):
+        if sink is not None:
+            with span('save_detections'):
+                sink.write(img_path, detections, shape=shape or img.shape)
+        if not args.no_render:
+            img = draw_detections(img, detections, class_names)
+            output_path = os.path.join(args.output, img_path.name)
+            with span('imwrite'):
+                cv2.imwrite(output_path, img)
+            print(f"Saved result to {output_path}")
+    return save
+
+def from_image_cache(source, img_size, save):
+    """``(load, save)`` reading a directory from its letterboxed image cache.
+
+    Detection runs on the cached image; its boxes are mapped back to the
+    original image and the original shape is recorded, so the saved
+    detections are in the same pixels as without the cache.
+    """
+    cache = build_image_cache(source, img_size)
+    metas = {}
+
+    def load(img_path):
+        img, meta = cache.read(img_path)
+        metas[img_path] = meta
+        return img
+
+    def save_original(img_path, img, detections):
+        meta = metas.pop(img_path)
+        detections = Detections(to_original_xyxy(detections.boxes, meta), detections.confidences,
+                                detections.class_ids, detections.track_ids)
+        save(img_path, img, detections, shape=tuple(meta['shape']))
+    return load, save_original
+
+def process_paths(img_paths, model, tiler, args, save, load=None, gate=None):
+    """Run a list of images through the model, pipelined when ``--batch-size`` > 1"""
+    if args.batch_size > 1 and gate is not None:
+        print("Note: --motion-gate compares consecutive frames, so images are processed one at a time")
+    elif args.batch_size > 1:
+        # Decoded/inferred/written in overlapping stages
+        stats = run_pipeline(img_paths, lambda imgs: process_batch(imgs, model, args.conf_thres, tiler), save,
+                             batch_size=args.batch_size, decode_workers=args.workers,
+                             encode_workers=max(1, args.workers // 2), load=load)
+        print(stats.summary())
+        return
+    for img_path in img_paths:
+        img, detections = process_image(img_path, model, args.conf_thres, args.iou_thres, load, tiler, gate)
+        if img is not None:
+            save(img_path, img, detections)
+
+def metrics_options(args, suffix=''):
+    """Keyword arguments of ``instrument`` for the parsed arguments; ``suffix`` keeps per-process files apart"""
+    def with_suffix(path):
+        return path and (f'{os.path.splitext(path)[0]}{suffix}{os.path.splitext(path)[1]}' if suffix else path)
+    return {'enabled': args.metrics or args.metrics_interval > 0, 'interval': args.metrics_interval or None,
+            'prometheus_path': with_suffix(args.metrics_file), 'profile_path': with_suffix(args.profile)}
+
+def run_shard(args, index, count, threads=None):
+    """Process shard ``index`` of ``count``, skipping images already recorded in its shard file"""
+    if threads:
+        pin_threads(threads)
+    with instrument(labels={'shard': f'{index}/{count}'}, **metrics_options(args, f'.shard{index}')):
+        process_shard(args, index, count)
+
+def process_shard(args, index, count):
+    model, tiler = build_model(args)
+    path = shard_path(os.path.join(args.output, SHARD_DIR), index, count)
+    img_paths = select_shard(list_inputs(args.source, IMG_FORMATS), index, count)
+    done = completed_sources(path)
+    todo = [p for p in img_paths if str(p) not in done]
+    print(f"Shard {index}/{count}: {len(img_paths)} images, {len(img_paths) - len(todo)} already done")
+    class_names = load_class_map().names
+    with JsonlSink(path, class_names, flush_interval=args.flush_interval, append=True) as sink:
+        save, load = make_save(args, sink, class_names), None
+        if args.image_cache:
+            load, save = from_image_cache(args.source, args.img_size, save)
+        process_paths(todo, model, tiler, args, save, load)
+    # Images that could not be read or failed are not in the shard file; leave the shard resumable for them
+    missing = len({str(p) for p in img_paths} - completed_sources(path))
+    if missing:
+        print(f"Shard {index}/{count}: {missing} images not recorded; rerun the same command to retry them")
+        return
+    mark_complete(path, len(img_paths))
+
+def run_sharded(args):
+    """Process this node's shard (``--shard i/N``) split over ``--procs`` local processes, then merge if all are done"""
+    node, nodes = parse_shard(args.shard) if args.shard else (0, 1)
+    count = nodes * args.procs
+    shards = [node * args.procs + j for j in range(args.procs)]
+    threads = args.threads or (max(1, (os.cpu_count() or 1) // args.procs) if args.procs > 1 else None)
+    shard_dir = os.path.join(args.output, SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    if args.image_cache:
+        build_image_cache(args.source, args.img_size)
     
-    # Create output directory
-    os.makedirs(args.output, exist_ok=True)
+    if args.procs == 1:
+        run_shard(args, shards[0], count, threads)
+    else:
+        # Spawned (not forked) so no process inherits another's torch thread pool
+        ctx = multiprocessing.get_context('spawn')
+        procs = [ctx.Process(target=run_shard, args=(args, index, count, threads)) for index in shards]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        failed = [index for index, proc in zip(shards, procs) if proc.exitcode != 0]
+        if failed:
+            print(f"Error: shards {failed} failed; rerun the same command to resume them")
+            return 1
     
+    if all_complete(shard_dir, count):
+        output = args.save_detections or os.path.join(args.output, 'detections.jsonl')
+        images = merge_shards(shard_dir, count, output, load_class_map().names)
+        print(f"Merged {images} images from {count} shards into {output}")
+    elif not all(shard_path(shard_dir, index, count).with_suffix('.complete').exists() for index in shards):
+        print(f"Error: shard {node}/{nodes} has images without results; rerun the same command to retry them")
+        return 1
+    else:
+        print(f"Finished shard {node}/{nodes}; the last node to finish merges all shards into one output")
+    return 0
+
+def run(args):
+    """Detect on an image, directory or video in this process"""
     # Load model
-    model = torch.hub.load('ultralytics/yolov5', 'custom', path=args.weights)
-    model.conf = args.conf_thres
-    model.iou = args.iou_thres
+    model, tiler = build_model(args)
+    
+    # Skip unchanged frames of a static camera
+    source = Path(args.source)
+    video = is_live_source(args.source) or source.suffix.lower() in VID_FORMATS
+    gate = None
+    if args.motion_gate is not None:
+        gate = MotionGate(lambda imgs, conf_thres: process_batch(imgs, model, conf_thres, tiler, video),
+                          args.motion_gate, args.motion_max_skip, args.motion_regions)
     
     # Class names
-    class_names = ['car', 'truck']
+    class_names = load_class_map().names
+    
+    # Structured output
+    sink = None
+    if args.save_detections:
+        sink = open_sink(args.save_detections, class_names, flush_interval=args.flush_interval)
+    save = make_save(args, sink, class_names)
     
     # Process input
-    source = Path(args.source)
-    if source.is_file():
+    if video:
+        # Video file or capture stream
+        name = source.stem if source.suffix else 'stream'
+        tracker = None
+        if args.track or args.count_line:
+            line = (args.count_line[:2], args.count_line[2:]) if args.count_line else None
+            tracker = Tracker(line=line, num_classes=len(class_names))
+
+        def infer(img):
+            if gate is not None:
+                detections = gate(img, args.conf_thres)
+            elif tiler is not None:
+                with span('inference'):
+                    detections = tiler(img, args.conf_thres, video=True)
+            else:
+                with span('inference'):
+                    results = model(img)
+                detections = postprocess(results.pred[0], args.conf_thres)
+            return tracker.update(detections) if tracker is not None else detections
+
+        summary = run_stream(args.source, infer,
+                             lambda img, detections: draw_detections(img, detections, class_names),
+                             video_path=None if args.no_render else os.path.join(args.output, f'{name}.mp4'),
+                             log_path=os.path.join(args.output, f'{name}_detections.jsonl'),
+                             buffer_size=args.buffer_size, adaptive=not args.no_adaptive,
+                             max_latency=args.max_latency_ms / 1000.0 if args.max_latency_ms > 0 else None,
+                             sink=sink)
+        print(f"Saved results to {args.output}")
+        print(f"Processed {summary['processed_frames']} frames, dropped {summary['dropped_frames']} "
+              f"({summary['processing_fps']:.1f} fps, source {summary['source_fps']:.1f} fps)")
+        print(f"End-to-end latency ms: p50 {summary['latency_p50_ms']:.1f}  "
+              f"p95 {summary['latency_p95_ms']:.1f}  p99 {summary['latency_p99_ms']:.1f}")
+        if tracker is not None and tracker.counter is not None:
+            for cls, (forward, backward) in enumerate(tracker.counter.counts.tolist()):
+                print(f"{class_names[cls]}: {forward + backward} crossed ({forward} one way, {backward} the other)")
+    elif source.is_file():
         # Single image
-        img, detections = process_image(source, model, args.conf_thres, args.iou_thres)
+        img, detections = process_image(source, model, args.conf_thres, args.iou_thres, tiler=tiler)
         if img is not None:
-            img = draw_detections(img, detections, class_names)
-            output_path = os.path.join(args.output, source.name)
-            cv2.imwrite(output_path, img)
-            print(f"Saved result to {output_path}")
+            save(source, img, detections)
     else:
         # Directory of images
-        for img_path in source.glob('*'):
-            if img_path.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-                img, detections = process_image(img_path, model, args.conf_thres, args.iou_thres)
-                if img is not None:
-                    img = draw_detections(img, detections, class_names)
-                    output_path = os.path.join(args.output, img_path.name)
-                    cv2.imwrite(output_path, img)
-                    print(f"Saved result to {output_path}")
+        load = None
+        if args.image_cache:
+            load, save = from_image_cache(source, args.img_size, save)
+        img_paths = sorted(p for p in source.glob('*') if p.suffix.lower() in IMG_FORMATS)
+        process_paths(img_paths, model, tiler, args, save, load, gate)
+
+    if gate is not None:
+        print(gate.summary())
+    if sink is not None:
+        sink.close()
+        print(f"Saved {sink.detections} detections from {sink.images} images to {sink.path}")
+    if tiler is not None and tiler.tiles_total:
+        print(f"Tiled inference ran {tiler.tiles_run} of {tiler.tiles_total} tiles "
+              f"({tiler.tiles_run / tiler.tiles_total:.0%})")
+
+def main():
+    args = parse_args()
+    
+    # The registry is read by every module (and spawned shard process) through the environment
+    if args.classes:
+        os.environ[CLASSES_ENV_VAR] = args.classes
+    
+    if args.image_cache and not args.no_render:
+        print("Error: --image-cache detects on letterboxed copies of the images; pass --no-render to save only detections")
+        return 1
+    
+    # Create output directory
+    os.makedirs(args.output, exist_ok=True)
+    
+    if args.shard or args.procs > 1:
+        return run_sharded(args)
+    with instrument(**metrics_options(args)):
+        return run(args)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    sys.exit(main()) 
\ No newline at end of file
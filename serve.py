@@ -0,0 +1,41 @@
+import argparse
+
+from vehicle_detection.backends import BACKENDS
+from vehicle_detection.metrics import enable as enable_metrics
+from vehicle_detection.models import STAND_IN, load_model
+from vehicle_detection.server import DEFAULT_PORT, ModelServer
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='yolov5/runs/train/exp33/weights/best.pt',
+                        help=f"Path to model weights, or '{STAND_IN}' for the CPU-only test model")
+    parser.add_argument('--backend', type=str, default='pytorch', choices=BACKENDS,
+                        help='Inference runtime; non-pytorch backends need a one-time export of the weights')
+    parser.add_argument('--conf-thres', type=float, default=0.001,
+                        help='Lowest confidence the server returns; clients send their own (higher) threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='NMS IoU threshold')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to bind')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--max-batch-size', type=int, default=16, help='Largest batch per model call')
+    parser.add_argument('--max-wait-ms', type=float, default=5.0,
+                        help='How long to wait for more requests before running a partial batch')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # Cheap enough to keep on; scraped from GET /metrics
+    enable_metrics()
+    model = load_model(args.weights, args.conf_thres, args.iou_thres, backend=args.backend)
+    server = ModelServer(model, args.host, args.port, max_batch_size=args.max_batch_size,
+                         max_wait=args.max_wait_ms / 1000.0, verbose=args.verbose)
+    print(f"Serving {args.weights} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,42 @@
 import os
+import sys
+import argparse
 from pathlib import Path
 import cv2
-import shutil
 import yaml
 
+# Make the shared vehicle_detection package importable when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.label_conversion import convert_directory, convert_label_text
+from vehicle_detection.label_store import pack_yolo_dir
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=None, help='Conversion processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='Re-convert every label even if unchanged')
+    return parser.parse_args()
+
 def convert_labels(original_label_path, yolo_label_path, img_width, img_height):
     """Convert labels from original format to YOLO format with specified class mapping."""
     try:
         with open(original_label_path, 'r') as f:
-            lines = f.readlines()
+            text = f.read()
         
-        yolo_lines = []
-        for line in lines:
-            parts = line.strip().split()
-            # Ensure the line has enough parts for a bounding box (assuming YOLO-like structure: class_id x y w h)
-            if len(parts) < 5: 
-                continue
-                
-            # Assuming the first part is the original class ID
-            try:
-                original_class_id = int(parts[0])
-            except ValueError:
-                # Skip line if class ID is not an integer
-                continue
-            
-            # Define a dictionary for original class ID to new YOLO class ID mapping
-            # Mapping: Original ID -> New ID (0 for Car, 1 for Truck, etc.)
-            class_id_mapping = {
-                5: 0,   # Car
-                18: 1,  # Truck
-                4: 2,   # Bus
-                10: 4,  # Motorbike
-                13: 5   # Bicycle
-                # If you have an original ID for Ambulance and want to include it (New ID 3), add it here.
-            }
-
-            # Check if the original class ID is in our mapping
-            if original_class_id in class_id_mapping:
-                new_class_id = class_id_mapping[original_class_id]
-                
-                # Get bounding box coordinates (parts[1] to parts[4] for YOLO format already)
-                # These are assumed to be already normalized x_center, y_center, width, height
-                try:
-                    x_center = float(parts[1])
-                    y_center = float(parts[2])
-                    width = float(parts[3])
-                    height = float(parts[4])
-                except (ValueError, IndexError):
-                     # Skip line if bounding box coordinates are not valid numbers
-                    continue
-
-                
-                # Add to YOLO format lines
-                yolo_lines.append(f"{new_class_id} {x_center} {y_center} {width} {height}\n")
-
-        # Write YOLO format labels
-        with open(yolo_label_path, 'w') as f:
-            f.writelines(yolo_lines)
+        # Write YOLO format labels (replaced, not truncated, so a linked file is never written through)
+        tmp_path = f'{yolo_label_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(convert_label_text(text, load_class_map().lut))
+        os.replace(tmp_path, yolo_label_path)
         return True
     except Exception as e:
         print(f"Error converting {original_label_path}: {str(e)}")
         return False
 
 def main():
+    args = parse_args()
+
     # Read dataset configuration
     dataset_config_path = 'data/dataset.yaml'
     if not os.path.exists(dataset_config_path):
@@ -114,34 +88,24 @@ def main():
         print(f"Error: Training labels directory not found at {train_original_labels_path}")
         return
 
-    # Convert training labels
-    success_count = 0
-    total_count = 0
-    
-    for label_file in train_original_labels_path.glob('*.txt'):
-        total_count += 1
-        # Define the output path for the converted label
-        yolo_label_path = f'data/labels/train/{label_file.name}'
-        if convert_labels(str(label_file), yolo_label_path, img_width, img_height):
-            success_count += 1
+    # Convert training labels (only new or changed files are re-processed)
+    mapping = load_class_map().mapping
+    summary = convert_directory(train_original_labels_path, 'data/labels/train', mapping,
+                                workers=args.workers, force=args.force)
+    # Keep the packed store (data/labels/train.labelpack) in sync for downstream tools
+    pack_yolo_dir('data/labels/train', workers=args.workers)
     
     print(f"\nTraining label conversion complete!")
-    print(f"Successfully converted {success_count} out of {total_count} labels")
+    print(f"Training labels: {summary}")
 
     # Convert validation labels
-    success_count_val = 0
-    total_count_val = 0
-
     if val_original_labels_path.exists():
-        for label_file in val_original_labels_path.glob('*.txt'):
-            total_count_val += 1
-            # Define the output path for the converted label
-            yolo_label_path = f'data/labels/val/{label_file.name}'
-            if convert_labels(str(label_file), yolo_label_path, img_width, img_height):
-                success_count_val += 1
+        summary_val = convert_directory(val_original_labels_path, 'data/labels/val', mapping,
+                                        workers=args.workers, force=args.force)
+        pack_yolo_dir('data/labels/val', workers=args.workers)
 
         print(f"\nValidation label conversion complete!")
-        print(f"Successfully converted {success_count_val} out of {total_count_val} labels")
+        print(f"Validation labels: {summary_val}")
     else:
         print(f"Warning: Validation labels directory not found at {val_original_labels_path}. Skipping validation label conversion.")
 
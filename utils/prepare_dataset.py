@@ -1,10 +1,24 @@
 import os
-import shutil
+import sys
+import argparse
 from pathlib import Path
 import random
 import cv2
 import numpy as np
 
+# Make the shared vehicle_detection package importable when run as a script
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.dataset_audit import audit_label_dir
+from vehicle_detection.dataset_split import MODES, split_dataset as run_split
+from vehicle_detection.dedup import find_clusters, list_images
+from vehicle_detection.detections import Detections
+from vehicle_detection.evaluation import labels_to_xyxy
+from vehicle_detection.image_cache import ImageCache, cache_paths, normalized_to_letterbox
+from vehicle_detection.label_store import LabelStore, parse_yolo_text, store_path_for, write_label_store
+from vehicle_detection.render import Renderer
+
 def create_directory_structure():
     """Create the necessary directory structure for the dataset"""
     directories = [
@@ -16,110 +30,120 @@ def create_directory_structure():
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
 
-def split_dataset(source_dir, train_ratio=0.8):
-    """Split dataset into training and validation sets"""
-    source_dir = Path(source_dir)
-    image_files = list(source_dir.glob('*.jpg')) + list(source_dir.glob('*.png'))
-    random.shuffle(image_files)
-    
-    split_idx = int(len(image_files) * train_ratio)
-    train_files = image_files[:split_idx]
-    val_files = image_files[split_idx:]
-    
-    # Copy images and labels
-    for img_path in train_files:
-        # Copy image
-        shutil.copy2(img_path, 'data/images/train')
-        # Copy corresponding label if exists
-        label_path = img_path.with_suffix('.txt')
-        if label_path.exists():
-            shutil.copy2(label_path, 'data/labels/train')
-    
-    for img_path in val_files:
-        # Copy image
-        shutil.copy2(img_path, 'data/images/val')
-        # Copy corresponding label if exists
-        label_path = img_path.with_suffix('.txt')
-        if label_path.exists():
-            shutil.copy2(label_path, 'data/labels/val')
+def split_dataset(source_dir, train_ratio=0.8, mode='hardlink', seed=0, workers=8, dedup_thres=None):
+    """Split dataset into training and validation sets.
+
+    Images are assigned by a seeded hash of their name, so re-running after new
+    images arrive only places the new files. ``mode`` picks how files appear in
+    data/images: 'hardlink', 'symlink', 'reflink', 'copy', or 'list' to write
+    data/train.txt and data/val.txt instead of placing files. Labels are always
+    copied into data/labels, since they are rewritten there.
+    With ``dedup_thres``, near-duplicate images (perceptual hashes within that
+    many bits) are hashed by cluster instead, so no cluster straddles the split.
+    """
+    group_key = None
+    if dedup_thres is not None:
+        clusters = find_clusters(list_images([source_dir]), dedup_thres)
+        print(f"Deduplication: {clusters.summary()}")
+        group_key = clusters.group_key
+    summary = run_split(source_dir, 'data', train_ratio=train_ratio, seed=seed, mode=mode, workers=workers,
+                        group_key=group_key)
+    print(f"Split dataset: {summary}")
+    return summary
+
+def validate_labels(workers=None):
+    """Audit label files, fixing only those that need it.
 
-def validate_labels():
-    """Validate label files and convert to YOLO format if needed"""
+    Malformed lines and duplicate or empty boxes are dropped and boxes reaching
+    outside the image are clipped; files without problems are not touched.
+    Also packs each split into ``data/labels/<split>.labelpack`` so later
+    steps can read all labels from one memory-mapped file.
+    """
     for split in ['train', 'val']:
         label_dir = Path(f'data/labels/{split}')
-        for label_file in label_dir.glob('*.txt'):
-            with open(label_file, 'r') as f:
-                lines = f.readlines()
-            
-            # Convert labels if needed (assuming COCO format)
-            new_lines = []
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) == 5:  # YOLO format
-                    new_lines.append(line)
-                else:  # Convert from COCO format
-                    # Add conversion logic here if needed
-                    pass
-            
-            # Write back converted labels
-            with open(label_file, 'w') as f:
-                f.writelines(new_lines)
+        audit = audit_label_dir(label_dir, Path(f'data/images/{split}'), fix=True, workers=workers)
+        print(audit.summary())
+        
+        per_file = audit.per_file()
+        write_label_store(store_path_for(label_dir), audit.stems,
+                          [classes for classes, _ in per_file], [boxes for _, boxes in per_file])
+
+def visualize_dataset(split='train', num_samples=5, cache_size=480):
+    """Visualize random samples from the dataset with bounding boxes.
 
-def visualize_dataset(split='train', num_samples=5):
-    """Visualize random samples from the dataset with bounding boxes"""
+    If an image cache of ``cache_size`` was built for the split, samples are
+    drawn on the cached letterboxed images instead of decoding the originals.
+    """
     image_dir = Path(f'data/images/{split}')
     label_dir = Path(f'data/labels/{split}')
+    cache = ImageCache(image_dir, cache_size) if all(p.exists() for p in cache_paths(image_dir, cache_size)) else None
+    
+    # Prefer the packed label store over parsing one text file per image
+    store_path = store_path_for(label_dir)
+    store = LabelStore(store_path) if store_path.exists() else None
+    
+    renderer = Renderer(load_class_map().names, show_confidence=False)
     
     image_files = list(image_dir.glob('*.jpg')) + list(image_dir.glob('*.png'))
     samples = random.sample(image_files, min(num_samples, len(image_files)))
     
     for img_path in samples:
-        # Read image
-        img = cv2.imread(str(img_path))
-        if img is None:
-            continue
-        
         # Read labels
-        label_path = label_dir / img_path.with_suffix('.txt').name
-        if not label_path.exists():
-            continue
+        if store is not None:
+            if img_path.stem not in store:
+                continue
+            classes, boxes = store.get(img_path.stem)
+        else:
+            label_path = label_dir / img_path.with_suffix('.txt').name
+            if not label_path.exists():
+                continue
+            with open(label_path, 'r') as f:
+                classes, boxes = parse_yolo_text(f.read())
         
-        with open(label_path, 'r') as f:
-            lines = f.readlines()
+        # Read image and convert normalized coordinates to pixel coordinates for all boxes at once
+        cached, meta = cache.get(img_path.stem) if cache is not None else (None, None)
+        if cached is not None:
+            img = np.array(cached)
+            xyxy = normalized_to_letterbox(boxes, meta)
+        else:
+            img = cv2.imread(str(img_path))
+            if img is None:
+                continue
+            xyxy = labels_to_xyxy(boxes, img.shape)
         
-        # Draw bounding boxes
-        h, w = img.shape[:2]
-        for line in lines:
-            cls, x_center, y_center, width, height = map(float, line.strip().split())
-            
-            # Convert normalized coordinates to pixel coordinates
-            x1 = int((x_center - width/2) * w)
-            y1 = int((y_center - height/2) * h)
-            x2 = int((x_center + width/2) * w)
-            y2 = int((y_center + height/2) * h)
-            
-            # Draw rectangle
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            # Add label
-            class_name = 'car' if cls == 0 else 'truck'
-            cv2.putText(img, class_name, (x1, y1 - 10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        # Draw bounding boxes and class names in one pass
+        renderer.draw(img, Detections(xyxy, np.ones(len(classes)), classes))
         
         # Save visualization
         output_dir = Path('data/visualizations')
         output_dir.mkdir(exist_ok=True)
         cv2.imwrite(str(output_dir / f'{split}_{img_path.name}'), img)
 
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', type=str, default=None, help='Dataset directory (prompted for if omitted)')
+    parser.add_argument('--mode', choices=MODES, default='hardlink', help='How split files are materialized')
+    parser.add_argument('--train-ratio', type=float, default=0.8, help='Fraction of images assigned to train')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the deterministic split')
+    parser.add_argument('--workers', type=int, default=8, help='Threads used to place files')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Keep near-duplicate images (e.g. augmented exports of one frame) in the same split')
+    parser.add_argument('--dedup-thres', type=int, default=6,
+                        help='Maximum perceptual-hash distance in bits between near-duplicates')
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+
     # Create directory structure
     create_directory_structure()
     
     # Ask for source directory
-    source_dir = input("Enter the path to your dataset directory: ")
+    source_dir = args.source or input("Enter the path to your dataset directory: ")
     if os.path.exists(source_dir):
         # Split dataset
-        split_dataset(source_dir)
+        split_dataset(source_dir, args.train_ratio, args.mode, args.seed, args.workers,
+                      args.dedup_thres if args.dedup else None)
         
         # Validate labels
         validate_labels()
@@ -0,0 +1,5 @@
+"""Shared building blocks for the vehicle detection scripts.
+
+Kept separate from ``utils/`` so it never shadows the ``utils`` package that
+YOLOv5 imports when a model is loaded through torch.hub.
+"""
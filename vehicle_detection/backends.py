@@ -0,0 +1,85 @@
+"""CPU inference backends for trained YOLOv5 weights.
+
+``best.pt`` is exported once; the exported files are written next to it and
+loaded through the same torch.hub ``custom`` entry point as the PyTorch
+weights, which picks the runtime from the file suffix:
+
+- ``pytorch``: eager fp32 ``best.pt``
+- ``torchscript``: traced ``best.torchscript``; its batch size is fixed at export,
+  so ``models.load_model`` feeds it batches of exactly that size
+- ``onnx``: ``best.onnx`` on ONNX Runtime, with dynamic batch and image size
+- ``int8``: ``best.int8.onnx``, the ONNX model with weights dynamically
+  quantized to int8 (PyTorch's dynamic quantization only covers Linear/LSTM
+  layers, which YOLOv5 does not use, so this is done in ONNX Runtime instead)
+
+    python -m vehicle_detection.backends yolov5/runs/train/exp33/weights/best.pt
+"""
+import argparse
+import json
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+BACKENDS = ('pytorch', 'torchscript', 'onnx', 'int8')
+SUFFIXES = {'torchscript': '.torchscript', 'onnx': '.onnx', 'int8': '.int8.onnx'}
+
+
+def backend_path(weights, backend):
+    """Weights file for ``backend``: ``best.pt`` -> ``best.onnx``, ``best.int8.onnx``, ..."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    weights = Path(weights)
+    if backend == 'pytorch':
+        return weights
+    return weights.parent / f'{weights.stem}{SUFFIXES[backend]}'
+
+
+def torchscript_batch_size(path):
+    """Batch size a YOLOv5 TorchScript export was traced at, from the input shape it embeds (1 if absent)"""
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            if name.endswith('/extra/config.txt'):
+                return int(json.loads(archive.read(name))['shape'][0])
+    return 1
+
+
+def export_weights(weights, backends=('torchscript', 'onnx', 'int8'), img_size=640, batch_size=1,
+                   yolov5_dir='yolov5'):
+    """Export ``weights`` with YOLOv5's ``export.py`` (and quantize for ``int8``); returns the paths"""
+    include = []
+    if 'torchscript' in backends:
+        include.append('torchscript')
+    if 'onnx' in backends or 'int8' in backends:
+        include.append('onnx')
+    if include:
+        cmd = [sys.executable, str(Path(yolov5_dir) / 'export.py'), '--weights', str(weights),
+               '--imgsz', str(img_size), '--batch-size', str(batch_size), '--device', 'cpu', '--include', *include]
+        if 'onnx' in include:
+            cmd.append('--dynamic')
+        subprocess.run(cmd, check=True)
+
+    if 'int8' in backends:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(backend_path(weights, 'onnx')), str(backend_path(weights, 'int8')),
+                         weight_type=QuantType.QUInt8)
+    return {backend: backend_path(weights, backend) for backend in backends}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('weights', help='Trained PyTorch weights (best.pt)')
+    parser.add_argument('--backends', nargs='+', default=['torchscript', 'onnx', 'int8'],
+                        choices=BACKENDS[1:], help='Formats to export')
+    parser.add_argument('--img-size', type=int, default=640, help='Input size of the traced TorchScript model')
+    parser.add_argument('--batch-size', type=int, default=1, help='Batch size of the traced TorchScript model')
+    parser.add_argument('--yolov5-dir', type=str, default='yolov5', help='Local YOLOv5 checkout with export.py')
+    args = parser.parse_args()
+
+    for backend, path in export_weights(args.weights, args.backends, args.img_size, args.batch_size,
+                                        args.yolov5_dir).items():
+        print(f"{backend:<12} {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""Background detection over a batch of uploaded images.
+
+A ``BatchJob`` runs ``run_pipeline`` on a worker thread, so decoding happens on
+a thread pool and the model is called once per batch, while the caller (the
+Streamlit page) polls ``completed`` to show results as they arrive. Raw,
+unthresholded detections are kept per image; thresholding, aggregation and
+exports are done afterwards, so changing the threshold needs no new model calls.
+"""
+import csv
+import io
+import json
+import threading
+import zipfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from vehicle_detection.pipeline import run_pipeline
+
+IMG_FORMATS = ['.jpg', '.jpeg', '.png']
+
+
+class Upload:
+    """An uploaded image file: its name and encoded bytes"""
+
+    __slots__ = ('name', 'data')
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+
+    def __str__(self):
+        return self.name
+
+
+def expand_uploads(files):
+    """``Upload`` objects for uploaded files, with ``.zip`` archives expanded to the images inside"""
+    uploads = []
+    for f in files:
+        name, data = f.name, f.getvalue()
+        if Path(name).suffix.lower() == '.zip':
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and Path(info.filename).suffix.lower() in IMG_FORMATS:
+                        uploads.append(Upload(info.filename, archive.read(info)))
+        elif Path(name).suffix.lower() in IMG_FORMATS:
+            uploads.append(Upload(name, data))
+    return uploads
+
+
+def decode_upload(upload):
+    """RGB array of an upload, or None if it cannot be decoded"""
+    img = cv2.imdecode(np.frombuffer(upload.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return None if img is None else cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+class BatchJob:
+    """Detect vehicles in ``uploads`` on a background thread.
+
+    ``infer(imgs)`` takes a list of RGB arrays and returns one ``Detections``
+    per image. ``completed`` grows with ``(upload, detections)`` pairs in
+    completion order and can be read while the job runs.
+    """
+
+    def __init__(self, uploads, infer, batch_size=8, workers=4):
+        self.uploads = uploads
+        self.completed = []
+        self.error = None
+        self.stats = None
+        self._infer = infer
+        self._batch_size = batch_size
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def done(self):
+        return not self._thread.is_alive()
+
+    @property
+    def progress(self):
+        return len(self.completed) / len(self.uploads) if self.uploads else 1.0
+
+    def results(self):
+        """Snapshot of the ``(upload, detections)`` pairs completed so far"""
+        with self._lock:
+            return list(self.completed)
+
+    def _handle(self, upload, img, detections):
+        with self._lock:
+            self.completed.append((upload, detections))
+
+    def _run(self):
+        try:
+            self.stats = run_pipeline(self.uploads, self._infer, self._handle, batch_size=self._batch_size,
+                                      decode_workers=self._workers, encode_workers=1, load=decode_upload)
+        except Exception as e:
+            self.error = e
+
+
+def aggregate_counts(results, conf_thres, classes):
+    """Detections per class id across all images, as an array indexed by class id"""
+    counts = np.zeros(max(classes) + 1, dtype=np.int64)
+    for _, detections in results:
+        counts += detections.filter(conf_thres, classes).class_counts(minlength=len(counts))[:len(counts)]
+    return counts
+
+
+def detection_rows(results, conf_thres, class_names):
+    """One dict per detection: image, class, confidence and xyxy pixel box"""
+    rows = []
+    for upload, detections in results:
+        detections = detections.filter(conf_thres, list(class_names))
+        for det in detections.to_dicts():
+            x1, y1, x2, y2 = det['bbox']
+            rows.append({'image': upload.name, 'class': class_names[det['class']],
+                         'confidence': round(det['confidence'], 4),
+                         'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2})
+    return rows
+
+
+def rows_to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=['image', 'class', 'confidence', 'x1', 'y1', 'x2', 'y2'])
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def rows_to_json(rows):
+    return json.dumps(rows, indent=2)
+
+
+def annotated_zip(results, conf_thres, class_names, draw):
+    """Zip of annotated JPEGs; ``draw(img, detections, class_names)`` draws on a BGR image"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for upload, detections in results:
+            img = cv2.imdecode(np.frombuffer(upload.data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                continue
+            img = draw(img, detections.filter(conf_thres, list(class_names)), class_names)
+            ok, encoded = cv2.imencode('.jpg', img)
+            if ok:
+                archive.writestr(str(Path(upload.name).with_suffix('.jpg')), encoded.tobytes())
+    return buffer.getvalue()
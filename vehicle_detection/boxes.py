@@ -0,0 +1,119 @@
+import numpy as np
+
+
+def box_area(boxes):
+    """Areas of ``(n, 4)`` xyxy boxes"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between ``(n, 4)`` and ``(m, 4)`` xyxy boxes as an ``(n, m)`` array"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    # One 2-D array per coordinate keeps the temporaries at (n, m)
+    inter_w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    np.clip(inter_w, 0, None, out=inter_w)
+    np.clip(inter_h, 0, None, out=inter_h)
+    inter = inter_w * inter_h
+    union = box_area(a)[:, None] + box_area(b)[None, :] - inter
+    np.maximum(union, 1e-9, out=union)
+    return inter / union
+
+
+def xyxy_to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32)
+    out = np.empty_like(boxes)
+    out[:, 0] = (boxes[:, 0] + boxes[:, 2]) / 2
+    out[:, 1] = (boxes[:, 1] + boxes[:, 3]) / 2
+    out[:, 2] = boxes[:, 2] - boxes[:, 0]
+    out[:, 3] = boxes[:, 3] - boxes[:, 1]
+    return out
+
+
+def cxcywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32)
+    out = np.empty_like(boxes)
+    out[:, :2] = boxes[:, :2] - boxes[:, 2:4] / 2
+    out[:, 2:] = boxes[:, :2] + boxes[:, 2:4] / 2
+    return out
+
+
+def greedy_match(scores, threshold):
+    """Match rows to columns by descending score, one-to-one.
+
+    Only pairs with ``scores >= threshold`` are considered. Returns matched
+    ``(rows, cols)`` index arrays.
+    """
+    rows, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows = np.zeros(scores.shape[0], dtype=bool)
+    used_cols = np.zeros(scores.shape[1], dtype=bool)
+    matched_rows, matched_cols = [], []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if not used_rows[r] and not used_cols[c]:
+            used_rows[r] = used_cols[c] = True
+            matched_rows.append(r)
+            matched_cols.append(c)
+    return np.asarray(matched_rows, dtype=np.int64), np.asarray(matched_cols, dtype=np.int64)
+
+
+def ios_matrix(a, b):
+    """Pairwise intersection over the smaller box's area, ``(n, m)``"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    inter_w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    inter_h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    np.clip(inter_w, 0, None, out=inter_w)
+    np.clip(inter_h, 0, None, out=inter_h)
+    inter = inter_w * inter_h
+    smaller = np.minimum(box_area(a)[:, None], box_area(b)[None, :])
+    np.maximum(smaller, 1e-9, out=smaller)
+    return inter / smaller
+
+
+def merge_boxes(boxes, scores, class_ids, thres=0.5, metric='iou', fuse=False, fusable=None):
+    """Class-aware greedy NMS, or non-maximum merging with ``fuse=True``.
+
+    The overlap matrix is computed once; each kept box then suppresses its
+    overlapping lower-scored boxes of the same class with one vector
+    operation. With ``fuse`` a kept box grows to the union of the boxes it
+    suppresses, which rejoins objects cut in two by a tile border. ``fusable``
+    optionally marks the boxes that may have been cut: only pairs with at
+    least one of them are compared by ``metric`` and fused, other pairs fall
+    back to plain IoU suppression. Returns the (possibly fused) boxes and the
+    indices of the kept rows.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    boxes_sorted = boxes[order]
+    classes_sorted = np.asarray(class_ids)[order]
+    overlap = (ios_matrix if metric == 'ios' else iou_matrix)(boxes_sorted, boxes_sorted)
+    pairs = None
+    if fusable is not None:
+        fusable_sorted = np.asarray(fusable, dtype=bool)[order]
+        pairs = fusable_sorted[:, None] | fusable_sorted[None, :]
+        if metric != 'iou':
+            overlap = np.where(pairs, overlap, iou_matrix(boxes_sorted, boxes_sorted))
+    overlap[classes_sorted[:, None] != classes_sorted[None, :]] = 0.0
+    over = overlap > thres
+
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    fused = []
+    for i in range(len(order)):
+        if suppressed[i]:
+            continue
+        group = over[i] & ~suppressed
+        group[i] = True
+        suppressed |= group
+        keep.append(i)
+        if fuse:
+            if pairs is not None:
+                group &= pairs[i]
+                group[i] = True
+            members = boxes_sorted[group]
+            fused.append(np.concatenate([members[:, :2].min(axis=0), members[:, 2:].max(axis=0)]))
+    keep = order[np.asarray(keep, dtype=np.int64)]
+    out_boxes = np.asarray(fused, dtype=np.float32).reshape(-1, 4) if fuse else boxes[keep]
+    return out_boxes, keep
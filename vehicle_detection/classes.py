@@ -0,0 +1,104 @@
+"""Class registry: our class names and how the original dataset's classes map onto them.
+
+Read from the training data YAML (``data/dataset.yaml``, or the file named by
+``$VEHICLE_CLASSES``)::
+
+    names: ['car', 'truck', 'bus', 'ambulance', 'motorbike', 'bicycle']
+    source: ../trafic_data/data_1.yaml   # YAML with the original class names
+    mapping:                             # original class -> ours; others are dropped
+      car: car
+      truck: truck
+
+Mapping keys and values are class names or ids. Without ``mapping``, every
+original class maps to our class of the same name. The mapping is compiled to
+a lookup table, so a whole array of original ids is remapped by one indexing
+operation.
+"""
+import functools
+import os
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+DEFAULT_CONFIG = Path(__file__).resolve().parent.parent / 'data' / 'dataset.yaml'
+ENV_VAR = 'VEHICLE_CLASSES'
+
+
+def lookup_table(mapping):
+    """``{original id: our id}`` as an int array indexed by original id, -1 where unmapped"""
+    lut = np.full(max(mapping, default=-1) + 1, -1, dtype=np.int64)
+    lut[list(mapping)] = list(mapping.values())
+    return lut
+
+
+def remap(lut, class_ids):
+    """Look up an array of original ids in ``lut``; -1 for ids it does not map"""
+    class_ids = np.asarray(class_ids, dtype=np.int64)
+    remapped = np.full(class_ids.shape, -1, dtype=np.int64)
+    valid = (class_ids >= 0) & (class_ids < len(lut))
+    remapped[valid] = lut[class_ids[valid]]
+    return remapped
+
+
+class ClassMap:
+    """Our class names plus the compiled ``original id -> our id`` mapping"""
+
+    def __init__(self, names, mapping=None, source_names=None):
+        self.names = list(names)
+        self.source_names = list(source_names or [])
+        self.mapping = {int(k): int(v) for k, v in (mapping or {}).items()}
+        self.lut = lookup_table(self.mapping)
+
+    def __len__(self):
+        return len(self.names)
+
+    def name(self, cls):
+        return self.names[cls] if 0 <= cls < len(self.names) else str(cls)
+
+    def remap(self, class_ids):
+        """Our ids for an array of original ids; -1 for classes that are not mapped"""
+        return remap(self.lut, class_ids)
+
+    def remap_labels(self, class_ids, boxes):
+        """``(class_ids, boxes)`` with original ids remapped and unmapped boxes dropped"""
+        remapped = self.remap(class_ids)
+        keep = remapped >= 0
+        return remapped[keep], np.asarray(boxes).reshape(-1, 4)[keep]
+
+    @classmethod
+    def from_yaml(cls, path):
+        path = Path(path)
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        names = config['names']
+        names = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+        source_names = []
+        if config.get('source'):
+            with open(path.parent / config['source'], 'r') as f:
+                source_names = yaml.safe_load(f)['names']
+            source_names = ([source_names[i] for i in sorted(source_names)] if isinstance(source_names, dict)
+                            else list(source_names))
+        mapping = config.get('mapping')
+        if mapping is None:
+            mapping = {name: name for name in source_names if name in names}
+        mapping = {_class_id(k, source_names, path): _class_id(v, names, path) for k, v in mapping.items()}
+        return cls(names, mapping, source_names)
+
+
+def _class_id(key, names, path):
+    if isinstance(key, int):
+        return key
+    if key not in names:
+        raise ValueError(f"{path}: unknown class {key!r}")
+    return names.index(key)
+
+
+@functools.lru_cache(maxsize=None)
+def _load(path):
+    return ClassMap.from_yaml(path)
+
+
+def load_class_map(path=None):
+    """The registry from ``path``, ``$VEHICLE_CLASSES`` or ``data/dataset.yaml``, loaded once per process"""
+    return _load(str(Path(path or os.environ.get(ENV_VAR) or DEFAULT_CONFIG).resolve()))
@@ -0,0 +1,265 @@
+"""Parallel audit (and optional repair) of YOLO label directories.
+
+Label files are parsed in chunks on a process pool. Each chunk is checked with
+array operations over all of its boxes at once:
+
+- malformed lines (not 5 fields, non-numeric or non-finite values)
+- boxes reaching outside the image (clipped to [0, 1] when fixing)
+- boxes with no area once clipped (dropped)
+- exact duplicates of another box of the same class in the same file (dropped)
+
+With ``fix=True`` only files that have at least one of these problems are
+rewritten, and lines that need no change keep their original text. The report
+also covers class histograms, box size/aspect distributions, boxes per image,
+and orphans: images without a label file and label files without an image.
+
+    python -m vehicle_detection.dataset_audit trafic_data/train/labels data/labels/train --json audit.json
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from vehicle_detection.boxes import cxcywh_to_xyxy, xyxy_to_cxcywh
+from vehicle_detection.label_store import format_yolo_lines
+
+IMG_FORMATS = ['.jpg', '.jpeg', '.png']
+ISSUES = ('malformed', 'out_of_range', 'degenerate', 'duplicate')
+TOLERANCE = 1e-6
+DEFAULT_LABEL_DIRS = ['trafic_data/train/labels', 'trafic_data/valid/labels', 'data/labels/train', 'data/labels/val']
+
+
+def image_dir_for(label_dir):
+    """YOLOv5 layout: ``.../labels/<split>`` -> ``.../images/<split>``, ``<split>/labels`` -> ``<split>/images``"""
+    parts = list(Path(label_dir).parts)
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] == 'labels':
+            parts[i] = 'images'
+            return Path(*parts)
+    return Path(label_dir)
+
+
+def _parse(paths):
+    """Flat per-line arrays over a chunk of files"""
+    file_idx, tokens, texts = [], [], []
+    malformed = np.zeros(len(paths), dtype=np.int64)
+    for i, path in enumerate(paths):
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            parts = line.split()
+            if not parts:
+                continue
+            if len(parts) != 5:
+                malformed[i] += 1
+                continue
+            file_idx.append(i)
+            tokens.extend(parts)
+            texts.append(line)
+    file_idx = np.asarray(file_idx, dtype=np.int64)
+
+    # Convert the whole chunk in one call; only fall back to per-line parsing if a token is not a number
+    try:
+        values = np.asarray(tokens, dtype=np.float64).reshape(-1, 5)
+        valid = np.isfinite(values).all(axis=1)
+    except ValueError:
+        values = np.zeros((len(texts), 5), dtype=np.float64)
+        valid = np.zeros(len(texts), dtype=bool)
+        for row, line in enumerate(texts):
+            try:
+                values[row] = [float(v) for v in line.split()]
+                valid[row] = np.isfinite(values[row]).all()
+            except ValueError:
+                pass
+    if not valid.all():
+        malformed += np.bincount(file_idx[~valid], minlength=len(paths))
+        file_idx, values = file_idx[valid], values[valid]
+        texts = [text for text, ok in zip(texts, valid.tolist()) if ok]
+    return file_idx, values, texts, malformed
+
+
+def _audit_chunk(job):
+    paths, fix = job
+    n = len(paths)
+    file_idx, values, texts, malformed = _parse(paths)
+    classes = values[:, 0].astype(np.int64)
+    boxes = values[:, 1:]
+
+    xyxy = cxcywh_to_xyxy(boxes.astype(np.float32)).astype(np.float64)
+    out_of_range = ((xyxy < -TOLERANCE) | (xyxy > 1 + TOLERANCE)).any(axis=1)
+    clipped = np.clip(xyxy, 0.0, 1.0)
+    degenerate = (clipped[:, 2] - clipped[:, 0] <= TOLERANCE) | (clipped[:, 3] - clipped[:, 1] <= TOLERANCE)
+
+    # A row is a duplicate if an earlier row of the same file has the same class and (clipped) box
+    key = np.column_stack([file_idx, classes, np.round(clipped * 1e6).astype(np.int64)])
+    duplicate = np.ones(len(key), dtype=bool)
+    if len(key):
+        _, first = np.unique(key, axis=0, return_index=True)
+        duplicate[first] = False
+    duplicate &= ~degenerate
+
+    keep = ~degenerate & ~duplicate
+    fixed = np.where(out_of_range[:, None], xyxy_to_cxcywh(clipped.astype(np.float32)), boxes)
+    counts = {
+        'malformed': malformed,
+        'out_of_range': np.bincount(file_idx[out_of_range & keep], minlength=n),
+        'degenerate': np.bincount(file_idx[degenerate], minlength=n),
+        'duplicate': np.bincount(file_idx[duplicate], minlength=n),
+    }
+    needs_fix = sum(counts.values()) > 0
+
+    fixed_files = []
+    if fix:
+        for i in np.flatnonzero(needs_fix).tolist():
+            rows = np.flatnonzero((file_idx == i) & keep)
+            lines = [texts[r] + '\n' if not out_of_range[r]
+                     else format_yolo_lines(classes[r:r + 1], fixed[r:r + 1]) for r in rows.tolist()]
+            tmp_path = f'{paths[i]}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, paths[i])
+            fixed_files.append(str(paths[i]))
+
+    return {
+        'boxes_per_file': np.bincount(file_idx[keep], minlength=n),
+        'classes': classes[keep].astype(np.int32),
+        'boxes': fixed[keep].astype(np.float32),
+        'issues': counts,
+        'needs_fix': needs_fix,
+        'fixed_files': fixed_files,
+    }
+
+
+def _percentiles(values, points=(1, 5, 50, 95, 99)):
+    if not len(values):
+        return {}
+    return {f'p{p}': round(float(v), 6) for p, v in zip(points, np.percentile(values, points))}
+
+
+class LabelDirAudit:
+    """Result of auditing one label directory.
+
+    ``classes``/``boxes`` hold the labels as they are after fixing (or would be,
+    when auditing without ``fix``), concatenated in ``stems`` order and split
+    per file by ``boxes_per_file``.
+    """
+
+    def __init__(self, label_dir, image_dir, stems, boxes_per_file, classes, boxes, issues, needs_fix,
+                 fixed_files, orphan_images, orphan_labels, seconds):
+        self.label_dir = Path(label_dir)
+        self.image_dir = Path(image_dir)
+        self.stems = stems
+        self.boxes_per_file = boxes_per_file
+        self.classes = classes
+        self.boxes = boxes
+        self.issues = issues
+        self.needs_fix = needs_fix
+        self.fixed_files = fixed_files
+        self.orphan_images = orphan_images
+        self.orphan_labels = orphan_labels
+        self.seconds = seconds
+
+    def per_file(self):
+        """``(classes, boxes)`` per label file, in ``stems`` order"""
+        splits = np.cumsum(self.boxes_per_file)[:-1]
+        return list(zip(np.split(self.classes, splits), np.split(self.boxes, splits)))
+
+    def to_dict(self):
+        w, h = self.boxes[:, 2], self.boxes[:, 3]
+        aspect = w / np.maximum(h, TOLERANCE)
+        classes, counts = np.unique(self.classes, return_counts=True)
+        return {
+            'label_dir': str(self.label_dir),
+            'image_dir': str(self.image_dir),
+            'files': len(self.stems),
+            'boxes': int(len(self.classes)),
+            'empty_files': int((self.boxes_per_file == 0).sum()),
+            'boxes_per_file': {'mean': round(float(self.boxes_per_file.mean()), 3) if len(self.stems) else 0.0,
+                               'max': int(self.boxes_per_file.max()) if len(self.stems) else 0},
+            'class_histogram': {int(c): int(n) for c, n in zip(classes, counts)},
+            'width': _percentiles(w),
+            'height': _percentiles(h),
+            'area': _percentiles(w * h),
+            'aspect_ratio': _percentiles(aspect),
+            'issues': {name: int(self.issues[name].sum()) for name in ISSUES},
+            'files_needing_fix': int(self.needs_fix.sum()),
+            'files_fixed': len(self.fixed_files),
+            'orphan_images': len(self.orphan_images),
+            'orphan_labels': len(self.orphan_labels),
+            'seconds': round(self.seconds, 3),
+        }
+
+    def summary(self):
+        d = self.to_dict()
+        lines = [f"{d['label_dir']}: {d['files']} files, {d['boxes']} boxes "
+                 f"({d['empty_files']} empty, max {d['boxes_per_file']['max']} per file) in {d['seconds']:.2f}s"]
+        lines.append("  classes: " + ', '.join(f'{c}: {n}' for c, n in d['class_histogram'].items()))
+        for name in ('width', 'height', 'aspect_ratio'):
+            if d[name]:
+                lines.append(f"  {name:<12} " + '  '.join(f'{p} {v:.4f}' for p, v in d[name].items()))
+        lines.append("  issues: " + ', '.join(f'{name} {n}' for name, n in d['issues'].items()) +
+                     f"; {d['files_needing_fix']} files need fixing, {d['files_fixed']} fixed")
+        lines.append(f"  orphans: {d['orphan_images']} images without labels in {d['image_dir']}, "
+                     f"{d['orphan_labels']} labels without images")
+        return '\n'.join(lines)
+
+
+def audit_label_dir(label_dir, image_dir=None, fix=False, workers=None):
+    """Audit every ``*.txt`` in ``label_dir`` (and rewrite broken files with ``fix``)"""
+    start = time.perf_counter()
+    label_dir = Path(label_dir)
+    image_dir = Path(image_dir) if image_dir else image_dir_for(label_dir)
+    files = sorted(label_dir.glob('*.txt'))
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-len(files) // (workers * 4)))
+    jobs = [(files[i:i + chunk], fix) for i in range(0, len(files), chunk)]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_audit_chunk, jobs))
+    else:
+        parts = [_audit_chunk(job) for job in jobs]
+
+    def gather(key, dtype, shape=(0,)):
+        arrays = [part[key] for part in parts]
+        return np.concatenate(arrays) if arrays else np.zeros(shape, dtype=dtype)
+
+    label_stems = [f.stem for f in files]
+    image_stems = ({p.stem for p in image_dir.iterdir() if p.suffix.lower() in IMG_FORMATS}
+                   if image_dir.is_dir() else set())
+    labels_set = set(label_stems)
+    return LabelDirAudit(
+        label_dir, image_dir, label_stems,
+        gather('boxes_per_file', np.int64), gather('classes', np.int32), gather('boxes', np.float32, (0, 4)),
+        {name: np.concatenate([part['issues'][name] for part in parts]) if parts else np.zeros(0, dtype=np.int64)
+         for name in ISSUES},
+        gather('needs_fix', bool),
+        [path for part in parts for path in part['fixed_files']],
+        sorted(image_stems - labels_set), sorted(labels_set - image_stems),
+        time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('label_dirs', nargs='*', default=None,
+                        help=f"Label directories (default: those of {', '.join(DEFAULT_LABEL_DIRS)} that exist)")
+    parser.add_argument('--fix', action='store_true', help='Rewrite files with malformed, out-of-range or duplicate boxes')
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: one per CPU)')
+    parser.add_argument('--json', type=str, default=None, help='Write the full report as JSON here')
+    args = parser.parse_args()
+
+    label_dirs = args.label_dirs or [d for d in DEFAULT_LABEL_DIRS if Path(d).is_dir()]
+    audits = [audit_label_dir(label_dir, fix=args.fix, workers=args.workers) for label_dir in label_dirs]
+    for audit in audits:
+        print(audit.summary())
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([audit.to_dict() for audit in audits], f, indent=2)
+        print(f"Saved report to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Deterministic train/val split with selectable materialization.
+
+Every image is assigned to a split by hashing ``seed`` and its stem, so the
+assignment of an image never depends on which other images exist. Re-running
+after new images arrive only places the new ones; files already in the right
+split are left alone.
+
+Materialization modes:
+
+- ``hardlink``: link into ``data/images/<split>`` (no extra disk space)
+- ``symlink``: symbolic link to the source file
+- ``reflink``: copy-on-write clone where the filesystem supports it (Btrfs, XFS)
+- ``copy``: plain byte copy
+- ``list``: copy nothing, write ``<split>.txt`` image lists that YOLOv5 accepts
+  as ``train:``/``val:`` entries (labels are then read from beside the images)
+
+``hardlink`` and ``reflink`` fall back to a copy when the filesystem refuses.
+The modes apply to images only. Label ``.txt`` files are always copied: they
+are tiny, and label converters and ``--fix`` rewrite them, which must never
+reach the source dataset through a shared inode or link.
+"""
+import errno
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MODES = ('hardlink', 'symlink', 'reflink', 'copy', 'list')
+SPLITS = ('train', 'val')
+FICLONE = 0x40049409  # Linux ioctl: clone a whole file (reflink)
+
+
+def split_fraction(key, seed=0):
+    """Stable pseudo-random number in [0, 1) for ``key``"""
+    digest = hashlib.blake2b(f'{seed}:{key}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') / 2 ** 64
+
+
+def assign_split(key, train_ratio=0.8, seed=0):
+    return 'train' if split_fraction(key, seed) < train_ratio else 'val'
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def materialize(src, dst, mode):
+    """Place ``src`` at ``dst``; returns the mode actually used"""
+    if mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return mode
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return mode
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+    elif mode == 'reflink':
+        try:
+            _reflink(src, dst)
+            return mode
+        except (OSError, ImportError):
+            if os.path.exists(dst):
+                os.remove(dst)
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def _is_current(src, dst, mode):
+    """Whether ``dst`` already holds ``src`` as placed by ``mode`` (same inode, link target or size/mtime)"""
+    if not os.path.lexists(dst):
+        return False
+    if os.path.islink(dst):
+        return mode == 'symlink' and os.path.realpath(dst) == os.path.realpath(src)
+    src_stat, dst_stat = os.stat(src), os.stat(dst)
+    if (src_stat.st_dev, src_stat.st_ino) == (dst_stat.st_dev, dst_stat.st_ino):
+        # A copy must not share the source's inode (labels linked by an older split)
+        return mode != 'copy'
+    return src_stat.st_size == dst_stat.st_size and int(src_stat.st_mtime) == int(dst_stat.st_mtime)
+
+
+class SplitSummary:
+    def __init__(self):
+        self.counts = {split: 0 for split in SPLITS}
+        self.placed = 0
+        self.unchanged = 0
+        self.moved = 0
+        self.fallback_copies = 0
+
+    def __str__(self):
+        text = (f"train {self.counts['train']}, val {self.counts['val']} images; "
+                f"{self.placed} files placed, {self.unchanged} already in place, {self.moved} removed from the other split")
+        if self.fallback_copies:
+            text += f", {self.fallback_copies} copied because linking was not supported"
+        return text
+
+
+def split_dataset(source_dir, output_dir='data', train_ratio=0.8, seed=0, mode='hardlink', workers=8,
+                  group_key=None):
+    """Split images (and their ``.txt`` labels) in ``source_dir`` into train/val.
+
+    ``group_key(path)`` returns the key hashed for the split decision
+    (default: the image stem); images with the same key land in the same split.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown split mode '{mode}', expected one of {MODES}")
+    source_dir, output_dir = Path(source_dir), Path(output_dir)
+    image_files = sorted(list(source_dir.glob('*.jpg')) + list(source_dir.glob('*.png')))
+    group_key = group_key or (lambda path: path.stem)
+    assignment = {path: assign_split(group_key(path), train_ratio, seed) for path in image_files}
+
+    summary = SplitSummary()
+    for split in assignment.values():
+        summary.counts[split] += 1
+
+    if mode == 'list':
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for split in SPLITS:
+            with open(output_dir / f'{split}.txt', 'w') as f:
+                f.writelines(f'{path.resolve()}\n' for path, s in assignment.items() if s == split)
+        return summary
+
+    for split in SPLITS:
+        (output_dir / 'images' / split).mkdir(parents=True, exist_ok=True)
+        (output_dir / 'labels' / split).mkdir(parents=True, exist_ok=True)
+
+    jobs = []
+    for img_path, split in assignment.items():
+        other = 'val' if split == 'train' else 'train'
+        label_path = img_path.with_suffix('.txt')
+        pairs = [(img_path, 'images', mode)]
+        if label_path.exists():
+            pairs.append((label_path, 'labels', 'copy'))
+        for src, kind, file_mode in pairs:
+            jobs.append((src, output_dir / kind / split / src.name, output_dir / kind / other / src.name, file_mode))
+
+    def place(job):
+        src, dst, stale, file_mode = job
+        moved = False
+        if os.path.lexists(stale):
+            os.remove(stale)
+            moved = True
+        if _is_current(src, dst, file_mode):
+            return 'unchanged', file_mode, moved
+        if os.path.lexists(dst):
+            os.remove(dst)
+        return materialize(src, dst, file_mode), file_mode, moved
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for used, requested, moved in pool.map(place, jobs):
+            summary.moved += moved
+            if used == 'unchanged':
+                summary.unchanged += 1
+            else:
+                summary.placed += 1
+                summary.fallback_copies += used == 'copy' and requested != 'copy'
+    return summary
@@ -0,0 +1,237 @@
+"""Near-duplicate images: perceptual hashes, a multi-index hash table and clusters.
+
+Every image gets a 64-bit DCT perceptual hash (pHash), computed in parallel on
+a process pool from a reduced-resolution decode. Images whose hashes differ in
+at most ``threshold`` bits are near-duplicates, such as augmented exports of
+one source frame, and are joined into clusters.
+
+Neighbors are found with a multi-index hash table rather than by comparing all
+pairs. The 64 bits are cut into ``threshold + 1`` chunks. Two hashes within
+``threshold`` bits must agree exactly on at least one chunk (pigeonhole), so
+only hashes that share a chunk bucket are compared.
+
+    python -m vehicle_detection.dedup trafic_data/train/images trafic_data/valid/images --json dups.json
+    python -m vehicle_detection.dedup trafic_data/train/images --prune-to trafic_data/duplicates
+
+``--prune-to`` moves all but ``--keep`` images of each cluster (with their
+labels) out of the dataset, to a directory from which they can be moved back.
+``utils/prepare_dataset.py --dedup`` keeps each cluster on one side of the
+train/val split.
+"""
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+IMG_FORMATS = ['.jpg', '.jpeg', '.png']
+HASH_BITS = 64
+DEFAULT_THRESHOLD = 6
+
+
+def phash(gray):
+    """64-bit perceptual hash of a grayscale image: signs of the 8x8 lowest DCT frequencies against their median"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _hash_files(paths):
+    hashes = []
+    for path in paths:
+        # JPEGs are decoded at 1/4 scale straight from the DCT coefficients, which is all a 32x32 hash needs
+        gray = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        hashes.append(None if gray is None else phash(gray))
+    return hashes
+
+
+def hash_images(paths, workers=None):
+    """``(hashes, ok)``: uint64 pHash per path and whether the image could be read"""
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-len(paths) // (workers * 4)))
+    chunks = [paths[i:i + chunk] for i in range(0, len(paths), chunk)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = [h for part in pool.map(_hash_files, chunks) for h in part]
+    else:
+        hashes = _hash_files(paths)
+    ok = np.array([h is not None for h in hashes], dtype=bool)
+    return np.array([h or 0 for h in hashes], dtype=np.uint64), ok
+
+
+def hamming(a, b):
+    """Bitwise Hamming distance between uint64 arrays"""
+    x = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x).astype(np.int64)
+    return np.unpackbits(x.reshape(-1, 1).view(np.uint8), axis=1).sum(axis=1).reshape(x.shape).astype(np.int64)
+
+
+def near_pairs(hashes, threshold=DEFAULT_THRESHOLD):
+    """``(i, j, distance)`` for every pair ``i < j`` of distinct hashes within ``threshold`` bits"""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    if not 0 <= threshold < HASH_BITS:
+        raise ValueError(f"threshold must be in [0, {HASH_BITS})")
+    bounds = np.linspace(0, HASH_BITS, threshold + 2).astype(np.int64)
+    candidates = []
+    for lo, hi in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        keys = (hashes >> np.uint64(lo)) & np.uint64((1 << (hi - lo)) - 1)
+        order = np.argsort(keys, kind='stable')
+        starts = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1]])
+        sizes = np.diff(np.r_[starts, len(keys)])
+        for start, size in zip(starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+            members = np.sort(order[start:start + size])
+            i, j = np.triu_indices(size, 1)
+            candidates.append(members[i] * len(hashes) + members[j])
+    if not candidates:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    # A pair agreeing on several chunks is found once per chunk
+    i, j = np.divmod(np.unique(np.concatenate(candidates)), len(hashes))
+    distance = hamming(hashes[i], hashes[j])
+    keep = distance <= threshold
+    return i[keep], j[keep], distance[keep]
+
+
+def connected_components(n, i, j):
+    """Component label per node of an undirected graph given as edge arrays, numbered by first node"""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        new = labels.copy()
+        np.minimum.at(new, i, low)
+        np.minimum.at(new, j, low)
+        new = new[new]
+        if np.array_equal(new, labels):
+            break
+        labels = new
+    return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
+
+class Clusters:
+    """Near-duplicate clusters over ``paths``; ``labels[k]`` is the cluster of ``paths[k]``"""
+
+    def __init__(self, paths, hashes, ok, labels, threshold):
+        self.paths = list(paths)
+        self.hashes = hashes
+        self.ok = ok
+        self.labels = labels
+        self.threshold = threshold
+        self._key = {}
+        for members in self._members():
+            # The smallest stem names the cluster, so the split decision does not depend on list order
+            key = min(self.paths[k].stem for k in members)
+            for k in members:
+                self._key[self.paths[k].resolve()] = key
+
+    def _members(self):
+        order = np.argsort(self.labels, kind='stable')
+        return np.split(order, np.flatnonzero(np.diff(self.labels[order])) + 1) if len(order) else []
+
+    def groups(self):
+        """Clusters of more than one image, as lists of paths sorted by name"""
+        return [sorted((self.paths[k] for k in members), key=lambda p: p.name)
+                for members in self._members() if len(members) > 1]
+
+    def group_key(self, path):
+        """Split key shared by all images of a cluster (``dataset_split.split_dataset(group_key=...)``)"""
+        path = Path(path)
+        return self._key.get(path.resolve(), path.stem)
+
+    def redundant(self, keep=1):
+        """Images beyond the first ``keep`` (by name) of every cluster"""
+        return [path for group in self.groups() for path in group[keep:]]
+
+    def summary(self):
+        groups = self.groups()
+        dups = sum(len(g) for g in groups)
+        text = (f"{len(self.paths)} images, {len(groups)} near-duplicate clusters (<= {self.threshold} bits) "
+                f"covering {dups} images; {dups - len(groups)} could be pruned")
+        unreadable = int((~self.ok).sum())
+        if unreadable:
+            text += f"; {unreadable} unreadable"
+        return text
+
+    def to_dict(self):
+        return {'threshold': self.threshold, 'images': len(self.paths),
+                'clusters': [[str(p) for p in group] for group in self.groups()]}
+
+
+def find_clusters(paths, threshold=DEFAULT_THRESHOLD, workers=None):
+    """Hash ``paths`` and cluster those within ``threshold`` bits of each other (transitively)"""
+    paths = [Path(p) for p in paths]
+    hashes, ok = hash_images(paths, workers)
+    # Identical hashes are one node; only distinct hashes go through the index
+    readable = np.flatnonzero(ok)
+    unique, inverse = np.unique(hashes[readable], return_inverse=True)
+    i, j, _ = near_pairs(unique, threshold)
+    unique_labels = connected_components(len(unique), i, j)
+    labels = np.empty(len(paths), dtype=np.int64)
+    labels[readable] = unique_labels[inverse.reshape(-1)]
+    # Unreadable images are never duplicates of anything
+    labels[~ok] = len(unique) + np.arange(int((~ok).sum()))
+    return Clusters(paths, hashes, ok, labels, threshold)
+
+
+def list_images(dirs):
+    return sorted(p for d in dirs for p in Path(d).iterdir() if p.suffix.lower() in IMG_FORMATS)
+
+
+def label_path_for(img_path):
+    """The YOLO label of an image: beside it, or in the sibling ``labels`` directory"""
+    beside = img_path.with_suffix('.txt')
+    if beside.exists() or img_path.parent.name != 'images':
+        return beside
+    return img_path.parent.parent / 'labels' / f'{img_path.stem}.txt'
+
+
+def prune(paths, target_dir):
+    """Move images and their labels under ``target_dir/{images,labels}``; returns the number of images moved"""
+    target_dir = Path(target_dir)
+    for kind in ('images', 'labels'):
+        (target_dir / kind).mkdir(parents=True, exist_ok=True)
+    for path in paths:
+        label_path = label_path_for(path)
+        shutil.move(str(path), str(target_dir / 'images' / path.name))
+        if label_path.exists():
+            shutil.move(str(label_path), str(target_dir / 'labels' / label_path.name))
+    return len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('image_dirs', nargs='+', help='Image directories, searched together (clusters may span them)')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD,
+                        help='Maximum Hamming distance in bits between near-duplicate hashes')
+    parser.add_argument('--workers', type=int, default=None, help='Processes (default: one per CPU)')
+    parser.add_argument('--json', type=str, default=None, help='Write the clusters as JSON here')
+    parser.add_argument('--prune-to', type=str, default=None,
+                        help='Move all but --keep images of each cluster (and their labels) into this directory')
+    parser.add_argument('--keep', type=int, default=1, help='Images kept per cluster with --prune-to')
+    args = parser.parse_args()
+
+    clusters = find_clusters(list_images(args.image_dirs), args.threshold, args.workers)
+    print(clusters.summary())
+    if len(args.image_dirs) > 1:
+        # Clusters split across directories are leaks between splits
+        spanning = [g for g in clusters.groups() if len({p.parent for p in g}) > 1]
+        print(f"{len(spanning)} clusters span more than one directory")
+        for group in spanning[:10]:
+            print('  ' + ', '.join(map(str, group)))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(clusters.to_dict(), f, indent=2)
+        print(f"Saved clusters to {args.json}")
+    if args.prune_to:
+        moved = prune(clusters.redundant(args.keep), args.prune_to)
+        print(f"Moved {moved} near-duplicate images to {args.prune_to}")
+
+
+if __name__ == '__main__':
+    main()
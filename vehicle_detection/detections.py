@@ -0,0 +1,67 @@
+import numpy as np
+
+
+class Detections:
+    """Columnar detections for one image.
+
+    Boxes (``xyxy``, pixels), confidences and class ids are stored as parallel
+    NumPy arrays so thresholding and counting are single vectorized operations.
+    Per-detection dicts are only built when ``to_dicts()`` is called.
+    ``track_ids`` is set when the detections come from a tracker.
+    """
+
+    __slots__ = ('boxes', 'confidences', 'class_ids', 'track_ids')
+
+    def __init__(self, boxes, confidences, class_ids, track_ids=None):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = np.asarray(confidences, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.int64).reshape(-1)
+        self.track_ids = None if track_ids is None else np.asarray(track_ids, dtype=np.int64).reshape(-1)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0))
+
+    @classmethod
+    def from_pred(cls, pred):
+        """Build from an ``(n, 6)`` YOLOv5 prediction (x1, y1, x2, y2, conf, cls).
+
+        Accepts a torch tensor on any device or an array; tensors are moved to
+        the host with a single transfer instead of one per row.
+        """
+        if hasattr(pred, 'detach'):
+            pred = pred.detach().cpu().numpy()
+        pred = np.asarray(pred, dtype=np.float32).reshape(-1, 6)
+        return cls(pred[:, :4], pred[:, 4], pred[:, 5])
+
+    def __len__(self):
+        return len(self.confidences)
+
+    def __getitem__(self, index):
+        """Select detections with a boolean mask, index array or slice"""
+        track_ids = None if self.track_ids is None else self.track_ids[index]
+        return Detections(self.boxes[index], self.confidences[index], self.class_ids[index], track_ids)
+
+    def filter(self, conf_thres=0.0, classes=None):
+        """Keep detections with confidence >= ``conf_thres`` and, optionally, a class in ``classes``"""
+        mask = self.confidences >= conf_thres
+        if classes is not None:
+            mask &= np.isin(self.class_ids, classes)
+        return self[mask]
+
+    def class_counts(self, minlength=0):
+        """Number of detections per class id, as an array indexed by class id"""
+        return np.bincount(self.class_ids, minlength=minlength)
+
+    def to_dicts(self):
+        """Per-detection dicts in the ``{'bbox', 'confidence', 'class'}`` layout (plus ``'track_id'``)"""
+        dicts = [
+            {'bbox': bbox, 'confidence': conf, 'class': cls}
+            for bbox, conf, cls in zip(self.boxes.astype(np.int64).tolist(),
+                                       self.confidences.tolist(),
+                                       self.class_ids.tolist())
+        ]
+        if self.track_ids is not None:
+            for det, track_id in zip(dicts, self.track_ids.tolist()):
+                det['track_id'] = track_id
+        return dicts
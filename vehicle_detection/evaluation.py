@@ -0,0 +1,298 @@
+"""Detection accuracy against YOLO-format ground truth.
+
+Detections are matched to ground-truth boxes of the same class at each IoU
+threshold (highest IoU first, each box matched at most once), then average
+precision is computed per class with COCO-style 101-point interpolation.
+
+Matching runs once. Every other metric comes from the resulting
+``(n_det, n_iou)`` true-positive table sorted by confidence:
+- per-class AP
+- precision/recall curves
+- a sweep of precision, recall and F1 over all (confidence, match-IoU) threshold pairs
+
+Raising the confidence threshold only cuts that table shorter.
+
+    python detect.py --source trafic_data/valid/images --no-render --save-detections valid.jsonl --conf-thres 0.001
+    python -m vehicle_detection.evaluation valid.jsonl --labels trafic_data/valid/labels --original-ids --json eval.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from vehicle_detection.boxes import cxcywh_to_xyxy, iou_matrix
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.detections import Detections
+from vehicle_detection.label_store import LabelStore, parse_yolo_text, store_path_for
+from vehicle_detection.sinks import read_detections
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_POINTS = np.linspace(0.0, 1.0, 101)
+CONF_POINTS = np.linspace(0.0, 1.0, 101)
+IMG_FORMATS = ['.jpg', '.jpeg', '.png']
+
+
+def read_labels(label_dir):
+    """``get(stem) -> (classes, boxes)`` over a label directory, using its packed store when present"""
+    store_path = store_path_for(label_dir)
+    if store_path.exists():
+        return LabelStore(store_path).get
+
+    def get(stem):
+        path = Path(label_dir) / f'{stem}.txt'
+        if not path.exists():
+            return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32)
+        return parse_yolo_text(path.read_text())
+    return get
+
+
+def labels_to_xyxy(boxes, shape):
+    """Normalized YOLO ``xywh`` labels to pixel ``xyxy`` for an image of ``shape``"""
+    h, w = shape[:2]
+    return cxcywh_to_xyxy(np.asarray(boxes, dtype=np.float32).reshape(-1, 4) * [w, h, w, h])
+
+
+def match_detections(detections, gt_classes, gt_boxes, iou_thresholds=IOU_THRESHOLDS):
+    """``(n_det, n_thresholds)`` bool array: whether each detection is a true positive"""
+    correct = np.zeros((len(detections), len(iou_thresholds)), dtype=bool)
+    if not len(detections) or not len(gt_boxes):
+        return correct
+    iou = iou_matrix(gt_boxes, detections.boxes)
+    iou[np.asarray(gt_classes)[:, None] != detections.class_ids[None, :]] = 0.0
+    for t, thres in enumerate(iou_thresholds):
+        gt_idx, det_idx = np.nonzero(iou >= thres)
+        if not len(gt_idx):
+            continue
+        order = np.argsort(-iou[gt_idx, det_idx], kind='stable')
+        gt_idx, det_idx = gt_idx[order], det_idx[order]
+        _, first = np.unique(det_idx, return_index=True)
+        gt_idx, det_idx = gt_idx[first], det_idx[first]
+        _, first = np.unique(gt_idx, return_index=True)
+        correct[det_idx[first], t] = True
+    return correct
+
+
+def average_precision(recall, precision):
+    """Area under the precision envelope, sampled at 101 recall points"""
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    idx = np.searchsorted(recall, RECALL_POINTS, side='left')
+    return np.concatenate([precision, [0.0]])[idx].mean()
+
+
+class Matches:
+    """One matching pass over a dataset: true-positive flags per detection and IoU threshold, by confidence"""
+
+    def __init__(self, correct, confidences, pred_classes, gt_classes, iou_thresholds):
+        order = np.argsort(-confidences, kind='stable')
+        self.correct = correct[order]
+        self.confidences = confidences[order]
+        self.pred_classes = pred_classes[order]
+        self.iou_thresholds = np.asarray(iou_thresholds)
+        self.classes, self.n_gt = np.unique(gt_classes, return_counts=True)
+
+    @classmethod
+    def collect(cls, samples, iou_thresholds=IOU_THRESHOLDS):
+        """Match ``(detections, gt_classes, gt_boxes_xyxy)`` samples"""
+        correct, confidences, pred_classes, gt_all = [], [], [], []
+        for detections, gt_classes, gt_boxes in samples:
+            correct.append(match_detections(detections, gt_classes, gt_boxes, iou_thresholds))
+            confidences.append(detections.confidences)
+            pred_classes.append(detections.class_ids)
+            gt_all.append(np.asarray(gt_classes, dtype=np.int64))
+        return cls(np.concatenate(correct) if correct else np.zeros((0, len(iou_thresholds)), dtype=bool),
+                   np.concatenate(confidences) if confidences else np.zeros(0, dtype=np.float32),
+                   np.concatenate(pred_classes) if pred_classes else np.zeros(0, dtype=np.int64),
+                   np.concatenate(gt_all) if gt_all else np.zeros(0, dtype=np.int64),
+                   iou_thresholds)
+
+    def sweep(self, conf_thresholds=CONF_POINTS):
+        """Precision, recall and F1 of shape ``(n_classes, n_conf, n_iou)`` for every threshold pair"""
+        shape = (len(self.classes), len(conf_thresholds), len(self.iou_thresholds))
+        precision, recall = np.zeros(shape), np.zeros(shape)
+        conf_thresholds = np.asarray(conf_thresholds)
+        for i, cls in enumerate(self.classes):
+            mask = self.pred_classes == cls
+            tp_cum = np.concatenate([np.zeros((1, shape[2])), np.cumsum(self.correct[mask], axis=0)])
+            # Detections kept at each confidence threshold form a prefix of the sorted list
+            kept = np.searchsorted(-self.confidences[mask], -conf_thresholds, side='right')
+            tp = tp_cum[kept]
+            precision[i] = tp / np.maximum(kept, 1)[:, None]
+            recall[i] = tp / self.n_gt[i]
+        f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-16)
+        return {'conf': conf_thresholds, 'iou': self.iou_thresholds,
+                'precision': precision, 'recall': recall, 'f1': f1}
+
+    def average_precision(self):
+        """``(n_classes, n_iou)`` AP and ``(n_classes, 101)`` interpolated precision at ``RECALL_POINTS`` (first IoU)"""
+        ap = np.zeros((len(self.classes), len(self.iou_thresholds)))
+        pr = np.zeros((len(self.classes), len(RECALL_POINTS)))
+        for i, cls in enumerate(self.classes):
+            tp = self.correct[self.pred_classes == cls]
+            if not len(tp):
+                continue
+            tp_cum = np.cumsum(tp, axis=0)
+            fp_cum = np.cumsum(~tp, axis=0)
+            recall = tp_cum / self.n_gt[i]
+            precision = tp_cum / (tp_cum + fp_cum)
+            for t in range(len(self.iou_thresholds)):
+                ap[i, t] = average_precision(recall[:, t], precision[:, t])
+            envelope = np.maximum.accumulate(precision[::-1, 0])[::-1]
+            pr[i] = np.concatenate([envelope, [0.0]])[np.searchsorted(recall[:, 0], RECALL_POINTS, side='left')]
+        return ap, pr
+
+
+def evaluate(samples, iou_thresholds=IOU_THRESHOLDS):
+    """Per-class AP, P/R curves and best-F1 operating point from ``(detections, gt_classes, gt_boxes_xyxy)`` samples.
+
+    Returns a dict with ``classes`` (ids with ground truth), ``n_gt``, ``ap``
+    of shape ``(n_classes, n_thresholds)``, ``map50`` and ``map`` (mean over
+    0.5:0.95), ``pr`` (precision at ``RECALL_POINTS``, first IoU threshold),
+    ``curves`` (precision/recall/F1 against ``CONF_POINTS`` at the first IoU
+    threshold) and ``precision``/``recall``/``f1`` per class at ``conf``, the
+    confidence threshold with the best mean F1.
+    """
+    matches = samples if isinstance(samples, Matches) else Matches.collect(samples, iou_thresholds)
+    ap, pr = matches.average_precision()
+    sweep = matches.sweep(CONF_POINTS)
+    curves = {name: sweep[name][:, :, 0] for name in ('precision', 'recall', 'f1')}
+    best = int(curves['f1'].mean(axis=0).argmax()) if len(matches.classes) else 0
+    return {
+        'classes': matches.classes.tolist(),
+        'n_gt': matches.n_gt.tolist(),
+        'ap': ap,
+        'map50': float(ap[:, 0].mean()) if len(matches.classes) else 0.0,
+        'map': float(ap.mean()) if len(matches.classes) else 0.0,
+        'pr': pr,
+        'curves': dict(conf=CONF_POINTS, **curves),
+        'conf': float(CONF_POINTS[best]),
+        'precision': curves['precision'][:, best],
+        'recall': curves['recall'][:, best],
+        'f1': curves['f1'][:, best],
+    }
+
+
+def confusion_matrix(samples, num_classes, conf_thres=0.25, iou_thres=0.45):
+    """``(num_classes + 1)`` square matrix of predicted (rows) vs true (columns) class; the last index is background.
+
+    Detections are matched to ground truth regardless of class, one-to-one by
+    highest IoU, as in YOLOv5's ``val.py``.
+    """
+    matrix = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+    background = num_classes
+    for detections, gt_classes, gt_boxes in samples:
+        detections = detections.filter(conf_thres)
+        gt_classes = np.asarray(gt_classes, dtype=np.int64)
+        gt_matched = np.zeros(len(gt_classes), dtype=bool)
+        det_matched = np.zeros(len(detections), dtype=bool)
+        if len(detections) and len(gt_classes):
+            iou = iou_matrix(gt_boxes, detections.boxes)
+            gt_idx, det_idx = np.nonzero(iou >= iou_thres)
+            order = np.argsort(-iou[gt_idx, det_idx], kind='stable')
+            gt_idx, det_idx = gt_idx[order], det_idx[order]
+            _, first = np.unique(det_idx, return_index=True)
+            gt_idx, det_idx = gt_idx[first], det_idx[first]
+            _, first = np.unique(gt_idx, return_index=True)
+            gt_idx, det_idx = gt_idx[first], det_idx[first]
+            np.add.at(matrix, (np.minimum(detections.class_ids[det_idx], background), gt_classes[gt_idx]), 1)
+            gt_matched[gt_idx] = True
+            det_matched[det_idx] = True
+        np.add.at(matrix, (np.minimum(detections.class_ids[~det_matched], background), background), 1)
+        np.add.at(matrix, (background, gt_classes[~gt_matched]), 1)
+    return matrix
+
+
+def load_samples(detections_path, label_dir, image_dir=None, class_map=None):
+    """``(stems, samples)`` pairing a detect.py ``--save-detections`` file with YOLO labels.
+
+    Every label file is an image to score, so images with no detections count
+    as misses. Normalized labels are converted with the image size recorded in
+    the detections file, or read from ``image_dir`` when it is missing.
+    With a ``class_map`` (``vehicle_detection.classes``), labels are in the
+    original dataset's class ids and are remapped to ours; boxes of unmapped
+    classes are ignored.
+    """
+    by_stem = {Path(source).stem: entry for source, entry in read_detections(detections_path).items()}
+    get_labels = read_labels(label_dir)
+    stems = sorted(p.stem for p in Path(label_dir).glob('*.txt')) or sorted(by_stem)
+    images = {}
+    if image_dir is not None:
+        images = {p.stem: p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMG_FORMATS}
+    samples = []
+    for stem in stems:
+        detections, shape = by_stem.get(stem, (None, None))
+        gt_classes, gt_boxes = get_labels(stem)
+        if class_map is not None:
+            gt_classes, gt_boxes = class_map.remap_labels(gt_classes, gt_boxes)
+        if shape is None and len(gt_classes):
+            if stem not in images:
+                raise ValueError(f"No image size for '{stem}': pass the image directory")
+            shape = cv2.imread(str(images[stem])).shape
+        if detections is None:
+            detections = Detections.empty()
+        samples.append((detections, np.asarray(gt_classes, dtype=np.int64),
+                        labels_to_xyxy(gt_boxes, shape) if len(gt_classes) else np.zeros((0, 4), np.float32)))
+    return stems, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('detections', type=str, help='detect.py --save-detections output (.jsonl, .csv or .parquet)')
+    parser.add_argument('--labels', type=str, default='trafic_data/valid/labels', help='YOLO label directory')
+    parser.add_argument('--images', type=str, default=None,
+                        help='Image directory, for image sizes missing from the detections file')
+    parser.add_argument('--original-ids', action='store_true',
+                        help='Labels use the original dataset class ids (as in trafic_data); map them with the class registry')
+    parser.add_argument('--classes', type=str, default=None,
+                        help='Class registry YAML with names and original-id mapping (default: data/dataset.yaml)')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='Confidence threshold of the confusion matrix')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='IoU threshold of the confusion matrix')
+    parser.add_argument('--json', type=str, default=None, help='Write metrics, curves, sweep and confusion matrix here')
+    args = parser.parse_args()
+
+    class_map = load_class_map(args.classes)
+    stems, samples = load_samples(args.detections, args.labels, args.images,
+                                  class_map if args.original_ids else None)
+    matches = Matches.collect(samples)
+    metrics = evaluate(matches)
+    num_classes = max([len(class_map)] + [c + 1 for c in metrics['classes']])
+    names = [class_map.name(c) for c in range(num_classes)]
+    matrix = confusion_matrix(samples, num_classes, args.conf_thres, args.iou_thres)
+
+    print(f"{'class':<12} {'labels':>7} {'P':>7} {'R':>7} {'F1':>7} {'mAP50':>7} {'mAP50-95':>9}")
+    for i, cls in enumerate(metrics['classes']):
+        print(f"{names[cls]:<12} {metrics['n_gt'][i]:>7} {metrics['precision'][i]:>7.3f} {metrics['recall'][i]:>7.3f} "
+              f"{metrics['f1'][i]:>7.3f} {metrics['ap'][i, 0]:>7.3f} {metrics['ap'][i].mean():>9.3f}")
+    print(f"{'all':<12} {sum(metrics['n_gt']):>7} {metrics['precision'].mean():>7.3f} {metrics['recall'].mean():>7.3f} "
+          f"{metrics['f1'].mean():>7.3f} {metrics['map50']:>7.3f} {metrics['map']:>9.3f}")
+    print(f"({len(stems)} images; P/R/F1 at the best mean-F1 confidence {metrics['conf']:.2f})")
+    print(f"Confusion matrix (rows predicted, columns true; conf >= {args.conf_thres}, IoU >= {args.iou_thres}):")
+    labels = names + ['background']
+    print(' ' * 12 + ''.join(f'{name[:9]:>10}' for name in labels))
+    for name, row in zip(labels, matrix.tolist()):
+        print(f'{name[:12]:<12}' + ''.join(f'{n:>10}' for n in row))
+
+    if args.json:
+        sweep = matches.sweep(CONF_POINTS)
+        report = {
+            'detections': args.detections, 'labels': args.labels, 'images': len(stems), 'names': names,
+            'classes': metrics['classes'], 'n_gt': metrics['n_gt'],
+            'ap50': metrics['ap'][:, 0].tolist(), 'ap50_95': metrics['ap'].mean(axis=1).tolist(),
+            'map50': metrics['map50'], 'map50_95': metrics['map'], 'conf': metrics['conf'],
+            'precision': metrics['precision'].tolist(), 'recall': metrics['recall'].tolist(),
+            'f1': metrics['f1'].tolist(),
+            'pr_curve': {'recall': RECALL_POINTS.tolist(), 'precision': metrics['pr'].round(4).tolist()},
+            'sweep': {'conf': sweep['conf'].tolist(), 'iou': sweep['iou'].round(2).tolist(),
+                      **{k: sweep[k].round(4).tolist() for k in ('precision', 'recall', 'f1')}},
+            'confusion_matrix': matrix.tolist(),
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f)
+        print(f"Saved report to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Pre-decoded, letterboxed image cache.
+
+Every image of a directory is decoded once, letterboxed to ``size x size`` and
+stored in one uint8 ``.npy`` shard that is opened memory-mapped, so many
+workers share the same page cache instead of each holding decoded copies. A
+JSON sidecar records, per image, the original shape and the scale/padding
+applied, which is what is needed to map boxes back to original pixels.
+
+    python -m vehicle_detection.image_cache trafic_data/train/images --size 480
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+IMG_FORMATS = ['.jpg', '.jpeg', '.png']
+PAD_VALUE = 114
+INDEX_VERSION = 1
+
+
+def letterbox(img, size, pad_value=PAD_VALUE):
+    """Resize keeping aspect ratio and pad to ``size x size``; returns ``(img, ratio, (pad_x, pad_y))``"""
+    h, w = img.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+        img = cv2.resize(img, (new_w, new_h), interpolation=interpolation)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    out = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = img
+    return out, ratio, (pad_x, pad_y)
+
+
+def cache_paths(image_dir, size):
+    """``trafic_data/train/images`` -> ``trafic_data/train/images_480.npy`` and ``.json``"""
+    image_dir = Path(image_dir)
+    base = image_dir.parent / f'{image_dir.name}_{size}'
+    return base.with_suffix('.npy'), base.with_suffix('.json')
+
+
+def _list_images(image_dir):
+    return sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMG_FORMATS)
+
+
+def _file_stats(paths):
+    stats = []
+    for path in paths:
+        st = path.stat()
+        stats.append([st.st_size, st.st_mtime_ns])
+    return stats
+
+
+def _fill(args):
+    array_path, start, paths, size = args
+    array = np.load(array_path, mmap_mode='r+')
+    meta = []
+    for i, path in enumerate(paths, start):
+        img = cv2.imread(str(path))
+        if img is None:
+            array[i] = PAD_VALUE
+            meta.append(None)
+            continue
+        array[i], ratio, pad = letterbox(img, size)
+        meta.append({'shape': list(img.shape[:2]), 'ratio': ratio, 'pad': list(pad)})
+    array.flush()
+    return meta
+
+
+class ImageCache:
+    """Read-only access to a built cache; ``get`` returns views into the memory map"""
+
+    def __init__(self, image_dir, size=480):
+        self.image_dir = Path(image_dir)
+        self.size = size
+        array_path, index_path = cache_paths(image_dir, size)
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+        self.names = index['names']
+        self.meta = index['meta']
+        self.stats = index['stats']
+        self.images = np.load(array_path, mmap_mode='r')
+        self.lookup = {Path(name).stem: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, stem):
+        i = self.lookup.get(stem)
+        return i is not None and self.meta[i] is not None
+
+    def get(self, stem):
+        """Letterboxed image (read-only view) and its meta dict, or ``(None, None)``"""
+        i = self.lookup.get(stem)
+        if i is None or self.meta[i] is None:
+            return None, None
+        return self.images[i], self.meta[i]
+
+    def read(self, path):
+        """A writable copy of the cached image and its meta dict, or ``(None, None)``.
+
+        Boxes found on the image are in letterboxed pixels; ``to_original_xyxy``
+        maps them back with the meta.
+        """
+        img, meta = self.get(Path(path).stem)
+        return (None, None) if img is None else (np.array(img), meta)
+
+    def is_current(self):
+        paths = _list_images(self.image_dir)
+        return [p.name for p in paths] == self.names and _file_stats(paths) == self.stats
+
+
+def to_original_xyxy(boxes, meta):
+    """Map ``(n, 4)`` xyxy boxes in letterboxed pixels back to the original image"""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4).copy()
+    pad_x, pad_y = meta['pad']
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / meta['ratio']
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / meta['ratio']
+    h, w = meta['shape']
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, w)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, h)
+    return boxes
+
+
+def normalized_to_letterbox(boxes, meta):
+    """Map ``(n, 4)`` normalized YOLO xywh labels to xyxy pixels in the letterboxed image"""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    h, w = meta['shape']
+    ratio = meta['ratio']
+    pad_x, pad_y = meta['pad']
+    xy = boxes[:, :2] * [w, h]
+    half = boxes[:, 2:] * [w, h] / 2
+    xyxy = np.concatenate([xy - half, xy + half], axis=1)
+    return xyxy * ratio + [pad_x, pad_y, pad_x, pad_y]
+
+
+def build_image_cache(image_dir, size=480, workers=None, force=False):
+    """Build (or reuse, if up to date) the cache for ``image_dir``; returns an ``ImageCache``"""
+    array_path, index_path = cache_paths(image_dir, size)
+    if not force and array_path.exists() and index_path.exists():
+        try:
+            cache = ImageCache(image_dir, size)
+            if cache.is_current():
+                return cache
+        except (OSError, ValueError, KeyError):
+            pass
+
+    paths = _list_images(image_dir)
+    array = np.lib.format.open_memmap(array_path, mode='w+', dtype=np.uint8, shape=(len(paths), size, size, 3))
+    del array
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, -(-len(paths) // (workers * 4)))
+    jobs = [(str(array_path), i, paths[i:i + chunk], size) for i in range(0, len(paths), chunk)]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            meta = [m for part in pool.map(_fill, jobs) for m in part]
+    else:
+        meta = [m for job in jobs for m in _fill(job)]
+
+    with open(index_path, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'size': size, 'names': [p.name for p in paths],
+                   'stats': _file_stats(paths), 'meta': meta}, f)
+    return ImageCache(image_dir, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('image_dir', help='Directory of images to cache')
+    parser.add_argument('--size', type=int, default=480, help='Letterboxed image size')
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='Rebuild even if the cache is up to date')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cache = build_image_cache(args.image_dir, args.size, args.workers, args.force)
+    array_path, _ = cache_paths(args.image_dir, args.size)
+    print(f"Cached {len(cache)} images at {args.size}x{args.size} in {array_path} "
+          f"({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
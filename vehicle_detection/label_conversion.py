@@ -0,0 +1,176 @@
+"""Incremental, parallel conversion of original label files to our YOLO class ids.
+
+Each output directory gets a ``<dir>.manifest.json`` next to it (like YOLO's
+``<dir>.cache``) recording the size, mtime and hash of every converted input.
+Later runs only re-convert inputs that are new or whose contents changed, and
+a change of class mapping invalidates the whole manifest.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from vehicle_detection.classes import load_class_map, lookup_table, remap
+
+MANIFEST_VERSION = 1
+
+
+def convert_label_text(text, mapping):
+    """Keep well-formed ``class x y w h`` lines whose class is mapped, with the new class id.
+
+    Fields after the first five are dropped, as the original converter did.
+    ``mapping`` is ``{original id: our id}`` or its ``lookup_table``.
+    """
+    lut = mapping if isinstance(mapping, np.ndarray) else lookup_table(mapping)
+    class_ids, coords = [], []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) < 5:
+            continue
+        try:
+            class_id = int(parts[0])
+            [float(v) for v in parts[1:5]]
+        except ValueError:
+            continue
+        class_ids.append(class_id)
+        # Coordinates are already normalized; keep their original text
+        coords.append(' '.join(parts[1:5]))
+    return ''.join(f"{cls} {xywh}\n" for cls, xywh in zip(remap(lut, class_ids).tolist(), coords) if cls >= 0)
+
+
+def _convert_one(task):
+    input_path, output_path, lut, old_hash = task
+    try:
+        with open(input_path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if digest == old_hash and os.path.exists(output_path):
+            return input_path, digest, False, None
+        converted = convert_label_text(data.decode('utf-8', errors='replace'), lut)
+        # Replaced rather than truncated: a worker that dies leaves the old label, and a
+        # label linked to another file is never written through
+        tmp_path = f'{output_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(converted)
+        os.replace(tmp_path, output_path)
+        return input_path, digest, True, None
+    except Exception as e:
+        return input_path, None, False, str(e)
+
+
+class ConversionSummary:
+    def __init__(self, converted=0, skipped=0, failed=0, removed=0, seconds=0.0):
+        self.converted = converted
+        self.skipped = skipped
+        self.failed = failed
+        self.removed = removed
+        self.seconds = seconds
+
+    @property
+    def total(self):
+        return self.converted + self.skipped + self.failed
+
+    def __str__(self):
+        text = (f"converted {self.converted}, skipped {self.skipped} unchanged, "
+                f"failed {self.failed} of {self.total} labels in {self.seconds:.2f}s")
+        if self.removed:
+            text += f" ({self.removed} stale outputs removed)"
+        return text
+
+
+def manifest_path_for(output_dir):
+    output_dir = Path(output_dir)
+    return output_dir.parent / f'{output_dir.name}.manifest.json'
+
+
+def _load_manifest(path, mapping=None):
+    """Recorded inputs of a manifest; empty if it was written for another ``mapping`` (unless ``None``)"""
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    if mapping is not None and manifest.get('mapping') != _mapping_key(mapping):
+        return {}
+    return manifest.get('files', {})
+
+
+def _mapping_key(mapping):
+    return {str(k): v for k, v in sorted(mapping.items())}
+
+
+def convert_directory(input_dir, output_dir, mapping=None, workers=None, force=False):
+    """Convert every ``*.txt`` in ``input_dir`` into ``output_dir``, skipping unchanged files.
+
+    Files whose size and mtime match the manifest are skipped without being
+    read; the rest are hashed (and converted if the hash changed) across a
+    process pool. Outputs whose input disappeared are removed. ``mapping``
+    defaults to the class registry's (``vehicle_detection.classes``).
+    """
+    start = time.perf_counter()
+    mapping = load_class_map().mapping if mapping is None else mapping
+    lut = lookup_table(mapping)
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = manifest_path_for(output_dir)
+    # Every output of the previous run, even one that is re-converted in full, for removing stale ones
+    previous = _load_manifest(manifest_path)
+    old = {} if force else _load_manifest(manifest_path, mapping)
+
+    summary = ConversionSummary()
+    files = {}
+    failed = set()
+    tasks = []
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.txt') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            record = old.get(entry.name)
+            output_path = output_dir / entry.name
+            if (record and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns
+                    and output_path.exists()):
+                files[entry.name] = record
+                summary.skipped += 1
+                continue
+            files[entry.name] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            tasks.append((entry.path, str(output_path), lut, record and record.get('sha1')))
+
+    if tasks:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(tasks) // (workers * 4))
+        if workers > 1 and len(tasks) > chunksize:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_convert_one, tasks, chunksize=chunksize))
+        else:
+            results = [_convert_one(task) for task in tasks]
+        for input_path, digest, converted, error in results:
+            name = os.path.basename(input_path)
+            if error is not None:
+                print(f"Error converting {input_path}: {error}")
+                summary.failed += 1
+                failed.add(name)
+                del files[name]
+                continue
+            files[name]['sha1'] = digest
+            if converted:
+                summary.converted += 1
+            else:
+                summary.skipped += 1
+
+    for name in set(previous) - set(files) - failed:
+        stale = output_dir / name
+        if stale.exists():
+            stale.unlink()
+            summary.removed += 1
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'mapping': _mapping_key(mapping), 'files': files}, f)
+    summary.seconds = time.perf_counter() - start
+    return summary
@@ -0,0 +1,205 @@
+"""Packed, memory-mappable label store: one file per split instead of one .txt per image.
+
+Layout of a ``.labelpack`` file (all integers little-endian)::
+
+    magic         8 bytes   b'VDLABEL1'
+    header_size   uint64
+    header        JSON: {"stems": [...], "num_boxes": N}
+    padding       to a 64-byte boundary
+    boxes         float32 (N, 4)   normalized x_center, y_center, width, height
+    classes       int32   (N,)
+    offsets       int64   (M + 1,) rows of image i are offsets[i]:offsets[i + 1]
+
+Opening a store maps the file and exposes the arrays as views, so lookups by
+image stem are slices with no parsing and no per-image file access.
+
+    python -m vehicle_detection.label_store pack data/labels/train
+    python -m vehicle_detection.label_store unpack data/labels/train.labelpack data/labels/train
+"""
+import argparse
+import json
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b'VDLABEL1'
+ALIGNMENT = 64
+SUFFIX = '.labelpack'
+
+
+def store_path_for(label_dir):
+    """``data/labels/train`` -> ``data/labels/train.labelpack``"""
+    label_dir = Path(label_dir)
+    return label_dir.parent / f'{label_dir.name}{SUFFIX}'
+
+
+def _align(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class LabelStore:
+    """Read-only view of a ``.labelpack`` file"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._raw = np.memmap(self.path, dtype=np.uint8, mode='r')
+        if bytes(self._raw[:8]) != MAGIC:
+            raise ValueError(f"Not a label store: {path}")
+        (header_size,) = struct.unpack('<Q', bytes(self._raw[8:16]))
+        header = json.loads(bytes(self._raw[16:16 + header_size]))
+        self.stems = header['stems']
+        num_boxes = header['num_boxes']
+        num_images = len(self.stems)
+
+        pos = _align(16 + header_size)
+        self.boxes = self._raw[pos:pos + num_boxes * 16].view(np.float32).reshape(num_boxes, 4)
+        pos = _align(pos + num_boxes * 16)
+        self.classes = self._raw[pos:pos + num_boxes * 4].view(np.int32)
+        pos = _align(pos + num_boxes * 4)
+        self.offsets = self._raw[pos:pos + (num_images + 1) * 8].view(np.int64)
+        self.index = {stem: i for i, stem in enumerate(self.stems)}
+
+    def __len__(self):
+        return len(self.stems)
+
+    def __contains__(self, stem):
+        return stem in self.index
+
+    def __iter__(self):
+        for i, stem in enumerate(self.stems):
+            yield (stem,) + self.labels_at(i)
+
+    def labels_at(self, i):
+        """``(classes, boxes)`` views for the i-th image"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.classes[start:end], self.boxes[start:end]
+
+    def get(self, stem):
+        """``(classes, boxes)`` views for an image stem; empty arrays if it has no entry"""
+        i = self.index.get(stem)
+        if i is None:
+            return self.classes[:0], self.boxes[:0]
+        return self.labels_at(i)
+
+    def boxes_per_image(self):
+        return np.diff(self.offsets)
+
+    def image_index(self):
+        """Image index of every box row, for grouping whole-store statistics"""
+        return np.repeat(np.arange(len(self.stems)), self.boxes_per_image())
+
+
+def write_label_store(path, stems, classes_list, boxes_list):
+    """Write per-image class and box arrays (same order as ``stems``) to ``path``"""
+    counts = np.fromiter((len(c) for c in classes_list), dtype=np.int64, count=len(stems))
+    offsets = np.zeros(len(stems) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    num_boxes = int(offsets[-1])
+    boxes = (np.concatenate([np.asarray(b, dtype=np.float32).reshape(-1, 4) for b in boxes_list])
+             if num_boxes else np.zeros((0, 4), dtype=np.float32))
+    classes = (np.concatenate([np.asarray(c, dtype=np.int32).reshape(-1) for c in classes_list])
+               if num_boxes else np.zeros(0, dtype=np.int32))
+
+    header = json.dumps({'stems': list(stems), 'num_boxes': num_boxes}).encode()
+    tmp_path = Path(f'{path}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for array in (boxes, classes, offsets):
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(np.ascontiguousarray(array).astype(array.dtype.newbyteorder('<'), copy=False).tobytes())
+    os.replace(tmp_path, path)
+
+
+def parse_yolo_text(text):
+    """``(classes, boxes)`` arrays from YOLO txt content, skipping malformed lines"""
+    classes, boxes = [], []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) != 5:
+            continue
+        try:
+            cls = int(float(parts[0]))
+            box = [float(v) for v in parts[1:]]
+        except ValueError:
+            continue
+        classes.append(cls)
+        boxes.append(box)
+    return np.asarray(classes, dtype=np.int32), np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+
+def _read_label_files(paths):
+    parsed = []
+    for path in paths:
+        with open(path, 'r') as f:
+            parsed.append(parse_yolo_text(f.read()))
+    return parsed
+
+
+def pack_yolo_dir(label_dir, path=None, workers=None):
+    """Pack every ``*.txt`` in ``label_dir`` into one store; returns the store path"""
+    label_dir = Path(label_dir)
+    path = Path(path) if path else store_path_for(label_dir)
+    files = sorted(label_dir.glob('*.txt'))
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, len(files) // (workers * 4))
+    chunks = [files[i:i + chunk] for i in range(0, len(files), chunk)]
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = [item for part in pool.map(_read_label_files, chunks) for item in part]
+    else:
+        parsed = _read_label_files(files)
+    write_label_store(path, [f.stem for f in files],
+                      [classes for classes, _ in parsed], [boxes for _, boxes in parsed])
+    return path
+
+
+def format_yolo_lines(classes, boxes):
+    return ''.join(f"{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+                   for c, (x, y, w, h) in zip(classes.tolist(), boxes.tolist()))
+
+
+def unpack_to_yolo_dir(path, label_dir):
+    """Write one YOLO ``.txt`` per image in the store; returns the number of files"""
+    store = LabelStore(path)
+    label_dir = Path(label_dir)
+    label_dir.mkdir(parents=True, exist_ok=True)
+    for stem, classes, boxes in store:
+        # Replaced rather than truncated, so a label linked to another file is never written through
+        tmp_path = label_dir / f'{stem}.txt.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(format_yolo_lines(classes, boxes))
+        os.replace(tmp_path, label_dir / f'{stem}.txt')
+    return len(store)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    pack = sub.add_parser('pack', help='Pack a directory of YOLO .txt labels')
+    pack.add_argument('label_dir')
+    pack.add_argument('--output', default=None, help='Store path (default: <label_dir>.labelpack)')
+    pack.add_argument('--workers', type=int, default=None)
+    unpack = sub.add_parser('unpack', help='Export a store back to YOLO .txt files')
+    unpack.add_argument('store')
+    unpack.add_argument('label_dir')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'pack':
+        path = pack_yolo_dir(args.label_dir, args.output, args.workers)
+        store = LabelStore(path)
+        print(f"Packed {len(store)} label files ({len(store.classes)} boxes) into {path} "
+              f"in {time.perf_counter() - start:.2f}s")
+    else:
+        count = unpack_to_yolo_dir(args.store, args.label_dir)
+        print(f"Wrote {count} label files to {args.label_dir} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
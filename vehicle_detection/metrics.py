@@ -0,0 +1,256 @@
+"""Span timers, latency histograms and a sampling profiler for the hot path.
+
+    with span('inference'):
+        results = model(imgs)
+
+Spans feed per-name histograms in the process-wide ``METRICS`` registry, which
+renders them as Prometheus text (``to_prometheus()``) or a one-line summary.
+Until ``enable()`` is called a span is a shared no-op context manager, so
+instrumented code pays one attribute check per span.
+
+``SamplingProfiler`` samples the Python stacks of all threads at a fixed rate
+and writes them in the folded format read by flamegraph.pl, inferno and
+speedscope. Time spent inside OpenCV or torch is attributed to the Python
+frame that called it.
+"""
+import bisect
+import contextlib
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Prometheus-style latency histogram (seconds) with fixed bucket bounds"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q):
+        """Estimate of the ``q`` quantile, interpolated linearly inside its bucket"""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Metrics:
+    """Registry of span histograms; ``labels`` are added to every exported series"""
+
+    def __init__(self, enabled=False, namespace='vehicle_detection', labels=None):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.labels = dict(labels or {})
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Context manager timing its body into histogram ``name`` (no-op while disabled)"""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def to_prometheus(self):
+        """Histograms in the Prometheus text exposition format"""
+        metric = f'{self.namespace}_span_seconds'
+        lines = [f'# HELP {metric} Time spent in instrumented spans.', f'# TYPE {metric} histogram']
+        extra = ''.join(f',{key}="{value}"' for key, value in self.labels.items())
+        for name, histogram in sorted(self.histograms.items()):
+            with histogram._lock:
+                counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+            cumulative = 0
+            for bound, n in zip(list(histogram.buckets) + ['+Inf'], counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{span="{name}"{extra},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{span="{name}"{extra}}} {total:.6f}')
+            lines.append(f'{metric}_count{{span="{name}"{extra}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """Write ``to_prometheus()`` atomically, e.g. for node_exporter's textfile collector"""
+        path = Path(path)
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        """``{span: {'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'}}``"""
+        return {name: {'count': h.count,
+                       'mean_ms': 1000.0 * h.sum / h.count if h.count else 0.0,
+                       'p50_ms': 1000.0 * h.quantile(0.5),
+                       'p95_ms': 1000.0 * h.quantile(0.95),
+                       'p99_ms': 1000.0 * h.quantile(0.99)}
+                for name, h in sorted(self.histograms.items())}
+
+    def summary_line(self):
+        return ' | '.join(f"{name} n={s['count']} p50 {s['p50_ms']:.1f}ms p95 {s['p95_ms']:.1f}ms"
+                          for name, s in self.summary().items()) or 'no spans recorded'
+
+
+METRICS = Metrics()
+
+
+def span(name):
+    return METRICS.span(name)
+
+
+def enable(labels=None):
+    METRICS.enabled = True
+    if labels:
+        METRICS.labels.update(labels)
+    return METRICS
+
+
+class PeriodicReporter:
+    """Prints the summary line (and rewrites a Prometheus file) every ``interval`` seconds"""
+
+    def __init__(self, metrics, interval=10.0, prometheus_path=None, prefix='[metrics]'):
+        self.metrics = metrics
+        self.interval = interval
+        self.prometheus_path = prometheus_path
+        self.prefix = prefix
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def report(self):
+        print(f"{self.prefix} {self.metrics.summary_line()}", flush=True)
+        if self.prometheus_path:
+            self.metrics.write_prometheus(self.prometheus_path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.report()
+
+
+class SamplingProfiler:
+    """Samples every thread's Python stack ``rate`` times a second into folded stacks"""
+
+    def __init__(self, rate=200.0):
+        self.interval = 1.0 / rate
+        self.samples = 0
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{Path(code.co_filename).stem}:{code.co_name}')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """Write ``<frame;frame;...> <count>`` lines (flamegraph.pl / speedscope folded format)"""
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+
+@contextlib.contextmanager
+def instrument(enabled=False, interval=None, prometheus_path=None, profile_path=None, labels=None):
+    """Enable ``METRICS`` for the body, with optional periodic reporting and profiling.
+
+    Prints a final summary line and writes ``prometheus_path`` and the folded
+    profile (``profile_path``) on exit. Does nothing unless ``enabled``,
+    ``prometheus_path`` or ``profile_path`` is set.
+    """
+    if not (enabled or prometheus_path or profile_path):
+        yield None
+        return
+    metrics = enable(labels)
+    reporter = PeriodicReporter(metrics, interval or float('inf'), prometheus_path)
+    if interval:
+        reporter.start()
+    profiler = SamplingProfiler().start() if profile_path else None
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.dump(profile_path)
+            print(f"Saved profile ({profiler.samples} samples) to {profile_path}")
+        if interval:
+            reporter.stop()
+        else:
+            reporter.report()
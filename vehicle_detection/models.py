@@ -0,0 +1,134 @@
+import time
+
+import numpy as np
+
+from vehicle_detection.backends import backend_path, torchscript_batch_size
+from vehicle_detection.classes import load_class_map
+from vehicle_detection.detections import Detections
+from vehicle_detection.metrics import span
+from vehicle_detection.render import get_renderer
+
+STAND_IN = 'stand-in'
+
+
+class Results:
+    """Minimal stand-in for YOLOv5's ``Results``: per-image ``(n, 6)`` predictions"""
+
+    def __init__(self, imgs, pred, names):
+        self.imgs = imgs
+        self.pred = pred
+        self.xyxy = pred
+        self.names = names
+
+    def __len__(self):
+        return len(self.pred)
+
+    def render(self):
+        """Return copies of the input images with boxes and labels drawn"""
+        renderer = get_renderer(self.names)
+        return [renderer.draw(np.ascontiguousarray(img).copy(), Detections.from_pred(pred))
+                for img, pred in zip(self.imgs, self.pred)]
+
+
+def as_image_list(imgs):
+    """Normalize a single image (array or PIL) or a list of them to a list of arrays"""
+    if not isinstance(imgs, (list, tuple)):
+        imgs = [imgs]
+    return [np.asarray(img) for img in imgs]
+
+
+class StandInModel:
+    """Deterministic CPU-only model with the YOLOv5 AutoShape calling convention.
+
+    Splits each image into a coarse grid and reports a box for every cell whose
+    contrast is high enough, so outputs depend on image content but need no
+    weights or torch. ``latency`` adds a per-image sleep to imitate model cost.
+    """
+
+    def __init__(self, names=None, grid=4, latency=0.0):
+        self.names = list(names or load_class_map().names)
+        self.grid = grid
+        self.latency = latency
+        self.conf = 0.25
+        self.iou = 0.45
+
+    def _predict(self, img):
+        h, w = img.shape[:2]
+        g = self.grid
+        if h < g or w < g:
+            return np.zeros((0, 6), dtype=np.float32)
+        gray = img.mean(axis=2) if img.ndim == 3 else img.astype(np.float32)
+        cells = gray[:h - h % g, :w - w % g].reshape(g, h // g, g, w // g)
+        conf = cells.std(axis=(1, 3)).ravel() / 128.0
+        conf = np.clip(conf, 0.0, 1.0)
+        keep = np.flatnonzero(conf >= self.conf)
+        rows, cols = np.divmod(keep, g)
+        cw, ch = w / g, h / g
+        pred = np.empty((len(keep), 6), dtype=np.float32)
+        pred[:, 0] = (cols + 0.1) * cw
+        pred[:, 1] = (rows + 0.1) * ch
+        pred[:, 2] = (cols + 0.9) * cw
+        pred[:, 3] = (rows + 0.9) * ch
+        pred[:, 4] = conf[keep]
+        pred[:, 5] = keep % len(self.names)
+        return pred
+
+    def __call__(self, imgs):
+        imgs = as_image_list(imgs)
+        if self.latency:
+            time.sleep(self.latency * len(imgs))
+        return Results(imgs, [self._predict(img) for img in imgs], self.names)
+
+
+class FixedBatchModel:
+    """Runs a model traced at a fixed batch size on batches of any size.
+
+    Images are passed in chunks of ``batch_size``; a short last chunk is padded
+    with copies of its final image, whose predictions are dropped. Other
+    attributes (``conf``, ``iou``, ``names``) are those of the wrapped model.
+    """
+
+    def __init__(self, model, batch_size):
+        object.__setattr__(self, 'model', model)
+        object.__setattr__(self, 'batch_size', batch_size)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.model, name, value)
+
+    def __call__(self, imgs):
+        if not isinstance(imgs, (list, tuple)):
+            imgs = [imgs]
+        n = self.batch_size
+        pred = []
+        for i in range(0, len(imgs), n):
+            chunk = list(imgs[i:i + n])
+            results = self.model(chunk + chunk[-1:] * (n - len(chunk)))
+            pred.extend(list(results.pred)[:len(chunk)])
+        return Results([np.asarray(img) for img in imgs], pred, self.model.names)
+
+
+def load_model(weights, conf_thres=0.25, iou_thres=0.45, repo='ultralytics/yolov5', source='github',
+               backend='pytorch'):
+    """Load YOLOv5 weights through torch.hub, or the stand-in model for ``weights='stand-in'``.
+
+    ``backend`` selects the exported runtime (see ``vehicle_detection.backends``);
+    ``weights`` is always the original ``.pt`` path. TorchScript models are
+    wrapped in ``FixedBatchModel``, so any batch size can be passed to them.
+    """
+    with span('load_model'):
+        if weights == STAND_IN:
+            model = StandInModel()
+        else:
+            import torch
+            path = backend_path(weights, backend)
+            if backend != 'pytorch' and not path.exists():
+                raise FileNotFoundError(f"{path} not found; export it with: python -m vehicle_detection.backends {weights}")
+            model = torch.hub.load(repo, 'custom', path=str(path), source=source)
+            if backend == 'torchscript':
+                model = FixedBatchModel(model, torchscript_batch_size(path))
+    model.conf = conf_thres
+    model.iou = iou_thres
+    return model
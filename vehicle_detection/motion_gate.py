@@ -0,0 +1,151 @@
+"""Motion gating: skip inference on frames of a static camera that have not changed.
+
+The gate keeps a small grayscale copy of the frame detection last ran on (the
+reference) and scores every new frame by the mean absolute difference over a
+coarse grid of cells. Comparing against the reference rather than the previous
+frame means slow changes still add up to a detection run.
+
+- no cell at or above ``threshold``: the previous detections are reused
+- with ``regions``, when the changed cells cover at most ``max_region_area``
+  of the frame: only padded crops around them are detected, and those results
+  replace the previous detections inside them. If a vehicle found in a crop
+  touches the crop border, it may extend past it, and the frame is detected in
+  full instead
+- otherwise, or after ``max_skip`` frames without a full run: the whole frame
+  is detected again
+"""
+import cv2
+import numpy as np
+
+from vehicle_detection.boxes import merge_boxes
+from vehicle_detection.detections import Detections
+from vehicle_detection.metrics import span
+
+
+class MotionGate:
+    """Wraps ``detect(imgs, conf_thres) -> [Detections]`` as ``gate(img, conf_thres) -> Detections``"""
+
+    def __init__(self, detect, threshold=4.0, max_skip=30, regions=False, max_region_area=0.5,
+                 scale=4, cell=8, pad=32, merge_thres=0.5):
+        self.detect = detect
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.regions = regions
+        self.max_region_area = max_region_area
+        self.scale = scale
+        self.cell = cell
+        self.pad = pad
+        self.merge_thres = merge_thres
+        self._reference = None
+        self._detections = None
+        self._since_full = 0
+        self.frames = 0
+        self.skipped = 0
+        self.region_runs = 0
+        self.full_runs = 0
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return (f"Motion gate ran the model on {self.frames - self.skipped} of {self.frames} frames "
+                f"({self.skip_ratio:.0%} skipped, {self.region_runs} changed-region runs, "
+                f"{self.full_runs} full-frame runs)")
+
+    def _small(self, img):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        h, w = gray.shape[:2]
+        return cv2.resize(gray, (max(1, w // self.scale), max(1, h // self.scale)),
+                          interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def changed_cells(self, small):
+        """Boolean ``(rows, cols)`` grid of cells whose mean difference from the reference reaches the threshold"""
+        h, w = small.shape
+        diff = cv2.absdiff(small, self._reference)
+        cells = cv2.resize(diff, (max(1, w // self.cell), max(1, h // self.cell)), interpolation=cv2.INTER_AREA)
+        return cells >= self.threshold
+
+    def _regions(self, changed, height, width):
+        """``(n, 4)`` padded xyxy pixel windows around connected groups of changed cells"""
+        rows, cols = changed.shape
+        grown = cv2.dilate(changed.astype(np.uint8), np.ones((3, 3), np.uint8))
+        n, _, stats, _ = cv2.connectedComponentsWithStats(grown, connectivity=8)
+        x, y, w, h = stats[1:, :4].T.astype(np.float64)
+        sx, sy = width / cols, height / rows
+        windows = np.stack([x * sx - self.pad, y * sy - self.pad,
+                            (x + w) * sx + self.pad, (y + h) * sy + self.pad], axis=1)
+        windows = np.clip(np.round(windows), 0, [width, height, width, height]).astype(np.int64)
+
+        # Overlapping windows would cut the same vehicle twice; join them until none overlap
+        merged = True
+        while merged and len(windows) > 1:
+            merged = False
+            overlap = ((windows[:, None, :2] < windows[None, :, 2:]) & (windows[None, :, :2] < windows[:, None, 2:])).all(axis=2)
+            np.fill_diagonal(overlap, False)
+            if overlap.any():
+                i, j = np.argwhere(overlap)[0]
+                windows[i, :2] = np.minimum(windows[i, :2], windows[j, :2])
+                windows[i, 2:] = np.maximum(windows[i, 2:], windows[j, 2:])
+                windows = np.delete(windows, j, axis=0)
+                merged = True
+        return windows
+
+    def _run_full(self, img, small, conf_thres):
+        self._detections = self.detect([img], conf_thres)[0]
+        self._reference = small
+        self._since_full = 0
+        self.full_runs += 1
+        return self._detections
+
+    def _run_regions(self, img, small, changed, conf_thres):
+        h, w = img.shape[:2]
+        windows = self._regions(changed, h, w)
+        results = self.detect([img[y1:y2, x1:x2] for x1, y1, x2, y2 in windows.tolist()], conf_thres)
+        for d, (x1, y1, x2, y2) in zip(results, windows.tolist()):
+            bx1, by1, bx2, by2 = d.boxes.T
+            if ((bx1 <= 1) & (x1 > 0) | (by1 <= 1) & (y1 > 0) |
+                    (bx2 >= x2 - x1 - 1) & (x2 < w) | (by2 >= y2 - y1 - 1) & (y2 < h)).any():
+                return self._run_full(img, small, conf_thres)
+
+        # Previous detections centred in a re-run window are replaced by that window's results
+        prev = self._detections
+        centers = (prev.boxes[:, :2] + prev.boxes[:, 2:]) / 2
+        inside = ((centers[:, None, :] >= windows[None, :, :2]) & (centers[:, None, :] < windows[None, :, 2:])).all(axis=2)
+        prev = prev[~inside.any(axis=1)]
+        parts = [prev] + [Detections(d.boxes + np.tile(window[:2], 2), d.confidences, d.class_ids)
+                          for d, window in zip(results, windows)]
+        boxes = np.concatenate([d.boxes for d in parts])
+        confidences = np.concatenate([d.confidences for d in parts])
+        class_ids = np.concatenate([d.class_ids for d in parts])
+        if len(boxes):
+            # Crop boxes are never truncated (those fall back to a full run above), but a kept previous box
+            # centred just outside a window can be found again inside it; plain NMS keeps one of the two
+            # without joining neighbouring vehicles into one box
+            boxes, keep = merge_boxes(boxes, confidences, class_ids, self.merge_thres)
+            self._detections = Detections(boxes, confidences[keep], class_ids[keep])
+        else:
+            self._detections = Detections.empty()
+
+        for x1, y1, x2, y2 in (windows // self.scale).tolist():
+            self._reference[y1:y2, x1:x2] = small[y1:y2, x1:x2]
+        self._since_full += 1
+        self.region_runs += 1
+        return self._detections
+
+    def __call__(self, img, conf_thres=0.0):
+        self.frames += 1
+        with span('motion_gate'):
+            small = self._small(img)
+            stale = (self._reference is None or self._reference.shape != small.shape or
+                     self._since_full >= self.max_skip)
+            changed = None if stale else self.changed_cells(small)
+        if stale:
+            return self._run_full(img, small, conf_thres)
+        if not changed.any():
+            self.skipped += 1
+            self._since_full += 1
+            return self._detections
+        if self.regions and changed.mean() <= self.max_region_area:
+            return self._run_regions(img, small, changed, conf_thres)
+        return self._run_full(img, small, conf_thres)
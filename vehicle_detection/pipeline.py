@@ -0,0 +1,131 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from vehicle_detection.metrics import span
+
+_DONE = object()
+
+
+class PipelineStats:
+    """Thread-safe accumulator of wall time spent in each pipeline stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.counts = {}
+        self.images = 0
+        self.wall_time = 0.0
+
+    def add(self, stage, seconds, count=1):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + count
+
+    @property
+    def images_per_sec(self):
+        return self.images / self.wall_time if self.wall_time > 0 else 0.0
+
+    def summary(self):
+        lines = [f"Processed {self.images} images in {self.wall_time:.2f}s "
+                 f"({self.images_per_sec:.1f} images/sec)"]
+        for stage, seconds in self.seconds.items():
+            count = self.counts[stage]
+            lines.append(f"  {stage:<10} total {seconds:8.2f}s  "
+                         f"{1000 * seconds / max(count, 1):7.2f} ms/image")
+        return '\n'.join(lines)
+
+
+def _decode(path, stats, load):
+    start = time.perf_counter()
+    with span('imread'):
+        img = load(path) if load is not None else cv2.imread(str(path))
+    stats.add('decode', time.perf_counter() - start)
+    return path, img
+
+
+def run_pipeline(paths, infer, handle, batch_size=8, decode_workers=4,
+                 encode_workers=2, max_pending_batches=2, load=None):
+    """Decode, infer and write images in overlapping stages.
+
+    A decode thread pool reads images ahead of the model, ``infer`` is called
+    once per batch of ``batch_size`` decoded images and must return one result
+    per image, and ``handle(path, img, result)`` runs on an encode thread pool.
+    Both hand-offs are bounded to ``max_pending_batches`` batches so memory
+    stays flat however large the input directory is. ``load(path)`` replaces
+    ``cv2.imread`` for the decode stage, e.g. to read from an image cache.
+    """
+    stats = PipelineStats()
+    capacity = batch_size * max_pending_batches
+    decoded = queue.Queue(maxsize=capacity)
+    encode_slots = threading.Semaphore(capacity)
+    stop = threading.Event()
+
+    def handle_one(path, img, result):
+        start = time.perf_counter()
+        try:
+            handle(path, img, result)
+        except Exception as e:
+            print(f"Error writing result for {path}: {str(e)}")
+        finally:
+            stats.add('encode', time.perf_counter() - start)
+            encode_slots.release()
+
+    decode_pool = ThreadPoolExecutor(max_workers=decode_workers)
+    encode_pool = ThreadPoolExecutor(max_workers=encode_workers)
+
+    def feed():
+        try:
+            for path in paths:
+                if stop.is_set():
+                    break
+                decoded.put(decode_pool.submit(_decode, path, stats, load))
+        finally:
+            decoded.put(_DONE)
+
+    def flush(batch):
+        start = time.perf_counter()
+        results = infer([img for _, img in batch])
+        stats.add('inference', time.perf_counter() - start, len(batch))
+        for (path, img), result in zip(batch, results):
+            encode_slots.acquire()
+            encode_pool.submit(handle_one, path, img, result)
+        stats.images += len(batch)
+
+    start = time.perf_counter()
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        batch = []
+        while True:
+            item = decoded.get()
+            if item is _DONE:
+                break
+            path, img = item.result()
+            if img is None:
+                print(f"Error reading image: {path}")
+                continue
+            batch.append((path, img))
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        stop.set()
+        # Drain so a feeder blocked on a full queue can observe ``stop``, cancelling
+        # decodes nobody will consume (``shutdown(cancel_futures=True)`` needs Python 3.9)
+        while feeder.is_alive() or not decoded.empty():
+            try:
+                item = decoded.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is not _DONE:
+                item.cancel()
+        decode_pool.shutdown(wait=True)
+        encode_pool.shutdown(wait=True)
+        stats.wall_time = time.perf_counter() - start
+    return stats
@@ -0,0 +1,94 @@
+"""Shared annotation renderer for detections.
+
+One ``Renderer`` per set of class names holds everything that does not change
+between frames: the per-class color table, the font metrics and the label
+strings already formatted ("car 0.87"). It is a label and color cache, not a
+faster drawer: boxes and labels are still drawn with one ``cv2.rectangle`` and
+one ``cv2.putText`` per box, and frames cost about the same as the previous
+per-box loop. Drawing boxes as NumPy slices and labels from cached glyph
+sprites measured 2-3x slower than these calls (see ``benchmarks/render.py``).
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+PALETTE = [(0, 255, 0), (255, 128, 0), (0, 128, 255), (255, 0, 255), (0, 255, 255), (255, 255, 0),
+           (128, 0, 255), (0, 0, 255), (255, 0, 0), (128, 255, 0)]
+MAX_CACHED_LABELS = 4096
+
+
+class Renderer:
+    """Draws ``Detections`` onto uint8 images.
+
+    ``class_names`` is a list or dict indexed by class id; ``colors`` an
+    optional per-class color list (defaults to ``PALETTE``). Labels read
+    ``"<name> <conf>"``, prefixed with ``#<track_id>`` for tracked detections.
+    """
+
+    def __init__(self, class_names, colors=None, thickness=2, font_scale=0.5, font_thickness=2,
+                 show_confidence=True, label_offset=10):
+        self.class_names = class_names
+        self.thickness = thickness
+        self.font_scale = font_scale
+        self.font_thickness = font_thickness
+        self.show_confidence = show_confidence
+        self.label_offset = label_offset
+        num_classes = max(class_names, default=0) + 1 if isinstance(class_names, dict) else len(class_names)
+        colors = colors or PALETTE
+        self.colors = [tuple(int(v) for v in colors[i % len(colors)]) for i in range(max(num_classes, 1))]
+        self._labels = {}
+
+    def class_name(self, cls):
+        if isinstance(self.class_names, dict):
+            return self.class_names.get(cls, str(cls))
+        return self.class_names[cls] if 0 <= cls < len(self.class_names) else str(cls)
+
+    def color(self, cls):
+        return self.colors[cls % len(self.colors)]
+
+    def label_text(self, cls, conf, track_id=None):
+        """Label for a detection; formatted once per distinct (class, rounded confidence, track id)"""
+        key = (cls, round(conf * 100) if self.show_confidence else None, track_id)
+        text = self._labels.get(key)
+        if text is None:
+            text = self.class_name(cls)
+            if self.show_confidence:
+                text = f"{text} {conf:.2f}"
+            if track_id is not None:
+                text = f"#{track_id} {text}"
+            # Track ids make the set of labels unbounded over a long video
+            if len(self._labels) >= MAX_CACHED_LABELS:
+                self._labels.clear()
+            self._labels[key] = text
+        return text
+
+    def draw(self, img, detections, out=None):
+        """Draw onto ``img`` in place, or into the preallocated ``out`` (same shape) if given; returns it"""
+        if out is not None:
+            np.copyto(out, img)
+            img = out
+        if not len(detections):
+            return img
+        track_ids = detections.track_ids.tolist() if detections.track_ids is not None else [None] * len(detections)
+        for (x1, y1, x2, y2), conf, cls, track_id in zip(detections.boxes.astype(np.int64).tolist(),
+                                                          detections.confidences.tolist(),
+                                                          detections.class_ids.tolist(), track_ids):
+            color = self.colors[cls % len(self.colors)]
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, self.thickness)
+            cv2.putText(img, self.label_text(cls, conf, track_id), (x1, y1 - self.label_offset), FONT,
+                        self.font_scale, color, self.font_thickness)
+        return img
+
+
+@lru_cache(maxsize=16)
+def _cached_renderer(names_key, is_dict):
+    return Renderer(dict(names_key) if is_dict else list(names_key))
+
+
+def get_renderer(class_names):
+    """Shared ``Renderer`` for a set of class names, so per-class state is built once per process"""
+    if isinstance(class_names, dict):
+        return _cached_renderer(tuple(sorted(class_names.items())), True)
+    return _cached_renderer(tuple(class_names), False)
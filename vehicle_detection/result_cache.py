@@ -0,0 +1,71 @@
+"""Memory-capped LRU cache of detection results keyed by image content.
+
+Results are stored before any confidence threshold is applied, so a different
+threshold on the same image is a filter over the cached arrays rather than
+another forward pass.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(data, *extra):
+    """Hex digest of ``data`` bytes plus anything else the result depends on (e.g. the weights)"""
+    digest = hashlib.blake2b(data, digest_size=16)
+    for item in extra:
+        digest.update(b'\0' + str(item).encode())
+    return digest.hexdigest()
+
+
+def nbytes_of(value):
+    """Approximate memory held by ``value``: NumPy arrays inside tuples, lists and ``__slots__`` objects"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    slots = getattr(type(value), '__slots__', ())
+    return sum(nbytes_of(getattr(value, name, None)) for name in slots)
+
+
+class ResultCache:
+    """Thread-safe LRU bounded by the total size of its values in bytes"""
+
+    def __init__(self, max_bytes=256 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store ``value``, evicting least recently used entries to stay under ``max_bytes``"""
+        size = nbytes_of(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
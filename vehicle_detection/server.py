@@ -0,0 +1,238 @@
+"""Long-lived inference daemon and its client.
+
+The server loads the model once and exposes a small HTTP API:
+
+- ``POST /detect`` with an encoded image (``image/*``) or a raw array saved with
+  ``np.save`` (``application/x-npy``) returns ``{"pred": [[x1, y1, x2, y2, conf, cls], ...]}``;
+  ``POST /detect?conf=0.25`` only returns predictions at or above that confidence.
+  The model's own ``conf`` is the floor, so it should be the lowest any client uses
+- ``GET /health`` returns the model name and batching counters
+- ``GET /metrics`` returns span latency histograms in Prometheus text format
+
+Requests that arrive within ``max_wait`` of each other are grouped into one
+model call of up to ``max_batch_size`` images.
+"""
+import http.client
+import io
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from vehicle_detection.metrics import METRICS, span
+from vehicle_detection.models import Results, as_image_list
+
+NPY_CONTENT_TYPE = 'application/x-npy'
+DEFAULT_PORT = 8765
+
+
+class DynamicBatcher:
+    """Collects images submitted from many threads into batched model calls"""
+
+    def __init__(self, model, max_batch_size=16, max_wait=0.005):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, img):
+        """Queue one image; the returned future resolves to its ``(n, 6)`` prediction"""
+        future = Future()
+        self._queue.put((img, future))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            try:
+                with span('inference'):
+                    results = self.model([img for img, _ in batch])
+                preds = [_to_array(pred) for pred in results.pred]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.images += len(batch)
+            for (_, future), pred in zip(batch, preds):
+                future.set_result(pred)
+
+
+def _to_array(pred):
+    if hasattr(pred, 'detach'):
+        pred = pred.detach().cpu().numpy()
+    return np.asarray(pred, dtype=np.float32).reshape(-1, 6)
+
+
+def decode_request_image(body, content_type):
+    if content_type == NPY_CONTENT_TYPE:
+        return np.load(io.BytesIO(body), allow_pickle=False)
+    img = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    return img
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = METRICS.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != '/health':
+            self._send_json(404, {'error': 'not found'})
+            return
+        batcher = self.server.batcher
+        self._send_json(200, {
+            'status': 'ok',
+            'model': type(batcher.model).__name__,
+            'names': list(getattr(batcher.model, 'names', [])),
+            'batches': batcher.batches,
+            'images': batcher.images,
+        })
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/detect':
+            self._send_json(404, {'error': 'not found'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            conf = float(parse_qs(url.query).get('conf', [0.0])[0])
+            with span('decode'):
+                img = decode_request_image(body, self.headers.get('Content-Type', ''))
+        except Exception as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        try:
+            pred = self.server.batcher.submit(img).result()
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, {'pred': pred[pred[:, 4] >= conf].tolist()})
+
+
+class ModelServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, model, host='127.0.0.1', port=DEFAULT_PORT, max_batch_size=16, max_wait=0.005,
+                 verbose=False):
+        self.batcher = DynamicBatcher(model, max_batch_size=max_batch_size, max_wait=max_wait)
+        self.verbose = verbose
+        super().__init__((host, port), _Handler)
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+class ModelClient:
+    """Calls a running ``ModelServer`` with the same interface as a loaded model.
+
+    Images in one call are posted concurrently so the server can batch them.
+    ``conf`` is sent with each request, so predictions down to it are returned
+    as long as the server's ``--conf-thres`` is no higher; NMS settings are
+    fixed by the server.
+    """
+
+    def __init__(self, url, timeout=60.0, max_concurrency=16):
+        parts = urlsplit(url if '://' in url else f'http://{url}')
+        self.host = parts.hostname
+        self.port = parts.port or DEFAULT_PORT
+        self.timeout = timeout
+        self.conf = 0.0
+        self.iou = None
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.names = self._request('GET', '/health').get('names', [])
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method, path, body=None, headers=None):
+        conn = self._connection()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            payload = json.loads(response.read())
+        except (http.client.HTTPException, ConnectionError):
+            # Stale keep-alive connection; retry once on a fresh one
+            conn.close()
+            self._local.conn = None
+            conn = self._connection()
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            payload = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(f"Model server error ({response.status}): {payload.get('error')}")
+        return payload
+
+    def _detect_one(self, img):
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(img), allow_pickle=False)
+        payload = self._request('POST', f'/detect?conf={self.conf}', body=buffer.getvalue(),
+                                headers={'Content-Type': NPY_CONTENT_TYPE})
+        pred = np.asarray(payload['pred'], dtype=np.float32).reshape(-1, 6)
+        return pred[pred[:, 4] >= self.conf]
+
+    def __call__(self, imgs):
+        imgs = as_image_list(imgs)
+        return Results(imgs, list(self._pool.map(self._detect_one, imgs)), self.names)
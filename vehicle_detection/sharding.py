@@ -0,0 +1,157 @@
+"""Deterministic sharding of detection jobs across processes and machines.
+
+Each image goes to shard ``hash(name) % count``. Assignment depends only on
+the file name, so every node that runs ``detect.py --shard i/N`` over the same
+directory or manifest picks a disjoint slice without any coordination.
+
+A shard appends one JSON line per finished image to
+``<output>/shards/shard-<i>-of-<N>.jsonl``. That file doubles as the
+completion manifest: a restarted shard skips every image already in it. When
+all images of a shard are done it drops a ``.complete`` marker next to it,
+and whichever shard completes last merges all shard files into one output.
+
+    python -m vehicle_detection.sharding output/shards --output detections.parquet
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+import cv2
+
+from vehicle_detection.detections import Detections
+from vehicle_detection.sinks import open_sink
+
+SHARD_DIR = 'shards'
+SHARD_PATTERN = re.compile(r'shard-(\d+)-of-(\d+)\.jsonl$')
+
+
+def parse_shard(spec):
+    """``'i/N'`` -> ``(i, N)`` with 0 <= i < N"""
+    try:
+        index, count = (int(v) for v in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', need 0 <= i < N")
+    return index, count
+
+
+def shard_of(key, count):
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % count
+
+
+def list_inputs(source, formats):
+    """Images of a directory, or the paths listed in a ``.txt`` manifest (relative to the manifest)"""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(p for p in source.iterdir() if p.suffix.lower() in formats)
+    with open(source, 'r') as f:
+        lines = [line.strip() for line in f]
+    return [p if p.is_absolute() else source.parent / p for p in map(Path, filter(None, lines))]
+
+
+def select_shard(paths, index, count):
+    return [p for p in paths if shard_of(p.name, count) == index]
+
+
+def pin_threads(n):
+    """Limit this process to ``n`` compute threads; call before the model is loaded"""
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(n)
+    cv2.setNumThreads(n)
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(n)
+
+
+def shard_path(shard_dir, index, count):
+    width = len(str(count - 1))
+    return Path(shard_dir) / f'shard-{index:0{width}d}-of-{count}.jsonl'
+
+
+def completed_sources(path):
+    """Sources already recorded in a shard file; drops a line left half-written by a crash"""
+    path = Path(path)
+    if not path.exists():
+        return set()
+    with open(path, 'rb') as f:
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    if end < len(data):
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+    return {json.loads(line)['source'] for line in data[:end].splitlines()}
+
+
+def mark_complete(path, images):
+    with open(path.with_suffix('.complete'), 'w') as f:
+        json.dump({'images': images}, f)
+
+
+def shard_files(shard_dir):
+    """Shard files of ``shard_dir`` and the shard count, or ``(files, None)`` if counts are mixed"""
+    files = sorted(p for p in Path(shard_dir).glob('shard-*.jsonl') if SHARD_PATTERN.search(p.name))
+    counts = {int(SHARD_PATTERN.search(p.name).group(2)) for p in files}
+    return files, counts.pop() if len(counts) == 1 else None
+
+
+def all_complete(shard_dir, count):
+    return all(shard_path(shard_dir, i, count).with_suffix('.complete').exists() for i in range(count))
+
+
+def merge_shards(shard_dir, count, output_path, class_names=None):
+    """Merge the ``count`` shard files of a run into one ``.jsonl``/``.csv``/``.parquet`` file, in source order.
+
+    Only ``shard-<i>-of-<count>.jsonl`` files are read, so files left in the
+    directory by a run with another shard count are never mixed in. Missing
+    shard files are skipped. The output is written to a temporary file and
+    renamed, so concurrent merges of the same shards (two nodes finishing
+    together) leave one complete result.
+    """
+    files = [p for p in (shard_path(shard_dir, i, count) for i in range(count)) if p.exists()]
+    records, names = {}, {}
+    for path in files:
+        with open(path, 'r') as f:
+            for line in f:
+                if line.endswith('\n'):
+                    record = json.loads(line)
+                    records[record['source']] = record
+                    names.update((d['class'], d['class_name']) for d in record['detections'] if 'class_name' in d)
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f'.{output_path.stem}.{os.getpid()}.partial{output_path.suffix}')
+    with open_sink(tmp_path, class_names or names) as sink:
+        for source in sorted(records):
+            dets = records[source]['detections']
+            track_ids = [d['track_id'] for d in dets] if dets and 'track_id' in dets[0] else None
+            shape = (records[source]['height'], records[source]['width']) if 'width' in records[source] else None
+            sink.write(source, Detections([d['bbox'] for d in dets], [d['confidence'] for d in dets],
+                                          [d['class'] for d in dets], track_ids), shape=shape)
+    os.replace(tmp_path, output_path)
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('shard_dir', type=str, help='Directory holding shard-*-of-*.jsonl files')
+    parser.add_argument('--output', type=str, required=True, help='Merged file (.jsonl, .csv or .parquet)')
+    parser.add_argument('--force', action='store_true', help='Merge even if some shards are incomplete')
+    args = parser.parse_args()
+
+    files, count = shard_files(args.shard_dir)
+    if count is None:
+        print(f"Error: {args.shard_dir} holds no shard files, or shards of different counts")
+        return 1
+    if not all_complete(args.shard_dir, count) and not args.force:
+        print(f"Error: not all {count} shards are complete (use --force to merge anyway)")
+        return 1
+    images = merge_shards(args.shard_dir, count, args.output)
+    print(f"Merged {images} images from {len(files)} shard files into {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""Streaming sinks for detection results.
+
+A sink receives ``Detections`` per image (or video frame) and appends them to
+a file in buffered chunks, so memory stays flat however many images a job
+processes. Chunks are flushed when ``chunk_size`` detections are buffered or
+``flush_interval`` seconds have passed since the last flush, and on close.
+
+- ``.jsonl``: one JSON object per image, ``{"source", "frame", "width", "height", "detections": [...]}``
+- ``.csv``: one row per detection
+- ``.parquet``: one row per detection, one row group per flushed chunk
+  (needs ``pyarrow``)
+
+Sinks are thread-safe, so they can be written from the encode threads of
+``run_pipeline``. ``read_detections`` loads any of the three formats back.
+"""
+import abc
+import csv
+import json
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from vehicle_detection.detections import Detections
+
+COLUMNS = ['source', 'frame', 'width', 'height', 'class_id', 'class_name', 'confidence', 'x1', 'y1', 'x2', 'y2', 'track_id']
+FORMATS = ('.jsonl', '.csv', '.parquet')
+
+
+class DetectionSink(abc.ABC):
+    """Buffers detections and hands them to ``_write_chunk`` in batches"""
+
+    def __init__(self, path, class_names=None, chunk_size=1000, flush_interval=5.0):
+        self.path = Path(path)
+        self.class_names = class_names
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.images = 0
+        self.detections = 0
+        self._pending = []
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def class_name(self, cls):
+        names = self.class_names
+        if names is None:
+            return str(cls)
+        if isinstance(names, dict):
+            return names.get(cls, str(cls))
+        return names[cls] if 0 <= cls < len(names) else str(cls)
+
+    def write(self, source, detections, frame=-1, shape=None):
+        """Queue the detections of one image; ``frame`` is the video frame index and ``shape`` the image shape, if known"""
+        height, width = shape[:2] if shape is not None else (-1, -1)
+        with self._lock:
+            self._pending.append((str(source), frame, (width, height), detections))
+            self._pending_count += len(detections)
+            self.images += 1
+            self.detections += len(detections)
+            if (self._pending_count >= self.chunk_size or
+                    time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._write_chunk(self._pending)
+        self._pending = []
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._close()
+
+    def columns(self, chunk):
+        """A non-empty chunk as per-detection column arrays"""
+        sources, frames, sizes, detections = zip(*chunk)
+        counts = [len(d) for d in detections]
+        boxes = np.concatenate([d.boxes for d in detections])
+        class_ids = np.concatenate([d.class_ids for d in detections])
+        track_ids = np.concatenate([d.track_ids if d.track_ids is not None else np.full(len(d), -1, dtype=np.int64)
+                                    for d in detections])
+        names = {cls: self.class_name(cls) for cls in np.unique(class_ids).tolist()}
+        return {
+            'source': np.repeat(np.asarray(sources, dtype=object), counts),
+            'frame': np.repeat(np.asarray(frames, dtype=np.int64), counts),
+            'width': np.repeat(np.asarray([w for w, _ in sizes], dtype=np.int64), counts),
+            'height': np.repeat(np.asarray([h for _, h in sizes], dtype=np.int64), counts),
+            'class_id': class_ids,
+            'class_name': np.asarray([names[cls] for cls in class_ids.tolist()], dtype=object),
+            'confidence': np.concatenate([d.confidences for d in detections]),
+            'x1': boxes[:, 0], 'y1': boxes[:, 1], 'x2': boxes[:, 2], 'y2': boxes[:, 3],
+            'track_id': track_ids,
+        }
+
+    @abc.abstractmethod
+    def _write_chunk(self, chunk):
+        """Append one chunk of ``(source, frame, (width, height), detections)`` to the file"""
+
+    def _close(self):
+        pass
+
+
+class JsonlSink(DetectionSink):
+    """``bbox`` values are pixels rounded to ``bbox_decimals`` (as in the CSV), or whole pixels with ``None``"""
+
+    def __init__(self, path, class_names=None, chunk_size=1000, flush_interval=5.0, append=False,
+                 bbox_decimals=4):
+        super().__init__(path, class_names, chunk_size, flush_interval)
+        self.bbox_decimals = bbox_decimals
+        self._file = open(self.path, 'a' if append else 'w')
+
+    def _write_chunk(self, chunk):
+        lines = []
+        for source, frame, (width, height), detections in chunk:
+            dets = detections.to_dicts()
+            boxes = np.round(detections.boxes.astype(np.float64), self.bbox_decimals or 0)
+            boxes = boxes.tolist() if self.bbox_decimals else boxes.astype(np.int64).tolist()
+            for det, bbox in zip(dets, boxes):
+                det['bbox'] = bbox
+            for det in dets:
+                det['class_name'] = self.class_name(det['class'])
+            record = {'source': source, 'detections': dets}
+            if frame >= 0:
+                record['frame'] = frame
+            if width >= 0:
+                record['width'], record['height'] = width, height
+            lines.append(json.dumps(record) + '\n')
+        self._file.writelines(lines)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class CsvSink(DetectionSink):
+    def __init__(self, path, class_names=None, chunk_size=1000, flush_interval=5.0):
+        super().__init__(path, class_names, chunk_size, flush_interval)
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def _write_chunk(self, chunk):
+        cols = self.columns(chunk)
+        for name in ('confidence', 'x1', 'y1', 'x2', 'y2'):
+            cols[name] = np.round(cols[name].astype(np.float64), 4)
+        self._writer.writerows(zip(*(cols[name].tolist() for name in COLUMNS)))
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetSink(DetectionSink):
+    def __init__(self, path, class_names=None, chunk_size=10000, flush_interval=5.0):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing Parquet needs pyarrow: pip install pyarrow")
+        super().__init__(path, class_names, chunk_size, flush_interval)
+        self._pa = pa
+        self._schema = pa.schema([('source', pa.string()), ('frame', pa.int64()), ('width', pa.int32()),
+                                  ('height', pa.int32()), ('class_id', pa.int32()),
+                                  ('class_name', pa.string()), ('confidence', pa.float32()),
+                                  ('x1', pa.float32()), ('y1', pa.float32()), ('x2', pa.float32()),
+                                  ('y2', pa.float32()), ('track_id', pa.int64())])
+        self._writer = pq.ParquetWriter(str(self.path), self._schema)
+
+    def _write_chunk(self, chunk):
+        cols = self.columns(chunk)
+        table = self._pa.Table.from_arrays([self._pa.array(cols[field.name], type=field.type)
+                                            for field in self._schema], schema=self._schema)
+        self._writer.write_table(table)
+
+    def _close(self):
+        self._writer.close()
+
+
+SINKS = {'.jsonl': JsonlSink, '.csv': CsvSink, '.parquet': ParquetSink}
+
+
+def open_sink(path, class_names=None, chunk_size=None, flush_interval=5.0):
+    """Sink for ``path``, chosen by its suffix (``.jsonl``, ``.csv`` or ``.parquet``)"""
+    suffix = Path(path).suffix.lower()
+    if suffix not in SINKS:
+        raise ValueError(f"Unsupported detections file '{path}', expected one of {FORMATS}")
+    kwargs = {'flush_interval': flush_interval}
+    if chunk_size:
+        kwargs['chunk_size'] = chunk_size
+    return SINKS[suffix](path, class_names, **kwargs)
+
+
+def read_detections(path):
+    """``{source: (Detections, (height, width) or None)}`` from a ``.jsonl``, ``.csv`` or ``.parquet`` sink file.
+
+    Video frames are keyed ``<source>#<frame>``. CSV and Parquet only hold
+    images with at least one detection.
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix not in SINKS:
+        raise ValueError(f"Unsupported detections file '{path}', expected one of {FORMATS}")
+    results = {}
+    if suffix == '.jsonl':
+        with open(path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                key = record['source'] if record.get('frame', -1) < 0 else f"{record['source']}#{record['frame']}"
+                dets = record['detections']
+                track_ids = [d['track_id'] for d in dets] if dets and 'track_id' in dets[0] else None
+                detections = Detections([d['bbox'] for d in dets], [d['confidence'] for d in dets],
+                                        [d['class'] for d in dets], track_ids)
+                shape = (record['height'], record['width']) if 'width' in record else None
+                results[key] = (detections, shape)
+        return results
+
+    if suffix == '.csv':
+        with open(path, 'r', newline='') as f:
+            rows = list(csv.reader(f))
+        header, rows = rows[0], rows[1:]
+        cols = {name: [row[i] for row in rows] for i, name in enumerate(header)}
+    else:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet needs pyarrow: pip install pyarrow")
+        cols = pq.read_table(str(path)).to_pydict()
+    sources = np.asarray(cols['source'], dtype=object)
+    frames = np.asarray(cols['frame'], dtype=np.int64)
+    keys = np.asarray([s if f < 0 else f'{s}#{f}' for s, f in zip(sources.tolist(), frames.tolist())], dtype=object)
+    boxes = np.stack([np.asarray(cols[c], dtype=np.float32) for c in ('x1', 'y1', 'x2', 'y2')], axis=1)
+    confidences = np.asarray(cols['confidence'], dtype=np.float32)
+    class_ids = np.asarray(cols['class_id'], dtype=np.int64)
+    track_ids = np.asarray(cols['track_id'], dtype=np.int64)
+    widths = np.asarray(cols.get('width', [-1] * len(keys)), dtype=np.int64)
+    heights = np.asarray(cols.get('height', [-1] * len(keys)), dtype=np.int64)
+    # Rows of one image are contiguous; split at every change of key
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]])) if len(keys) else np.zeros(0, np.int64)
+    for start, end in zip(starts.tolist(), starts[1:].tolist() + [len(keys)]):
+        tracked = track_ids[start:end]
+        detections = Detections(boxes[start:end], confidences[start:end], class_ids[start:end],
+                                tracked if (tracked >= 0).any() else None)
+        shape = (int(heights[start]), int(widths[start])) if widths[start] >= 0 else None
+        results[keys[start]] = (detections, shape)
+    return results
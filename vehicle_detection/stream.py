@@ -0,0 +1,206 @@
+import collections
+import json
+import math
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from vehicle_detection.metrics import span
+
+VID_FORMATS = ['.mp4', '.avi', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.wmv']
+
+
+def is_live_source(source):
+    """Camera indices and network URLs (rtsp://, http://, ...) are live captures"""
+    source = str(source)
+    return source.isdigit() or '://' in source
+
+
+class Frame:
+    __slots__ = ('index', 'image', 'timestamp', 'captured_at')
+
+    def __init__(self, index, image, timestamp, captured_at):
+        self.index = index
+        self.image = image
+        self.timestamp = timestamp
+        self.captured_at = captured_at
+
+
+class FrameReader:
+    """Decodes frames on a background thread into a bounded ring buffer.
+
+    Live sources never block the capture: when the buffer is full the oldest
+    frame is dropped, so the consumer always sees recent frames. Files block
+    instead, and skip ``stride - 1`` frames between decodes (``grab`` without
+    ``retrieve``), which lets the consumer trade frame rate for keeping up.
+    With ``realtime`` a file is paced to its own frame rate, as if it were a
+    camera.
+    """
+
+    def __init__(self, source, buffer_size=8, realtime=False):
+        self.source = source
+        self.live = is_live_source(source)
+        self.capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video source: {source}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.realtime = realtime and not self.live
+        self.stride = 1
+        self.read_frames = 0
+        self.dropped = 0
+        self._buffer = collections.deque()
+        self._buffer_size = buffer_size
+        self._cond = threading.Condition()
+        self._finished = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.capture.release()
+
+    def _run(self):
+        index = -1
+        started = time.perf_counter()
+        try:
+            while not self._stopped:
+                # Skipped frames are grabbed but never converted to images
+                for _ in range(self.stride - 1):
+                    if not self.capture.grab():
+                        return
+                    index += 1
+                    self.dropped += 1
+                ok, image = self.capture.read()
+                if not ok:
+                    return
+                index += 1
+                self.read_frames += 1
+                if self.realtime:
+                    delay = started + index / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                frame = Frame(index, image, timestamp, time.perf_counter())
+                with self._cond:
+                    if self.live:
+                        if len(self._buffer) >= self._buffer_size:
+                            self._buffer.popleft()
+                            self.dropped += 1
+                    else:
+                        while len(self._buffer) >= self._buffer_size and not self._stopped:
+                            self._cond.wait()
+                    self._buffer.append(frame)
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+
+    def read(self, max_age=None):
+        """Next buffered frame, or None once the source is exhausted.
+
+        Frames older than ``max_age`` seconds are discarded as long as a newer
+        one is buffered, which caps the queueing delay behind a slow consumer.
+        """
+        with self._cond:
+            while not self._buffer and not self._finished:
+                self._cond.wait()
+            if not self._buffer:
+                return None
+            if max_age is not None:
+                now = time.perf_counter()
+                while len(self._buffer) > 1 and now - self._buffer[0].captured_at > max_age:
+                    self._buffer.popleft()
+                    self.dropped += 1
+            frame = self._buffer.popleft()
+            self._cond.notify_all()
+            return frame
+
+
+def latency_percentiles(latencies, percentiles=(50, 95, 99)):
+    if not latencies:
+        return {f'p{p}': 0.0 for p in percentiles}
+    values = np.percentile(np.asarray(latencies) * 1000.0, percentiles)
+    return {f'p{p}': float(v) for p, v in zip(percentiles, values)}
+
+
+def run_stream(source, infer, annotate, video_path=None, log_path=None, buffer_size=8,
+               adaptive=True, max_latency=None, max_frames=None, sink=None):
+    """Run ``infer(image) -> Detections`` over a video file or capture source.
+
+    Annotated frames (``annotate(image, detections)``) go to ``video_path`` and
+    one JSON line per processed frame goes to ``log_path``; frames are only
+    annotated when ``video_path`` is set. Detections are also written to
+    ``sink`` (a ``vehicle_detection.sinks`` sink) if given. With ``adaptive``,
+    file sources are played back at their native frame rate and raise their
+    stride whenever per-frame processing is slower than that, so processing
+    keeps pace with real time; buffered frames older than ``max_latency``
+    seconds are dropped. Without it every frame of a file is processed.
+    Returns a summary dict including end-to-end latency percentiles in ms.
+    """
+    reader = FrameReader(source, buffer_size=buffer_size, realtime=adaptive).start()
+    frame_interval = 1.0 / reader.fps
+    writer = None
+    log_file = open(log_path, 'w') if log_path else None
+    latencies = []
+    processed = 0
+    avg_frame_time = None
+    start = time.perf_counter()
+    try:
+        while max_frames is None or processed < max_frames:
+            frame = reader.read(max_latency if adaptive or reader.live else None)
+            if frame is None:
+                break
+            frame_start = time.perf_counter()
+            detections = infer(frame.image)
+            if video_path:
+                image = annotate(frame.image, detections)
+                if writer is None:
+                    h, w = image.shape[:2]
+                    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), reader.fps, (w, h))
+                with span('video_write'):
+                    writer.write(image)
+            now = time.perf_counter()
+            frame_time = now - frame_start
+            avg_frame_time = frame_time if avg_frame_time is None else 0.9 * avg_frame_time + 0.1 * frame_time
+            if adaptive and not reader.live:
+                reader.stride = max(1, math.ceil(avg_frame_time / frame_interval))
+            latency = now - frame.captured_at
+            latencies.append(latency)
+            if log_file:
+                log_file.write(json.dumps({
+                    'frame': frame.index,
+                    'time': round(frame.timestamp, 3),
+                    'latency_ms': round(latency * 1000.0, 2),
+                    'detections': detections.to_dicts(),
+                }) + '\n')
+            if sink is not None:
+                sink.write(source, detections, frame=frame.index, shape=frame.image.shape)
+            processed += 1
+    finally:
+        reader.stop()
+        if writer is not None:
+            writer.release()
+        if log_file:
+            log_file.close()
+    elapsed = time.perf_counter() - start
+    summary = {
+        'processed_frames': processed,
+        'dropped_frames': reader.dropped,
+        'source_fps': reader.fps,
+        'processing_fps': processed / elapsed if elapsed > 0 else 0.0,
+        'final_stride': reader.stride,
+    }
+    summary.update({f'latency_{k}_ms': v for k, v in latency_percentiles(latencies).items()})
+    return summary
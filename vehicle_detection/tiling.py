@@ -0,0 +1,130 @@
+"""Sliced inference for small vehicles in large frames.
+
+A frame is cut into overlapping tiles that are run, together with the full
+frame, as a single batch. Tile detections are shifted back to frame
+coordinates and merged with the full-frame ones by class-aware non-maximum
+merging, so a vehicle split across a tile border comes back as one box.
+
+To keep the extra compute bounded, tiles are scored on a small grayscale copy
+of the frame: flat tiles (sky, road surface) are skipped by a variance test,
+static tiles are skipped when the frame follows the previous call's frame in
+a video, and at most ``max_tiles`` of the highest-scoring tiles are run.
+
+Only boxes that touch an internal tile edge can be halves of a cut vehicle, so
+only pairs involving one of them are fused; other overlaps are resolved by
+plain NMS and neighbouring vehicles are not joined into one box.
+"""
+import cv2
+import numpy as np
+
+from vehicle_detection.boxes import merge_boxes
+from vehicle_detection.detections import Detections
+
+# Pixels from a tile border within which a tile box counts as cut by it
+EDGE_MARGIN = 2
+
+
+def make_tiles(height, width, tile_size=640, overlap=0.2):
+    """``(n, 4)`` xyxy tile windows covering the frame; edge tiles are shifted inwards"""
+    def starts(length):
+        if length <= tile_size:
+            return np.array([0])
+        step = max(1, int(tile_size * (1 - overlap)))
+        positions = np.arange(0, length - tile_size, step)
+        return np.append(positions, length - tile_size)
+
+    ys, xs = starts(height), starts(width)
+    y0, x0 = np.meshgrid(ys, xs, indexing='ij')
+    x0, y0 = x0.ravel(), y0.ravel()
+    return np.stack([x0, y0, np.minimum(x0 + tile_size, width), np.minimum(y0 + tile_size, height)], axis=1)
+
+
+def touches_tile_edge(boxes, tile, height, width, margin=EDGE_MARGIN):
+    """Boolean per frame-coordinate box of ``tile``: within ``margin`` of a tile border inside the frame"""
+    x1, y1, x2, y2 = tile
+    return (((boxes[:, 0] <= x1 + margin) & (x1 > 0)) | ((boxes[:, 1] <= y1 + margin) & (y1 > 0)) |
+            ((boxes[:, 2] >= x2 - margin) & (x2 < width)) | ((boxes[:, 3] >= y2 - margin) & (y2 < height)))
+
+
+def _window_means(integral, windows):
+    """Mean of the image under each window, from its integral image"""
+    x1, y1, x2, y2 = windows.T
+    total = integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+    area = np.maximum((x2 - x1) * (y2 - y1), 1)
+    return total / area
+
+
+class TiledDetector:
+    """Runs a YOLOv5-style model over the full frame plus selected tiles in one call"""
+
+    def __init__(self, model, tile_size=640, overlap=0.2, min_std=6.0, motion_thres=None,
+                 max_tiles=None, merge_thres=0.5, scale=8):
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.min_std = min_std
+        self.motion_thres = motion_thres
+        self.max_tiles = max_tiles
+        self.merge_thres = merge_thres
+        self.scale = scale
+        self._prev_small = None
+        self.tiles_run = 0
+        self.tiles_total = 0
+
+    def select_tiles(self, img, tiles, video=False):
+        """Boolean mask over ``tiles`` of windows worth running; ``video``: ``img`` follows the previous frame"""
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+        h, w = gray.shape[:2]
+        small = cv2.resize(gray, (max(1, w // self.scale), max(1, h // self.scale)),
+                           interpolation=cv2.INTER_AREA).astype(np.float64)
+        windows = np.clip(tiles // self.scale, 0, [small.shape[1], small.shape[0]] * 2)
+
+        mean = _window_means(cv2.integral(small), windows)
+        mean_sq = _window_means(cv2.integral(small * small), windows)
+        std = np.sqrt(np.maximum(mean_sq - mean * mean, 0))
+        score = std.copy()
+        keep = std >= self.min_std
+
+        if self.motion_thres is not None:
+            if video and self._prev_small is not None and self._prev_small.shape == small.shape:
+                motion = _window_means(cv2.integral(np.abs(small - self._prev_small)), windows)
+                keep &= motion >= self.motion_thres
+                score = motion
+            # An unrelated image must not be compared against the next one either
+            self._prev_small = small if video else None
+
+        if self.max_tiles is not None and keep.sum() > self.max_tiles:
+            ranked = np.argsort(-np.where(keep, score, -np.inf), kind='stable')
+            keep = np.zeros_like(keep)
+            keep[ranked[:self.max_tiles]] = True
+        return keep
+
+    def __call__(self, img, conf_thres=0.0, video=False):
+        """Detections of ``img``; pass ``video=True`` for consecutive frames so static tiles can be skipped"""
+        h, w = img.shape[:2]
+        tiles = make_tiles(h, w, self.tile_size, self.overlap)
+        self.tiles_total += len(tiles)
+        # A frame that fits in one tile is already covered by the full-frame pass
+        tiles = tiles[self.select_tiles(img, tiles, video)] if len(tiles) > 1 else tiles[:0]
+        self.tiles_run += len(tiles)
+
+        crops = [img] + [img[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles.tolist()]
+        results = self.model(crops)
+        offsets = np.concatenate([np.zeros((1, 2), dtype=np.int64), tiles[:, :2]])
+
+        parts = [Detections.from_pred(pred) for pred in results.pred]
+        boxes = np.concatenate([d.boxes + np.tile(offset, 2) for d, offset in zip(parts, offsets)])
+        confidences = np.concatenate([d.confidences for d in parts])
+        class_ids = np.concatenate([d.class_ids for d in parts])
+        # Full-frame boxes are never cut by a tile
+        cut = np.concatenate([np.zeros(len(parts[0]), dtype=bool)] +
+                             [touches_tile_edge(d.boxes + np.tile(tile[:2], 2), tile, h, w)
+                              for d, tile in zip(parts[1:], tiles.tolist())])
+        mask = confidences >= conf_thres
+        boxes, confidences, class_ids, cut = boxes[mask], confidences[mask], class_ids[mask], cut[mask]
+        if not len(boxes):
+            return Detections.empty()
+
+        merged, keep = merge_boxes(boxes, confidences, class_ids, self.merge_thres, metric='ios', fuse=True,
+                                   fusable=cut)
+        return Detections(merged, confidences[keep], class_ids[keep])
@@ -0,0 +1,221 @@
+"""Multi-object tracking and line-crossing counts on top of per-frame detections.
+
+Track state lives in parallel NumPy arrays (one row per track) and the Kalman
+predict/update steps run on all tracks at once, so the cost per frame is a few
+array operations plus an association over the IoU matrix.
+"""
+import numpy as np
+
+from vehicle_detection.boxes import cxcywh_to_xyxy, greedy_match, iou_matrix, xyxy_to_cxcywh
+from vehicle_detection.detections import Detections
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Constant-velocity model over (cx, cy, w, h, vcx, vcy, vw, vh)
+_F = np.eye(8, dtype=np.float64)
+_F[:4, 4:] = np.eye(4)
+# Noise scales relative to box size, as in DeepSORT
+_STD_POSITION = 1.0 / 20
+_STD_VELOCITY = 1.0 / 160
+
+
+def _size_scale(state):
+    """Per-track (w, h, w, h) used to scale noise on each coordinate"""
+    w = np.maximum(state[:, 2], 1.0)
+    h = np.maximum(state[:, 3], 1.0)
+    return np.stack([w, h, w, h], axis=1)
+
+
+def hungarian_match(scores, threshold):
+    """Optimal one-to-one assignment maximizing total score (requires scipy)"""
+    if linear_sum_assignment is None:
+        raise ImportError("Hungarian matching requires scipy; use method='greedy' instead")
+    rows, cols = linear_sum_assignment(-scores)
+    keep = scores[rows, cols] >= threshold
+    return rows[keep].astype(np.int64), cols[keep].astype(np.int64)
+
+
+class LineCounter:
+    """Counts each track once when its center crosses the segment ``p1 -> p2``.
+
+    ``counts[class_id, 0]`` holds crossings from the left of the segment to the
+    right (looking from ``p1`` towards ``p2``), ``counts[class_id, 1]`` the
+    opposite direction.
+    """
+
+    def __init__(self, p1, p2, num_classes):
+        self.p1 = np.asarray(p1, dtype=np.float64)
+        self.p2 = np.asarray(p2, dtype=np.float64)
+        self.counts = np.zeros((num_classes, 2), dtype=np.int64)
+
+    def side(self, points):
+        d = self.p2 - self.p1
+        rel = points - self.p1
+        return np.sign(d[0] * rel[:, 1] - d[1] * rel[:, 0])
+
+    def crossings(self, prev, curr):
+        """Boolean mask and direction of segments ``prev -> curr`` that cross the line"""
+        prev_side = self.side(prev)
+        curr_side = self.side(curr)
+        crossed = (prev_side != 0) & (curr_side != 0) & (prev_side != curr_side)
+        # The crossing point must fall within the counting segment itself
+        d = self.p2 - self.p1
+        move = curr - prev
+        denom = move[:, 0] * d[1] - move[:, 1] * d[0]
+        safe = np.where(denom == 0, 1.0, denom)
+        rel = self.p1 - prev
+        u = (rel[:, 0] * move[:, 1] - rel[:, 1] * move[:, 0]) / safe
+        crossed &= (denom != 0) & (u >= 0) & (u <= 1)
+        direction = (curr_side < 0).astype(np.int64)
+        return crossed, direction
+
+    def total(self):
+        return self.counts.sum(axis=1)
+
+
+class Tracker:
+    """IoU + Kalman tracker with array-backed track storage.
+
+    Detections are associated to predicted track boxes of the same class by IoU
+    (greedy by default, Hungarian with ``method='hungarian'`` when scipy is
+    available). Tracks are reported once they have ``min_hits`` matches and
+    dropped after ``max_age`` frames without one.
+    """
+
+    def __init__(self, iou_thres=0.3, max_age=30, min_hits=3, new_track_thres=0.0,
+                 method='greedy', line=None, num_classes=2):
+        if method not in ('greedy', 'hungarian'):
+            raise ValueError(f"Unknown matching method: {method}")
+        self.iou_thres = iou_thres
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.new_track_thres = new_track_thres
+        self.method = method
+        self.counter = LineCounter(line[0], line[1], num_classes) if line is not None else None
+        self.frame = 0
+        self._next_id = 1
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.class_ids = np.zeros(0, dtype=np.int64)
+        self.confidences = np.zeros(0, dtype=np.float32)
+        self.state = np.zeros((0, 8), dtype=np.float64)
+        self.covariance = np.zeros((0, 8, 8), dtype=np.float64)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.counted = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def boxes(self):
+        return cxcywh_to_xyxy(self.state[:, :4])
+
+    def _predict(self):
+        if not len(self):
+            return
+        self.state = self.state @ _F.T
+        scale = _size_scale(self.state)
+        noise = np.concatenate([(_STD_POSITION * scale) ** 2, (_STD_VELOCITY * scale) ** 2], axis=1)
+        self.covariance = _F @ self.covariance @ _F.T
+        diag = np.arange(8)
+        self.covariance[:, diag, diag] += noise
+
+    def _correct(self, index, measurements):
+        state = self.state[index]
+        cov = self.covariance[index]
+        meas_noise = (_STD_POSITION * _size_scale(state)) ** 2
+        innovation_cov = cov[:, :4, :4].copy()
+        diag = np.arange(4)
+        innovation_cov[:, diag, diag] += meas_noise
+        # K = P H^T S^-1, solved per track without forming the inverse
+        gain = np.linalg.solve(innovation_cov, cov[:, :4, :]).transpose(0, 2, 1)
+        residual = measurements - state[:, :4]
+        self.state[index] = state + (gain @ residual[:, :, None])[:, :, 0]
+        self.covariance[index] = cov - gain @ cov[:, :4, :]
+
+    def _spawn(self, measurements, class_ids, confidences):
+        n = len(measurements)
+        if not n:
+            return
+        state = np.zeros((n, 8), dtype=np.float64)
+        state[:, :4] = measurements
+        scale = _size_scale(state)
+        variance = np.concatenate([(2 * _STD_POSITION * scale) ** 2, (10 * _STD_VELOCITY * scale) ** 2], axis=1)
+        covariance = np.zeros((n, 8, 8), dtype=np.float64)
+        diag = np.arange(8)
+        covariance[:, diag, diag] = variance
+        self.ids = np.concatenate([self.ids, np.arange(self._next_id, self._next_id + n)])
+        self._next_id += n
+        self.class_ids = np.concatenate([self.class_ids, class_ids])
+        self.confidences = np.concatenate([self.confidences, confidences])
+        self.state = np.concatenate([self.state, state])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.hits = np.concatenate([self.hits, np.ones(n, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(n, dtype=np.int64)])
+        self.counted = np.concatenate([self.counted, np.zeros(n, dtype=bool)])
+
+    def _keep(self, mask):
+        for name in ('ids', 'class_ids', 'confidences', 'state', 'covariance', 'hits', 'misses', 'counted'):
+            setattr(self, name, getattr(self, name)[mask])
+
+    def _associate(self, det_boxes, det_classes):
+        """Match tracks to detections of the same class; IoU is only computed within a class"""
+        match = hungarian_match if self.method == 'hungarian' else greedy_match
+        track_boxes = self.boxes
+        all_rows, all_cols = [], []
+        for cls in np.intersect1d(self.class_ids, det_classes):
+            track_idx = np.flatnonzero(self.class_ids == cls)
+            det_idx = np.flatnonzero(det_classes == cls)
+            rows, cols = match(iou_matrix(track_boxes[track_idx], det_boxes[det_idx]), self.iou_thres)
+            all_rows.append(track_idx[rows])
+            all_cols.append(det_idx[cols])
+        if not all_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(all_rows), np.concatenate(all_cols)
+
+    def update(self, detections):
+        """Advance one frame and return the confirmed tracks matched in it.
+
+        The result is a ``Detections`` holding the filtered boxes with
+        ``track_ids`` set.
+        """
+        self.frame += 1
+        prev_centers = self.state[:, :2].copy()
+        self._predict()
+
+        det_boxes = detections.boxes
+        det_meas = xyxy_to_cxcywh(det_boxes).astype(np.float64)
+        if len(self) and len(detections):
+            rows, cols = self._associate(det_boxes, detections.class_ids)
+        else:
+            rows = cols = np.zeros(0, dtype=np.int64)
+
+        if len(rows):
+            self._correct(rows, det_meas[cols])
+            self.confidences[rows] = detections.confidences[cols]
+        matched = np.zeros(len(self), dtype=bool)
+        matched[rows] = True
+        self.hits[matched] += 1
+        self.misses[matched] = 0
+        self.misses[~matched] += 1
+
+        if self.counter is not None and len(self):
+            crossed, direction = self.counter.crossings(prev_centers, self.state[:, :2])
+            crossed &= ~self.counted & (self.hits >= self.min_hits)
+            crossed &= self.class_ids < len(self.counter.counts)
+            np.add.at(self.counter.counts, (self.class_ids[crossed], direction[crossed]), 1)
+            self.counted |= crossed
+
+        confirmed = matched & (self.hits >= self.min_hits)
+        result = Detections(self.boxes[confirmed], self.confidences[confirmed],
+                            self.class_ids[confirmed], self.ids[confirmed])
+
+        self._keep(self.misses <= self.max_age)
+        new = np.ones(len(detections), dtype=bool)
+        new[cols] = False
+        new &= detections.confidences >= self.new_track_thres
+        self._spawn(det_meas[new], detections.class_ids[new], detections.confidences[new])
+        return result